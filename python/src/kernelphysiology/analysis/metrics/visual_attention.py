@@ -6,9 +6,11 @@ import numpy as np
 from numpy import random
 from functools import partial
 
-from skimage import exposure
-from skimage.transform import resize
-from skimage import img_as_float
+from kernelphysiology.utils.lazy_imports import lazy_import, lazy_from
+
+exposure = lazy_import('skimage.exposure')
+resize = lazy_from('skimage.transform', 'resize')
+img_as_float = lazy_from('skimage', 'img_as_float')
 
 
 def normalize(x, method='standard', axis=None):
@@ -124,33 +126,7 @@ def AUC_Judd(saliency_map, fixation_map, jitter=True):
     if saliency_map.shape != fixation_map.shape:
         saliency_map = resize(saliency_map, fixation_map.shape, order=3,
                               mode='nearest')
-    # Jitter the saliency map slightly to disrupt ties of the same saliency value
-    if jitter:
-        saliency_map += random.rand(*saliency_map.shape) * 1e-7
-    # Normalize saliency map to have values between [0,1]
-    saliency_map = normalize(saliency_map, method='range')
-
-    S = saliency_map.ravel()
-    F = fixation_map.ravel()
-    S_fix = S[F]  # Saliency map values at fixation locations
-    n_fix = len(S_fix)
-    n_pixels = len(S)
-    # Calculate AUC
-    thresholds = sorted(S_fix, reverse=True)
-    tp = np.zeros(len(thresholds) + 2)
-    fp = np.zeros(len(thresholds) + 2)
-    tp[0] = 0
-    tp[-1] = 1
-    fp[0] = 0
-    fp[-1] = 1
-    for k, thresh in enumerate(thresholds):
-        above_th = np.sum(
-            S >= thresh)  # Total number of saliency map values above threshold
-        tp[k + 1] = (k + 1) / float(
-            n_fix)  # Ratio saliency map values at fixation locations above threshold
-        fp[k + 1] = (above_th - k - 1) / float(
-            n_pixels - n_fix)  # Ratio other saliency map values above threshold
-    return np.trapz(tp, fp)  # y, x
+    return AUC_Judd_batch(saliency_map[None], fixation_map[None], jitter)[0]
 
 
 def AUC_Borji(saliency_map, fixation_map, n_rep=100, step_size=0.1,
@@ -197,8 +173,7 @@ def AUC_Borji(saliency_map, fixation_map, n_rep=100, step_size=0.1,
 
     S = saliency_map.ravel()
     F = fixation_map.ravel()
-    S_fix = S[F]  # Saliency map values at fixation locations
-    n_fix = len(S_fix)
+    n_fix = np.sum(F)
     n_pixels = len(S)
     # For each fixation, sample n_rep values from anywhere on the saliency map
     if rand_sampler is None:
@@ -207,22 +182,8 @@ def AUC_Borji(saliency_map, fixation_map, n_rep=100, step_size=0.1,
             r]  # Saliency map values at random locations (including fixated locations!? underestimated)
     else:
         S_rand = rand_sampler(S, F, n_rep, n_fix)
-    # Calculate AUC per random split (set of random locations)
-    auc = np.zeros(n_rep) * np.nan
-    for rep in range(n_rep):
-        thresholds = np.r_[0:np.max(np.r_[S_fix, S_rand[:, rep]]):step_size][
-                     ::-1]
-        tp = np.zeros(len(thresholds) + 2)
-        fp = np.zeros(len(thresholds) + 2)
-        tp[0] = 0
-        tp[-1] = 1
-        fp[0] = 0
-        fp[-1] = 1
-        for k, thresh in enumerate(thresholds):
-            tp[k + 1] = np.sum(S_fix >= thresh) / float(n_fix)
-            fp[k + 1] = np.sum(S_rand[:, rep] >= thresh) / float(n_fix)
-        auc[rep] = np.trapz(tp, fp)
-    return np.mean(auc)  # Average across random splits
+    rand_ids = np.zeros(S_rand.shape[0], dtype=int)
+    return _auc_borji(S[None], F[None], S_rand, rand_ids, step_size)[0]
 
 
 def AUC_shuffled(saliency_map, fixation_map, other_map, n_rep=100,
@@ -350,6 +311,179 @@ def SIM(saliency_map1, saliency_map2):
     return np.sum(intersection)
 
 
+def _batch_maps(saliency_maps, fixation_maps):
+    """(N, H, W) saliency and fixation maps as (N, H * W) arrays."""
+    s_maps = np.asarray(saliency_maps, dtype=np.float64)
+    f_maps = np.asarray(fixation_maps)
+    if s_maps.shape != f_maps.shape:
+        raise ValueError('saliency_maps.shape != fixation_maps.shape')
+    num_maps = s_maps.shape[0]
+    return s_maps.reshape(num_maps, -1), f_maps.reshape(num_maps, -1)
+
+
+def _normalize_batch(maps, method):
+    """normalize of every row of maps, with method 'standard' or 'range'."""
+    if method == 'standard':
+        return (maps - maps.mean(axis=1, keepdims=True)) / maps.std(
+            axis=1, keepdims=True)
+    mins = maps.min(axis=1, keepdims=True)
+    return (maps - mins) / (maps.max(axis=1, keepdims=True) - mins)
+
+
+def AUC_Judd_batch(saliency_maps, fixation_maps, jitter=True):
+    """
+    AUC_Judd of N saliency maps and their fixation maps of the same shape
+    (N, H, W), with one searchsorted of the pixels into the sorted fixations
+    instead of one pass over the map per fixation. Maps without fixations
+    are NaN.
+    """
+    s_maps, f_maps = _batch_maps(saliency_maps, fixation_maps)
+    f_maps = f_maps > 0.5
+    if jitter:
+        s_maps = s_maps + random.rand(*s_maps.shape) * 1e-7
+    s_maps = _normalize_batch(s_maps, 'range')
+    num_pixels = s_maps.shape[1]
+    n_fix = f_maps.sum(axis=1)
+    # at the k-th highest fixation tp=(k+1)/n_fix and fp=(above[k]-k-1)/n_other
+    # with above[k] the number of pixels >= it. The trapezoids of the ROC sum
+    # up to 1 - mean(fp) + fp[-1] / (2 * n_fix), so only the sum and the last
+    # of above are needed: every pixel adds the number of fixations <= it.
+    sum_above = np.zeros(len(s_maps))
+    last_above = np.zeros(len(s_maps))
+    for i in np.nonzero(n_fix)[0]:
+        s_fix = np.sort(s_maps[i, f_maps[i]])
+        sum_above[i] = np.searchsorted(s_fix, s_maps[i], side='right').sum()
+        last_above[i] = np.count_nonzero(s_maps[i] >= s_fix[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_other = num_pixels - n_fix
+        sum_fp = (sum_above - n_fix * (n_fix + 1) / 2) / n_other
+        last_fp = (last_above - n_fix) / n_other
+        auc = 1 - sum_fp / n_fix + last_fp / (2 * n_fix)
+    auc[n_fix == 0] = np.nan
+    return auc
+
+
+def _auc_borji(s_maps, f_maps, s_rand, rand_ids, step_size):
+    """
+    AUC_Borji of normalised (N, P) saliency maps, with n_rep random values
+    s_rand (R, n_rep) sampled from the maps rand_ids (R). The number of
+    values above all thresholds are counted with one bincount.
+    """
+    num_maps = s_maps.shape[0]
+    n_rep = s_rand.shape[1]
+    thresholds = np.arange(0, 1, step_size)
+    num_thresholds = len(thresholds)
+
+    def num_above(values, keys, num_keys):
+        passed = np.searchsorted(thresholds, values, side='right')
+        hist = np.bincount(
+            (keys * (num_thresholds + 1) + passed).ravel(),
+            minlength=num_keys * (num_thresholds + 1)
+        ).reshape(num_keys, num_thresholds + 1)
+        return np.cumsum(hist[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+    fix_ids, fix_pixels = np.nonzero(f_maps)
+    s_fix = s_maps[fix_ids, fix_pixels]
+    n_fix = np.bincount(fix_ids, minlength=num_maps)
+    tp = num_above(s_fix, fix_ids, num_maps)[:, None]
+    rand_keys = rand_ids[:, None] * n_rep + np.arange(n_rep)
+    fp = num_above(s_rand, rand_keys, num_maps * n_rep).reshape(
+        num_maps, n_rep, num_thresholds
+    )
+
+    # the thresholds of every split run up to its maximum saliency
+    max_fix = np.zeros(num_maps)
+    np.maximum.at(max_fix, fix_ids, s_fix)
+    max_rand = np.zeros((num_maps, n_rep))
+    np.maximum.at(max_rand, rand_ids, s_rand)
+    num_valid = np.ceil(np.maximum(max_fix[:, None], max_rand) / step_size)
+    valid = np.arange(num_thresholds) < num_valid[:, :, None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tp = np.where(valid, tp, 0) / n_fix[:, None, None]
+        fp = np.where(valid, fp, 0) / n_fix[:, None, None]
+    zeros = np.zeros((num_maps, n_rep, 1))
+    ones = np.ones((num_maps, n_rep, 1))
+    tp = np.concatenate([zeros, tp[:, :, ::-1], ones], axis=2)
+    fp = np.concatenate([zeros, fp[:, :, ::-1], ones], axis=2)
+    # the trapezoidal rule along the ROC curves
+    auc = ((fp[:, :, 1:] - fp[:, :, :-1]) * (tp[:, :, 1:] + tp[:, :, :-1]))
+    auc = auc.sum(axis=2).mean(axis=1) / 2
+    auc[n_fix == 0] = np.nan
+    return auc
+
+
+def AUC_Borji_batch(saliency_maps, fixation_maps, n_rep=100, step_size=0.1):
+    """
+    AUC_Borji of N saliency maps and their fixation maps of the same shape
+    (N, H, W), all splits of all maps evaluated at once. Maps without
+    fixations are NaN.
+    """
+    s_maps, f_maps = _batch_maps(saliency_maps, fixation_maps)
+    f_maps = f_maps > 0.5
+    s_maps = _normalize_batch(s_maps, 'range')
+    fix_ids = np.nonzero(f_maps)[0]
+    r = random.randint(0, s_maps.shape[1], [len(fix_ids), n_rep])
+    s_rand = s_maps[fix_ids[:, None], r]
+    return _auc_borji(s_maps, f_maps, s_rand, fix_ids, step_size)
+
+
+def AUC_shuffled_batch(saliency_maps, fixation_maps, other_maps, n_rep=100,
+                       step_size=0.1):
+    """
+    AUC_shuffled of N saliency maps, their fixation maps and other maps
+    of the same shape (N, H, W). Maps without fixations are NaN.
+    """
+    s_maps, f_maps = _batch_maps(saliency_maps, fixation_maps)
+    _, other_maps = _batch_maps(saliency_maps, other_maps)
+    f_maps = f_maps > 0.5
+    other_maps = other_maps > 0.5
+    s_maps = _normalize_batch(s_maps, 'range')
+    n_fix = f_maps.sum(axis=1)
+    s_rand = []
+    rand_ids = []
+    for i in np.nonzero(n_fix)[0]:
+        # n_rep random subsets of the fixated locations of the other map
+        fixated = np.nonzero(other_maps[i])[0]
+        keys = random.rand(n_rep, len(fixated))
+        r = fixated[np.argsort(keys, axis=1)[:, :n_fix[i]]].T
+        s_rand.append(s_maps[i, r])
+        rand_ids.append(np.full(r.shape[0], i))
+    if len(s_rand) == 0:
+        return np.full(s_maps.shape[0], np.nan)
+    s_rand = np.concatenate(s_rand, axis=0)
+    rand_ids = np.concatenate(rand_ids)
+    return _auc_borji(s_maps, f_maps, s_rand, rand_ids, step_size)
+
+
+def NSS_batch(saliency_maps, fixation_maps):
+    """NSS of N saliency maps and their fixation maps of the same shape."""
+    s_maps, f_maps = _batch_maps(saliency_maps, fixation_maps)
+    f_maps = f_maps > 0.5
+    s_maps = _normalize_batch(s_maps, 'standard')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (s_maps * f_maps).sum(axis=1) / f_maps.sum(axis=1)
+
+
+def CC_batch(saliency_maps1, saliency_maps2):
+    """CC of N pairs of saliency maps of the same shape."""
+    maps1, maps2 = _batch_maps(saliency_maps1, saliency_maps2)
+    maps1 = _normalize_batch(maps1, 'standard')
+    maps2 = _normalize_batch(maps2.astype(np.float64), 'standard')
+    # the Pearson correlation of standardised maps is their mean product
+    return (maps1 * maps2).mean(axis=1)
+
+
+def SIM_batch(saliency_maps1, saliency_maps2):
+    """SIM of N pairs of saliency maps of the same shape."""
+    maps1, maps2 = _batch_maps(saliency_maps1, saliency_maps2)
+    maps1 = _normalize_batch(maps1, 'range')
+    maps2 = _normalize_batch(maps2.astype(np.float64), 'range')
+    maps1 = maps1 / maps1.sum(axis=1, keepdims=True)
+    maps2 = maps2 / maps2.sum(axis=1, keepdims=True)
+    return np.minimum(maps1, maps2).sum(axis=1)
+
+
 # def EMD(saliency_map1, saliency_map2, sub_sample=1 / 32.0):
 #     '''
 #     Earth Mover's Distance measures the distance between two probability distributions
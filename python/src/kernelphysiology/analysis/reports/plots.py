@@ -4,7 +4,10 @@ TODO: should think of how to organise it.
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
+
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
 
 
 def plot_results(networks, original_networks, experiment_name, category_name,
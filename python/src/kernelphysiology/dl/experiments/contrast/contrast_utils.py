@@ -1,3 +1,5 @@
+import os
+import sys
 import numpy as np
 from scipy import stats
 
@@ -8,6 +10,7 @@ from torchvision.models import resnet as presnet
 from kernelphysiology.dl.pytorch.models import resnet as cresnet
 from kernelphysiology.dl.pytorch import models as custom_models
 from kernelphysiology.dl.pytorch.models import pretrained_features
+from kernelphysiology.dl.pytorch.models import prefix_cache
 
 
 class AFCModel(nn.Module):
@@ -90,6 +93,38 @@ class FaceModel(nn.Module):
         self.backbone = model.features
 
 
+def prefix_cached_loaders(model, train_loader, val_loader, args, *key_items):
+    """
+    Freezes model.features and returns loaders over its cached outputs, so
+    only the read-out is computed during training and validation.
+    """
+    if args.distributed or args.dataset == 'natural':
+        sys.exit('Prefix caching is not supported for this configuration.')
+    if not hasattr(prefix_cache._unwrap(model), 'features'):
+        sys.exit('Prefix caching requires a model with features.')
+    # without transfer_weights the features are trained too
+    if args.transfer_weights is None:
+        sys.exit('Prefix caching requires the transfer_weights of a prefix.')
+    key = prefix_cache.prefix_key(
+        args.network_name, args.transfer_weights, args.dataset, args.data_dir,
+        args.colour_space, args.vision_type, args.cache_pooling,
+        args.train_samples, args.val_samples, *key_items
+    )
+    prefix = prefix_cache.skip_prefix(model)
+    train_loader = prefix_cache.prefix_loader(
+        prefix, train_loader,
+        os.path.join(args.prefix_cache, '%s_train.npy' % key),
+        num_samples=args.train_samples, pooling=args.cache_pooling,
+        shuffle=True
+    )
+    val_loader = prefix_cache.prefix_loader(
+        prefix, val_loader,
+        os.path.join(args.prefix_cache, '%s_val.npy' % key),
+        num_samples=args.val_samples, pooling=args.cache_pooling
+    )
+    return train_loader, val_loader
+
+
 def _voc_ap(rec, prec, use_07_metric=False):
     """ ap = voc_ap(rec, prec, [use_07_metric])
     Compute VOC AP given precision and recall.
@@ -4,16 +4,20 @@ import sys
 
 import torch
 
-from skimage import io
-
 from kernelphysiology.dl.pytorch.models import model_utils
 from kernelphysiology.dl.pytorch.utils import cv2_preprocessing
 from kernelphysiology.dl.pytorch.utils.preprocessing import inv_normalise_tensor
+from kernelphysiology.dl.pytorch.utils import inference
+from kernelphysiology.dl.utils import argument_groups
 from kernelphysiology.utils import imutils
 
 from kernelphysiology.dl.experiments.contrast import dataloader
 from kernelphysiology.dl.experiments.contrast import pretrained_models
 from kernelphysiology.utils import path_utils
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+# only needed to visualise the stimuli
+io = lazy_import('skimage.io')
 
 
 def parse_arguments(args):
@@ -45,6 +49,7 @@ def parse_arguments(args):
     model_parser.add_argument('--grey_width', default=40, choices=[0, 40],
                               type=int)
     model_parser.add_argument('--activation_layer', type=str)
+    argument_groups.get_inference_group(parser)
     return parser.parse_args(args)
 
 
@@ -54,7 +59,7 @@ def run_gratings(db_loader, model, out_file, update=False, mean_std=None):
         all_results = []
         num_batches = db_loader.__len__()
         for i, (test_img, targets, item_settings) in enumerate(db_loader):
-            test_img = test_img.cuda()
+            test_img = model.to_device(test_img)
 
             out = model(test_img)
             preds = out.cpu().numpy()
@@ -195,8 +200,7 @@ def main(args):
         model = model.eval()
     else:
         model, _ = model_utils.which_network_classification(args.model_path, 2)
-    model.eval()
-    model.cuda()
+    model = inference.InferenceRunner.from_args(model, args)
 
     mean_std = None
     if args.visualise:
@@ -1,19 +1,24 @@
 import numpy as np
 import argparse
+import os
 import sys
 
 import torch
 
-from skimage import io
-
 from kernelphysiology.dl.pytorch.models import model_utils
 from kernelphysiology.dl.experiments.contrast import dataloader
 from kernelphysiology.dl.pytorch.utils import cv2_preprocessing
 from kernelphysiology.utils import imutils
 from kernelphysiology.dl.pytorch.utils.preprocessing import inv_normalise_tensor
+from kernelphysiology.dl.pytorch.utils import inference
+from kernelphysiology.dl.utils import argument_groups
 
 from kernelphysiology.dl.experiments.contrast import pretrained_models
 from kernelphysiology.dl.experiments.contrast import models_csf
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+# only needed to visualise the stimuli
+io = lazy_import('skimage.io')
 
 
 def parse_arguments(args):
@@ -48,17 +53,45 @@ def parse_arguments(args):
     model_parser.add_argument('--avg_illuminant', default=0, type=float)
     model_parser.add_argument('--side_by_side', action='store_true',
                               default=False)
+    model_parser.add_argument(
+        '--local_contrast', nargs='+', type=int, default=None,
+        help='Window sizes of the local RMS contrast of the stimuli, '
+             'saved to out_file_local_contrast.csv (default: None)'
+    )
+    argument_groups.get_inference_group(parser)
     return parser.parse_args(args)
 
 
+def stimuli_local_contrast(imgs, mean_std, window_sizes):
+    """The mean local RMS contrast of every stimulus for every window size."""
+    imgs = inv_normalise_tensor(imgs, mean_std[0], mean_std[1])
+    contrast = imutils.local_contrast(imgs, window_sizes)
+    return contrast.mean(dim=(2, 3, 4)).t().cpu().numpy()
+
+
+def save_local_contrast(out_file, item_settings, contrasts, window_sizes):
+    """Appending the local contrasts of one batch to its csv file."""
+    save_path = out_file + '_local_contrast.csv'
+    header = ''
+    if not os.path.exists(save_path):
+        header = 'Contrast,SpatialFrequency,Theta,Rho,Side,' + ','.join(
+            'Window%d' % size for size in window_sizes
+        )
+    with open(save_path, 'a') as f:
+        np.savetxt(
+            f, np.concatenate([item_settings, contrasts], axis=1),
+            delimiter=',', header=header
+        )
+
+
 def run_gratings(db_loader, model, out_file, update=False, mean_std=None,
-                 old_results=None):
+                 old_results=None, contrast_windows=None, preprocessing=None):
     with torch.no_grad():
         header = 'Contrast,SpatialFrequency,Theta,Rho,Side,Prediction'
         new_results = []
         num_batches = db_loader.__len__()
         for i, (test_img, targets, item_settings) in enumerate(db_loader):
-            test_img = test_img.cuda()
+            test_img = model.to_device(test_img)
 
             out = model(test_img)
             preds = out.cpu().numpy().argmax(axis=1)
@@ -74,6 +107,14 @@ def run_gratings(db_loader, model, out_file, update=False, mean_std=None,
                 img_inv = np.uint8((img_inv.squeeze() * 255))
                 io.imsave(save_path, img_inv)
 
+            if contrast_windows is not None:
+                contrasts = stimuli_local_contrast(
+                    test_img, preprocessing, contrast_windows
+                )
+                save_local_contrast(
+                    out_file, item_settings, contrasts, contrast_windows
+                )
+
             for j in range(len(preds)):
                 current_settings = item_settings[j]
                 params = [*current_settings, preds[j] == targets[j]]
@@ -95,14 +136,15 @@ def run_gratings(db_loader, model, out_file, update=False, mean_std=None,
 
 
 def run_gratings_separate(db_loader, model, out_file, update=False,
-                          mean_std=None, old_results=None):
+                          mean_std=None, old_results=None,
+                          contrast_windows=None, preprocessing=None):
     with torch.no_grad():
         header = 'Contrast,SpatialFrequency,Theta,Rho,Side,Prediction'
         new_results = []
         num_batches = db_loader.__len__()
         for i, (timg0, timg1, targets, item_settings) in enumerate(db_loader):
-            timg0 = timg0.cuda()
-            timg1 = timg1.cuda()
+            timg0 = model.to_device(timg0)
+            timg1 = model.to_device(timg1)
 
             out = model(timg0, timg1)
             preds = out.cpu().numpy().argmax(axis=1)
@@ -118,6 +160,15 @@ def run_gratings_separate(db_loader, model, out_file, update=False,
                 img_inv = np.uint8((img_inv.squeeze() * 255))
                 io.imsave(save_path, img_inv)
 
+            if contrast_windows is not None:
+                contrasts = stimuli_local_contrast(
+                    torch.cat([timg0, timg1], dim=2), preprocessing,
+                    contrast_windows
+                )
+                save_local_contrast(
+                    out_file, item_settings, contrasts, contrast_windows
+                )
+
             for j in range(len(preds)):
                 current_settings = item_settings[j]
                 params = [*current_settings, preds[j] == targets[j]]
@@ -238,8 +289,7 @@ def main(args):
             )
     else:
         model, _ = model_utils.which_network_classification(args.model_path, 2)
-    model.eval()
-    model.cuda()
+    model = inference.InferenceRunner.from_args(model, args)
 
     mean_std = None
     if args.visualise:
@@ -255,6 +305,11 @@ def main(args):
 
     all_results = None
     csf_flags = [mid_contrast for _ in test_sfs]
+    if args.local_contrast is not None:
+        # the local contrasts of all batches are appended to this file
+        local_contrast_path = args.out_file + '_local_contrast.csv'
+        if os.path.exists(local_contrast_path):
+            os.remove(local_contrast_path)
 
     if args.db == 'gratings':
         for i in range(len(csf_flags)):
@@ -294,12 +349,16 @@ def main(args):
                 if args.side_by_side:
                     new_results, all_results = run_gratings(
                         db_loader, model, args.out_file,
-                        args.print, mean_std=mean_std, old_results=all_results
+                        args.print, mean_std=mean_std, old_results=all_results,
+                        contrast_windows=args.local_contrast,
+                        preprocessing=(mean, std)
                     )
                 else:
                     new_results, all_results = run_gratings_separate(
                         db_loader, model, args.out_file,
-                        args.print, mean_std=mean_std, old_results=all_results
+                        args.print, mean_std=mean_std, old_results=all_results,
+                        contrast_windows=args.local_contrast,
+                        preprocessing=(mean, std)
                     )
                 new_contrast, low, high = sensitivity_sf(
                     new_results, test_sfs[i], varname='all', th=0.75,
@@ -11,6 +11,7 @@ from torchvision import datasets as tdatasets
 import torchvision.transforms as torch_transforms
 
 from kernelphysiology.utils import imutils
+from kernelphysiology.dl.pytorch.datasets import data_loaders
 from kernelphysiology.dl.pytorch.utils import cv2_transforms
 from kernelphysiology.filterfactory import gratings
 from kernelphysiology.transformations import colour_spaces
@@ -235,10 +236,10 @@ class AfcDataset(object):
 
 
 class CelebA(AfcDataset, tdatasets.CelebA):
-    def __init__(self, afc_kwargs, celeba_kwargs):
+    def __init__(self, afc_kwargs, celeba_kwargs, loader=None):
         AfcDataset.__init__(self, **afc_kwargs)
         tdatasets.CelebA.__init__(self, **celeba_kwargs)
-        self.loader = cv2_loader
+        self.loader = cv2_loader if loader is None else loader
 
     def __getitem__(self, index):
         path = os.path.join(
@@ -280,12 +281,15 @@ class CelebA(AfcDataset, tdatasets.CelebA):
 
 
 class OneFolder(AfcDataset, tdatasets.VisionDataset):
-    def __init__(self, root, afc_kwargs, num_crops=1, max_val=255):
+    def __init__(self, root, afc_kwargs, num_crops=1, max_val=255,
+                 loader=None):
         AfcDataset.__init__(self, **afc_kwargs)
         tdatasets.VisionDataset.__init__(self, root=root)
-        self.samples = path_utils.image_in_folder(self.root)
+        self.samples = path_utils.index_image_folder(
+            self.root, labelled=False
+        ).paths
         print('Read %d images.' % len(self.samples))
-        self.loader = cv2_loader
+        self.loader = cv2_loader if loader is None else loader
         self.max_val = max_val
         self.num_crops = num_crops
 
@@ -316,11 +320,11 @@ class OneFolder(AfcDataset, tdatasets.VisionDataset):
         return len(self.samples)
 
 
-class ImageFolder(AfcDataset, tdatasets.ImageFolder):
-    def __init__(self, afc_kwargs, folder_kwargs):
+class ImageFolder(AfcDataset, data_loaders.IndexedImageFolder):
+    def __init__(self, afc_kwargs, folder_kwargs, loader=None):
         AfcDataset.__init__(self, **afc_kwargs)
-        tdatasets.ImageFolder.__init__(self, **folder_kwargs)
-        self.loader = cv2_loader
+        data_loaders.IndexedImageFolder.__init__(self, **folder_kwargs)
+        self.loader = cv2_loader if loader is None else loader
 
     def __getitem__(self, index):
         current_param = None
@@ -9,9 +9,12 @@ from kernelphysiology.dl.pytorch.models import model_utils
 
 from kernelphysiology.dl.experiments.contrast import pretrained_models
 from kernelphysiology.dl.experiments.contrast import contrast_utils
+from kernelphysiology.dl.experiments.contrast import feature_cache
 from kernelphysiology.utils import path_utils
 from kernelphysiology.dl.pytorch.datasets import image_quality
 from kernelphysiology.dl.pytorch.utils import cv2_transforms
+from kernelphysiology.dl.pytorch.utils import inference
+from kernelphysiology.dl.utils import argument_groups
 
 DISTORTIONS_2AFC = [
     'cnn', 'color', 'deblur', 'frameinterp', 'superres', 'traditional'
@@ -26,7 +29,7 @@ def parse_arguments(args):
     model_parser = parser.add_argument_group('Model Parameters')
     model_parser.add_argument('--model_name', type=str)
     model_parser.add_argument('--model_path', type=str, default=None)
-    model_parser.add_argument('--activation_layer', type=str)
+    model_parser.add_argument('--activation_layer', type=str, nargs='+')
     model_parser.add_argument('--db_dir', type=str)
     model_parser.add_argument('--split', type=str, default='val')
     model_parser.add_argument('--task', type=str, choices=['2afc', 'jnd'])
@@ -40,94 +43,112 @@ def parse_arguments(args):
     model_parser.add_argument('-j', '--workers', type=int, default=4)
     model_parser.add_argument('--print', action='store_true', default=False)
     model_parser.add_argument('--vision_type', type=str, default='trichromat')
+    model_parser.add_argument(
+        '--cache_dir', type=str, default=None,
+        help='Directory of the packed database (default: None)'
+    )
+    model_parser.add_argument(
+        '--cache_features', action='store_true', default=False,
+        help='Caching the activations in cache_dir (default: False)'
+    )
+    argument_groups.get_inference_group(parser)
     return parser.parse_args(args)
 
 
-def run_jnd(db_loader, model, print_val):
-    with torch.no_grad():
-        all_diffs = []
-        all_gts = []
-        num_batches = db_loader.__len__()
-        for i, (img0, img1, gt) in enumerate(db_loader):
-            img0 = img0.cuda()
-            img1 = img1.cuda()
-            gt = gt.squeeze()
-
-            out0 = model(img0)
-            out1 = model(img1)
-
-            # normalise the activations
-            out0 = contrast_utils._normalise_tensor(out0)
-            out1 = contrast_utils._normalise_tensor(out1)
-
-            # compute the difference
-            diffs = (out0 - out1) ** 2
-
-            # collapse the differences
-            diffs = contrast_utils._spatial_average(
-                diffs.sum(dim=1, keepdim=True), keepdim=True
-            ).squeeze(dim=3).squeeze(dim=2).squeeze(dim=1)
-
-            all_diffs.extend(diffs.detach().cpu().numpy())
-            all_gts.extend(gt.detach().numpy())
-
-            num_tests = num_batches * img0.shape[0]
-            test_num = i * img0.shape[0]
-            percent = float(test_num) / float(num_tests)
-            if print_val is not None:
-                print(
-                    '%s %.2f [%d/%d]' % (
-                        print_val, percent, test_num, num_tests
-                    )
-                )
+def _collapse_diffs(out0, out1):
+    # compute the difference
+    diffs = (out0 - out1) ** 2
+
+    # collapse the differences
+    return contrast_utils._spatial_average(
+        diffs.sum(dim=1, keepdim=True), keepdim=True
+    ).squeeze(dim=3).squeeze(dim=2).squeeze(dim=1)
+
+
+def _score_batch(task, feats, gt):
+    if task == '2afc':
+        d0s = _collapse_diffs(feats[0], feats[1])
+        d1s = _collapse_diffs(feats[0], feats[2])
+        return contrast_utils.compute_2afc_score(d0s, d1s, gt)
+    return _collapse_diffs(feats[0], feats[1])
+
+
+def _report(task, all_scores, all_gts):
+    if task == '2afc':
+        return all_scores
+    all_diffs = all_scores
     all_scores = contrast_utils.report_jnd(all_gts, all_diffs)
     return {'diff': all_diffs, 'score': all_scores, 'gt': all_gts}
 
 
-def run_2afc(db_loader, model, print_val):
+def _print_progress(print_val, i, batch_size, num_batches):
+    if print_val is not None:
+        num_tests = num_batches * batch_size
+        test_num = i * batch_size
+        percent = float(test_num) / float(num_tests)
+        print('%s %.2f [%d/%d]' % (print_val, percent, test_num, num_tests))
+
+
+def run_layers(db_loader, model, task, print_val, cache=None, db_key=None):
+    """
+    Scores all layers of a MultiLayerActivation, run by an InferenceRunner,
+    from one pass over the database, the patches of a batch go through the
+    network together.
+    """
+    all_scores = {layer: [] for layer in model.model.active_layers}
+    all_gts = []
+    num_batches = db_loader.__len__()
+    num_samples = len(db_loader.dataset)
+    start = 0
     with torch.no_grad():
-        all_results = []
-        num_batches = db_loader.__len__()
-        for i, (img_ref, img_p0, img_p1, gt) in enumerate(db_loader):
-            img_ref = img_ref.cuda()
-            img_p0 = img_p0.cuda()
-            img_p1 = img_p1.cuda()
-            gt = gt.squeeze().cuda()
-
-            out_ref = model(img_ref)
-            out_p0 = model(img_p0)
-            out_p1 = model(img_p1)
-
-            # normalise the activations
-            out_ref = contrast_utils._normalise_tensor(out_ref)
-            out_p0 = contrast_utils._normalise_tensor(out_p0)
-            out_p1 = contrast_utils._normalise_tensor(out_p1)
-
-            # compute the difference
-            d0s = (out_ref - out_p0) ** 2
-            d1s = (out_ref - out_p1) ** 2
-
-            # collapse the differences
-            d0s = contrast_utils._spatial_average(
-                d0s.sum(dim=1, keepdim=True), keepdim=True
-            ).squeeze(dim=3).squeeze(dim=2).squeeze(dim=1)
-            d1s = contrast_utils._spatial_average(
-                d1s.sum(dim=1, keepdim=True), keepdim=True
-            ).squeeze(dim=3).squeeze(dim=2).squeeze(dim=1)
-
-            scores = contrast_utils.compute_2afc_score(d0s, d1s, gt)
-            all_results.extend(scores.detach().cpu().numpy())
-
-            num_tests = num_batches * img_ref.shape[0]
-            test_num = i * img_ref.shape[0]
-            percent = float(test_num) / float(num_tests)
-            if print_val is not None:
-                print(
-                    '%s %.2f [%d/%d]' % (
-                        print_val, percent, test_num, num_tests
+        for i, batch in enumerate(db_loader):
+            imgs, gt = batch[:-1], batch[-1]
+            # the first column is the judgement for both 2AFC and JND
+            gt = gt.view(gt.shape[0], -1)[:, 0]
+            batch_size = imgs[0].shape[0]
+
+            outs = model(torch.cat(imgs, dim=0))
+            for layer, out in outs.items():
+                # normalise the activations
+                out = contrast_utils._normalise_tensor(out)
+                feats = out.view(len(imgs), batch_size, *out.shape[1:])
+                if cache is not None:
+                    cache.write(
+                        layer, db_key, start,
+                        feats.transpose(0, 1).half().cpu().numpy(),
+                        num_samples
                     )
-                )
-    return all_results
+                scores = _score_batch(task, feats, model.to_device(gt))
+                all_scores[layer].extend(scores.detach().cpu().numpy())
+
+            all_gts.extend(gt.numpy())
+            start += batch_size
+            _print_progress(print_val, i, batch_size, num_batches)
+    if cache is not None:
+        cache.finalise(db_key, all_gts)
+    return {
+        layer: _report(task, scores, all_gts)
+        for layer, scores in all_scores.items()
+    }
+
+
+def score_cached(cache, layer, db_key, task, batch_size, print_val, device):
+    """
+    Scores one layer from the cached activations, without the network.
+    """
+    all_feats = cache.load(layer, db_key)
+    all_gts = cache.load_gts(db_key)
+    all_scores = []
+    num_batches = int(np.ceil(len(all_gts) / batch_size))
+    for i in range(num_batches):
+        inds = slice(i * batch_size, (i + 1) * batch_size)
+        feats = torch.from_numpy(np.array(all_feats[inds]))
+        feats = feats.to(device).float()
+        gt = torch.from_numpy(all_gts[inds]).to(device)
+        scores = _score_batch(task, feats.transpose(0, 1), gt)
+        all_scores.extend(scores.detach().cpu().numpy())
+        _print_progress(print_val, i, batch_size, num_batches)
+    return _report(task, all_scores, list(all_gts))
 
 
 def save_results(eval_results, out_file):
@@ -136,6 +157,14 @@ def save_results(eval_results, out_file):
     return
 
 
+def save_layer_results(eval_results, out_file, layers):
+    if len(layers) == 1:
+        save_results(eval_results[layers[0]], out_file)
+    else:
+        for layer in layers:
+            save_results(eval_results[layer], out_file + '_' + layer)
+
+
 def main(args):
     args = parse_arguments(args)
     if args.model_path is None:
@@ -152,13 +181,12 @@ def main(args):
         args.model_name, transfer_weights
     )
 
-    # selecting the layer
-    model = pretrained_models.LayerActivation(
+    # selecting the layers, all computed in one pass
+    model = pretrained_models.MultiLayerActivation(
         pretrained_models.get_backbones(args.model_name, model),
         args.activation_layer
     )
-    model = model.eval()
-    model.cuda()
+    model = inference.InferenceRunner.from_args(model, args)
 
     mean, std = model_utils.get_preprocessing_function(
         colour_space, 'trichromat'
@@ -171,27 +199,58 @@ def main(args):
     if args.task == '2afc':
         default_dist = DISTORTIONS_2AFC
         db_class = image_quality.BAPPS2afc
-        run_fun = run_2afc
     else:
         default_dist = DISTORTIONS_JND
         db_class = image_quality.BAPPSjnd
-        run_fun = run_jnd
     distortions = default_dist if args.distortion is None else [args.distortion]
 
-    eval_results = dict()
+    cache = None
+    if args.cache_features:
+        if args.cache_dir is None:
+            sys.exit('--cache_features requires --cache_dir.')
+        cache = feature_cache.FeatureCache(
+            args.cache_dir,
+            feature_cache.model_key(args.model_name, args.model_path)
+        )
+
+    eval_results = {layer: dict() for layer in args.activation_layer}
     for dist in distortions:
         print('Starting with %s' % dist)
+        print_val = dist if args.print else None
+        db_key = '%s_%s_%s_%s' % (args.task, args.split, dist, colour_space)
+
+        cached_layers = []
+        if cache is not None:
+            cached_layers = [
+                layer for layer in args.activation_layer
+                if cache.exists(layer, db_key)
+            ]
+        for layer in cached_layers:
+            eval_results[layer][dist] = score_cached(
+                cache, layer, db_key, args.task, args.batch_size, print_val,
+                model.device
+            )
+        if len(cached_layers) == len(args.activation_layer):
+            continue
+
         db = db_class(
             root=args.db_dir, split=args.split, distortion=dist,
-            transform=transform
+            transform=transform, cache_dir=args.cache_dir
         )
         db_loader = torch.utils.data.DataLoader(
             db, batch_size=args.batch_size, shuffle=False,
             num_workers=args.workers, pin_memory=True
         )
-        print_val = dist if args.print else None
-        eval_results[dist] = run_fun(db_loader, model, print_val)
-    save_results(eval_results, args.out_file)
+        model.model.active_layers = [
+            layer for layer in args.activation_layer
+            if layer not in cached_layers
+        ]
+        layer_results = run_layers(
+            db_loader, model, args.task, print_val, cache, db_key
+        )
+        for layer, results in layer_results.items():
+            eval_results[layer][dist] = results
+    save_layer_results(eval_results, args.out_file, args.activation_layer)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+"""
+Caching the normalised activations of image-quality patches on disk.
+"""
+
+import os
+import hashlib
+import numpy as np
+
+
+def model_key(model_name, model_path=None):
+    """
+    Returns an identifier of the network, the checkpoint's path, size and
+    modification time are hashed so retrained checkpoints get a new key.
+    """
+    key = model_name
+    if model_path is not None and os.path.isfile(model_path):
+        stat = os.stat(model_path)
+        key_str = '%s_%d_%d' % (
+            os.path.abspath(model_path), stat.st_size, stat.st_mtime
+        )
+        key = '%s_%s' % (
+            model_name, hashlib.md5(key_str.encode()).hexdigest()[:10]
+        )
+    return key.replace('/', '_')
+
+
+class FeatureCache(object):
+    """
+    Activations keyed by (model, layer) and stored as one float16 array of
+    shape (N, P, C, H, W) for every database, P being the patches per sample.
+    """
+
+    def __init__(self, cache_dir, model_name):
+        self.cache_dir = os.path.join(cache_dir, 'features', model_name)
+        self._writers = dict()
+
+    def _file(self, layer, db_key):
+        return os.path.join(self.cache_dir, layer, db_key + '.npy')
+
+    def _gts_file(self, db_key):
+        return os.path.join(self.cache_dir, db_key + '_gts.npy')
+
+    def exists(self, layer, db_key):
+        return (
+                os.path.exists(self._file(layer, db_key)) and
+                os.path.exists(self._gts_file(db_key))
+        )
+
+    def load(self, layer, db_key):
+        return np.load(self._file(layer, db_key), mmap_mode='r')
+
+    def load_gts(self, db_key):
+        return np.load(self._gts_file(db_key))
+
+    def write(self, layer, db_key, start, features, num_samples):
+        """
+        Writes a batch of features of shape (B, P, C, H, W) at start, the
+        file is created on the first call.
+        """
+        if (layer, db_key) not in self._writers:
+            os.makedirs(
+                os.path.dirname(self._file(layer, db_key)), exist_ok=True
+            )
+            self._writers[(layer, db_key)] = np.lib.format.open_memmap(
+                self._file(layer, db_key) + '.tmp', mode='w+',
+                dtype=np.float16, shape=(num_samples, *features.shape[1:])
+            )
+        writer = self._writers[(layer, db_key)]
+        writer[start:start + features.shape[0]] = features
+
+    def finalise(self, db_key, gts):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(self._gts_file(db_key), np.array(gts))
+        for (layer, key) in list(self._writers.keys()):
+            if key != db_key:
+                continue
+            writer = self._writers.pop((layer, key))
+            writer.flush()
+            del writer
+            os.rename(
+                self._file(layer, db_key) + '.tmp', self._file(layer, db_key)
+            )
@@ -65,14 +65,71 @@ class LayerActivation(nn.Module):
             self.sub_conv = sub_conv
 
     def forward(self, x):
-        x = self.features(x)
+        return self.forward_tail(self.features(x))
+
+    def forward_tail(self, x):
+        y = x
         if self.sub_layer is not None:
-            x = self.sub_layer(x)
+            y = self.sub_layer(y)
         if self.sub_conv is not None:
-            x = self.sub_conv(x)
+            y = self.sub_conv(y)
         if self.relu is not None:
-            x = self.relu(x)
-        return x
+            # the input might be shared with other layers
+            y = torch.relu(y) if y is x else self.relu(y)
+        return y
+
+
+class MultiLayerActivation(nn.Module):
+    """
+    Activations of several layers of one backbone computed in one pass, the
+    shared children of the backbone are executed only once.
+    """
+
+    def __init__(self, model, layer_names, conv_bn_relu='relu'):
+        super(MultiLayerActivation, self).__init__()
+        self.layer_names = layer_names
+        # layers computed in the forward pass
+        self.active_layers = list(layer_names)
+        self.backbone_children = nn.ModuleList(list(model.children()))
+        self.layers = nn.ModuleList([
+            LayerActivation(model, layer_name, conv_bn_relu)
+            for layer_name in layer_names
+        ])
+        self.prefixes = [self._prefix_length(layer) for layer in self.layers]
+
+    def _prefix_length(self, layer):
+        # number of backbone children that the layer's features consist of
+        if not isinstance(layer.features, nn.Sequential):
+            return None
+        features = list(layer.features.children())
+        if len(features) > len(self.backbone_children):
+            return None
+        for feature, child in zip(features, self.backbone_children):
+            if feature is not child:
+                return None
+        return len(features)
+
+    def forward(self, x):
+        outputs = dict()
+        shared = []
+        for i, prefix in enumerate(self.prefixes):
+            if self.layer_names[i] not in self.active_layers:
+                continue
+            elif prefix is None:
+                outputs[self.layer_names[i]] = self.layers[i](x)
+            else:
+                shared.append(i)
+        shared = sorted(shared, key=lambda j: self.prefixes[j])
+
+        depth = 0
+        for i in shared:
+            while depth < self.prefixes[i]:
+                x = self.backbone_children[depth](x)
+                depth += 1
+            y = self.layers[i].forward_tail(x)
+            # later children might modify x in place
+            outputs[self.layer_names[i]] = y.clone() if y is x else y
+        return outputs
 
 
 def _cityscape_features(model, network_name, layer, grey_width):
@@ -31,6 +31,7 @@ from kernelphysiology.dl.utils import prepare_training
 from kernelphysiology.utils.path_utils import create_dir
 
 from kernelphysiology.dl.experiments.contrast import dataloader
+from kernelphysiology.dl.experiments.contrast import contrast_utils
 from kernelphysiology.dl.experiments.contrast import pretrained_models
 
 
@@ -317,6 +318,12 @@ def main_worker(ngpus_per_node, args):
         num_workers=args.workers, pin_memory=True
     )
 
+    if args.prefix_cache is not None:
+        train_loader, val_loader = contrast_utils.prefix_cached_loaders(
+            model, train_loader, val_loader, args, target_size, db_params,
+            args.train_params
+        )
+
     # training on epoch
     for epoch in range(args.initial_epoch, args.epochs):
         if args.distributed:
@@ -496,6 +503,8 @@ def extra_args_fun(parser):
     # specific_group.add_argument('-db', '--db', default=None, type=str)
     specific_group.add_argument('--train_samples', default=10000, type=int)
     specific_group.add_argument('--val_samples', default=1000, type=int)
+    specific_group.add_argument('--prefix_cache', default=None, type=str)
+    specific_group.add_argument('--cache_pooling', default=None, type=int)
     specific_group.add_argument('--random_seed', default=None, type=int)
     specific_group.add_argument('--grey_width', default=40, choices=[0, 40],
                                 type=int)
@@ -213,8 +213,9 @@ def main_worker(ngpus_per_node, args):
             best_acc1 = checkpoint['best_acc1']
             model.load_state_dict(checkpoint['state_dict'])
             if args.gpus is not None:
-                # best_acc1 may be from a checkpoint from a different GPU
-                best_acc1 = best_acc1.to(args.gpus)
+                # best_acc1 is a float, or in older checkpoints a tensor
+                # possibly from a different GPU
+                best_acc1 = torch.as_tensor(best_acc1).to(args.gpus)
                 model = model.cuda(args.gpus)
             optimizer.load_state_dict(checkpoint['optimizer'])
             print(
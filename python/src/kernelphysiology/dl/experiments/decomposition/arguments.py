@@ -81,6 +81,10 @@ def parse_arguments(args):
         '--data_dir', type=str, default=None,
         help='the path to dataset (default: None)'
     )
+    pipe_parser.add_argument(
+        '--cache_dir', type=str, default=None,
+        help='the path to the packed coco targets (default: None)'
+    )
     pipe_parser.add_argument(
         '--epochs', type=int, default=30,
         help='number of training epochs (default: 30)'
@@ -101,6 +105,10 @@ def parse_arguments(args):
         '--seed', type=int, default=1,
         help='random seed (default: 1)'
     )
+    pipe_parser.add_argument(
+        '--prefetch', action='store_true', default=False,
+        help='Copy the next batch to GPU during compute'
+    )
     pipe_parser.add_argument(
         '--pred', type=str, default=None,
         help='Only prediction'
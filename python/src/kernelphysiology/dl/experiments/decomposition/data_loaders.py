@@ -13,25 +13,31 @@ from torchvision import datasets as tdatasets
 
 from panopticapi.utils import rgb2id
 
+from kernelphysiology.dl.pytorch.datasets import data_loaders
 from kernelphysiology.utils import path_utils
 
 
 def _apply_transforms(imgin, imgout, intransform, outtransform, pre_transform,
                       post_transform):
+    # imgin and imgout might be the same image, shared until one is changed
     if pre_transform is not None:
-        imgin, imgout = pre_transform([imgin, imgout])
+        if imgin is imgout:
+            imgin = imgout = pre_transform([imgin])[0]
+        else:
+            imgin, imgout = pre_transform([imgin, imgout])
 
-    if intransform is not None:
-        imgin = intransform(imgin)
+    imgin = data_loaders.apply_copy_on_write(intransform, imgin)
     if outtransform is not None:
-        imgout = outtransform([imgout, imgin.copy()])
+        imgout = data_loaders.apply_copy_on_write(
+            lambda x: outtransform([x, imgin.copy()]), imgout
+        )
 
     if post_transform is not None:
         imgin, imgout = post_transform([imgin, imgout])
     return imgin, imgout
 
 
-class ImageFolder(tdatasets.ImageFolder):
+class ImageFolder(data_loaders.IndexedImageFolder):
     def __init__(self, intransform=None, outtransform=None,
                  pre_transform=None, post_transform=None, **kwargs):
         super(ImageFolder, self).__init__(**kwargs)
@@ -43,9 +49,8 @@ class ImageFolder(tdatasets.ImageFolder):
 
     def __getitem__(self, index):
         path, class_target = self.samples[index]
-        imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
-        imgout = imgin.copy()
+        imgin = np.asarray(self.loader(path))
+        imgout = imgin
         imgin, imgout = _apply_transforms(
             imgin, imgout, self.intransform, self.outtransform,
             self.pre_transform, self.post_transform
@@ -62,7 +67,9 @@ class OneFolder(tdatasets.VisionDataset):
     def __init__(self, intransform=None, outtransform=None,
                  pre_transform=None, post_transform=None, **kwargs):
         super(OneFolder, self).__init__(**kwargs)
-        self.samples = path_utils.image_in_folder(self.root)
+        self.samples = path_utils.index_image_folder(
+            self.root, labelled=False
+        ).paths
         print('Read %d images.' % len(self.samples))
         self.loader = tdatasets.folder.pil_loader
         self.intransform = intransform
@@ -72,9 +79,8 @@ class OneFolder(tdatasets.VisionDataset):
 
     def __getitem__(self, index):
         path = self.samples[index]
-        imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
-        imgout = imgin.copy()
+        imgin = np.asarray(self.loader(path))
+        imgout = imgin
         imgin, imgout = _apply_transforms(
             imgin, imgout, self.intransform, self.outtransform,
             self.pre_transform, self.post_transform
@@ -107,9 +113,8 @@ class CelebA(tdatasets.CelebA):
             self.root, self.base_folder, "img_align_celeba",
             self.filename[index]
         )
-        imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
-        imgout = imgin.copy()
+        imgin = np.asarray(self.loader(path))
+        imgout = imgin
         imgin, imgout = _apply_transforms(
             imgin, imgout, self.intransform, self.outtransform,
             self.pre_transform, self.post_transform
@@ -246,9 +251,74 @@ class VOCSegmentation(tdatasets.VOCSegmentation):
         return len(self.images)
 
 
+COLOUR_CATEGORY_WEIGHTS = [[0.25, 0.75], [0.5, 0.5], [0.5, 0.5]]
+
+
+def colour_category_image(img, pan):
+    """
+    Blends every Lab channel of each panoptic segment with its mean, the
+    means of all segments are computed in one pass with bincount.
+    """
+    colour_cat_img = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
+    colour_cat_img = colour_cat_img.astype('float') / 255
+    _, segments = np.unique(pan, return_inverse=True)
+    segments = segments.ravel()
+    counts = np.bincount(segments)
+    for i in range(3):
+        imgchn = colour_cat_img[:, :, i]
+        means = np.bincount(segments, weights=imgchn.ravel()) / counts
+        weights = COLOUR_CATEGORY_WEIGHTS[i]
+        imgchn *= weights[0]
+        imgchn += means[segments].reshape(imgchn.shape) * weights[1]
+    colour_cat_img = (colour_cat_img * 255).astype('uint8')
+    return cv2.cvtColor(colour_cat_img, cv2.COLOR_LAB2RGB)
+
+
+def _colour_category_files(cache_dir, split):
+    prefix = os.path.join(cache_dir, 'coco_colour_categories_%s' % split)
+    return prefix + '_imgs.npy', prefix + '_index.npy'
+
+
+def pack_colour_categories(root, split, cache_dir):
+    """
+    Packs the colour-category targets of all images of a split into one
+    flat uint8 array, the index holds the offset, rows and cols of every
+    image. Existing packs are reused.
+    """
+    imgs_file, index_file = _colour_category_files(cache_dir, split)
+    if os.path.exists(imgs_file) and os.path.exists(index_file):
+        return imgs_file, index_file
+    path_utils.create_dir(cache_dir)
+
+    db = COCOPanoptic(root=root, split=split)
+    print('Packing COCO %s colour categories into %s' % (split, imgs_file))
+    index = np.zeros((len(db), 3), dtype=np.int64)
+    for i, annotation in enumerate(db.annotations):
+        index[i, 1:] = db.image_sizes[annotation['image_id']]
+    index[1:, 0] = np.cumsum(index[:-1, 1] * index[:-1, 2] * 3)
+    # writing to a temporary file so interrupted packs are never reused
+    tmp_file = imgs_file + '.tmp'
+    imgs = np.lib.format.open_memmap(
+        tmp_file, mode='w+', dtype=np.uint8,
+        shape=(int(np.sum(index[:, 1] * index[:, 2] * 3)),)
+    )
+    for i in range(len(db)):
+        imgin, pan = db.read_images(i)
+        start, rows, cols = index[i]
+        imgs[start:start + rows * cols * 3] = colour_category_image(
+            imgin, pan
+        ).ravel()
+    imgs.flush()
+    del imgs
+    os.rename(tmp_file, imgs_file)
+    np.save(index_file, index)
+    return imgs_file, index_file
+
+
 class COCOPanoptic(tdatasets.VisionDataset):
     def __init__(self, split, intransform=None, outtransform=None,
-                 pre_transform=None, post_transform=None, **kwargs):
+                 pre_transform=None, post_transform=None, cache_dir=None,
+                 **kwargs):
         super(COCOPanoptic, self).__init__(**kwargs)
         json_path = os.path.join(
             self.root, 'panoptic_annotations', 'annotations',
@@ -257,6 +327,9 @@ class COCOPanoptic(tdatasets.VisionDataset):
         with open(json_path, 'r') as f:
             d_coco = json.load(f)
         self.annotations = d_coco['annotations']
+        self.image_sizes = {
+            img['id']: (img['height'], img['width']) for img in d_coco['images']
+        }
         self.imgs_dir = os.path.join(self.root, 'images', '%s2017' % split)
         self.gts_dir = os.path.join(
             self.root, 'panoptic_annotations', 'annotations',
@@ -269,37 +342,38 @@ class COCOPanoptic(tdatasets.VisionDataset):
         self.pre_transform = pre_transform
         self.post_transform = post_transform
 
-    def __getitem__(self, index):
-        current_annotation = self.annotations[index]
-        img_name = current_annotation['file_name']
+        self.packed_imgs = None
+        if cache_dir is not None:
+            imgs_file, index_file = pack_colour_categories(
+                self.root, split, cache_dir
+            )
+            self.packed_imgs = np.load(imgs_file, mmap_mode='r')
+            self.packed_index = np.load(index_file)
+
+    def _paths(self, index):
+        img_name = self.annotations[index]['file_name']
         img_path = os.path.join(self.imgs_dir, img_name.replace('png', 'jpg'))
         gt_path = os.path.join(self.gts_dir, img_name)
+        return img_path, gt_path
 
-        imgin = self.loader(img_path)
-        imgin = np.asarray(imgin).copy()
-        pan_img = self.loader(gt_path)
-        pan_img = np.asarray(pan_img).copy()
-        pan = rgb2id(pan_img)
-        # semantic = np.zeros(pan.shape, dtype=np.uint8)
-        #
-        # for segm_info in current_annotation['segments_info']:
-        #     cat_id = segm_info['category_id']
-        #     mask = pan == segm_info['id']
-        #     semantic[mask] = cat_id
-
-        colour_cat_img = imgin.copy()
-        colour_cat_img = cv2.cvtColor(colour_cat_img, cv2.COLOR_RGB2LAB)
-        colour_cat_img = colour_cat_img.astype('float') / 255
-        weights = [[0.25, 0.75], [0.5, 0.5], [0.5, 0.5]]
-        for unique_id in np.unique(pan):
-            condition = pan == unique_id
-            for i in range(3):
-                imgchn = colour_cat_img[:, :, i]
-                imgchn[condition] = imgchn[condition] * weights[i][0] + np.mean(
-                    imgchn[condition]) * weights[i][1]
-                colour_cat_img[:, :, i] = imgchn
-        colour_cat_img = (colour_cat_img * 255).astype('uint8')
-        imgout = cv2.cvtColor(colour_cat_img, cv2.COLOR_LAB2RGB)
+    def read_images(self, index):
+        """The RGB image and its panoptic segment ids."""
+        img_path, gt_path = self._paths(index)
+        imgin = np.asarray(self.loader(img_path)).copy()
+        pan = rgb2id(np.asarray(self.loader(gt_path)))
+        return imgin, pan
+
+    def __getitem__(self, index):
+        img_path, gt_path = self._paths(index)
+        if self.packed_imgs is None:
+            imgin, pan = self.read_images(index)
+            imgout = colour_category_image(imgin, pan)
+        else:
+            imgin = np.asarray(self.loader(img_path)).copy()
+            start, rows, cols = self.packed_index[index]
+            imgout = np.array(
+                self.packed_imgs[start:start + rows * cols * 3]
+            ).reshape(rows, cols, 3)
 
         imgin, imgout = _apply_transforms(
             imgin, imgout, self.intransform, self.outtransform,
@@ -24,6 +24,7 @@ from kernelphysiology.dl.experiments.decomposition import arguments
 from kernelphysiology.dl.experiments.decomposition import data_loaders
 from kernelphysiology.dl.pytorch.utils import cv2_preprocessing
 from kernelphysiology.dl.pytorch.utils import cv2_transforms
+from kernelphysiology.dl.pytorch.utils import misc as misc_utils
 
 from kernelphysiology.utils import random_imutils
 from kernelphysiology.transformations.colour_spaces import all2rgb
@@ -239,10 +240,12 @@ def main(args):
         )
     elif args.dataset in ['coco']:
         train_dataset = datasets_classes[args.dataset](
-            root=args.data_dir, split='train', **transforms_kwargs
+            root=args.data_dir, split='train', cache_dir=args.cache_dir,
+            **transforms_kwargs
         )
         test_dataset = datasets_classes[args.dataset](
-            root=args.data_dir, split='val', **transforms_kwargs
+            root=args.data_dir, split='val', cache_dir=args.cache_dir,
+            **transforms_kwargs
         )
     elif args.dataset in ['voc']:
         train_dataset = datasets_classes[args.dataset](
@@ -315,8 +318,11 @@ def main(args):
 def train(epoch, model, train_loader, optimizer, save_path, args):
     model.train()
     loss_dict = model.latest_losses()
-    losses = {k + '_train': 0 for k, v in loss_dict.items()}
-    epoch_losses = {k + '_train': 0 for k, v in loss_dict.items()}
+    # losses are summed on the device and only synced when logged
+    losses = misc_utils.LossAccumulator(loss_dict.keys(), '_train')
+    epoch_losses = misc_utils.LossAccumulator(loss_dict.keys(), '_train')
+    if args.prefetch:
+        train_loader = misc_utils.DataPrefetcher(train_loader)
     num_batches = len(train_loader)
     start_time = time.time()
     for bidx, loader_data in enumerate(train_loader):
@@ -333,15 +339,13 @@ def train(epoch, model, train_loader, optimizer, save_path, args):
         loss.backward()
         optimizer.step()
         latest_losses = model.latest_losses()
-        for key in latest_losses:
-            losses[key + '_train'] += float(latest_losses[key])
-            epoch_losses[key + '_train'] += float(latest_losses[key])
+        losses.update(latest_losses)
+        epoch_losses.update(latest_losses)
 
         if bidx % args.log_interval == 0:
-            for key in latest_losses:
-                losses[key + '_train'] /= args.log_interval
             loss_string = ' '.join(
-                ['{}: {:.6f}'.format(k, v) for k, v in losses.items()]
+                ['{}: {:.6f}'.format(k, v) for k, v in
+                 losses.values(args.log_interval).items()]
             )
             logging.info(
                 'Train Epoch: {epoch} [{batch:5d}/{total_batch} '
@@ -353,8 +357,7 @@ def train(epoch, model, train_loader, optimizer, save_path, args):
                 )
             )
             start_time = time.time()
-            for key in latest_losses:
-                losses[key + '_train'] = 0
+            losses.reset()
         if bidx in list(np.linspace(0, num_batches - 1, 4).astype('int')):
             vae_util.grid_save_reconstructions(
                 args.outs_dict, target, outputs[0], args.mean, args.std, epoch,
@@ -376,10 +379,9 @@ def train(epoch, model, train_loader, optimizer, save_path, args):
         if bidx * len(data) > args.train_samples:
             break
 
-    for key in epoch_losses:
-        epoch_losses[key] /= (
-                len(train_loader.dataset) / train_loader.batch_size
-        )
+    epoch_losses = epoch_losses.values(
+        len(train_loader.dataset) / train_loader.batch_size
+    )
     loss_string = '\t'.join(
         ['{}: {:.6f}'.format(k, v) for k, v in epoch_losses.items()]
     )
@@ -206,10 +206,12 @@ def main(args):
         )
     elif args.dataset in ['coco']:
         train_dataset = datasets_classes[args.dataset](
-            root=args.data_dir, split='train', **transforms_kwargs
+            root=args.data_dir, split='train', cache_dir=args.cache_dir,
+            **transforms_kwargs
         )
         test_dataset = datasets_classes[args.dataset](
-            root=args.data_dir, split='val', **transforms_kwargs
+            root=args.data_dir, split='val', cache_dir=args.cache_dir,
+            **transforms_kwargs
         )
     elif args.dataset in ['voc']:
         train_dataset = datasets_classes[args.dataset](
@@ -5,14 +5,15 @@ import logging.config
 from datetime import datetime
 import json
 
-from skimage import io
-
 import torch
 from torchvision.utils import save_image, make_grid
 from torch.nn import functional as F
 
 from kernelphysiology.dl.pytorch.utils.preprocessing import inv_normalise_tensor
 from kernelphysiology.transformations import labels
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+io = lazy_import('skimage.io')
 
 
 def setup_logging_from_args(args):
@@ -14,6 +14,7 @@ from torchvision.utils import save_image, make_grid
 from kernelphysiology.dl.experiments.intrasimilarity import util as ex_util
 from kernelphysiology.dl.experiments.intrasimilarity.model import *
 from kernelphysiology.dl.experiments.intrasimilarity import panoptic_utils
+from kernelphysiology.dl.pytorch.datasets import data_loaders
 from kernelphysiology.dl.pytorch.models import model_utils
 from kernelphysiology.dl.pytorch.utils import misc
 from kernelphysiology.dl.pytorch.utils import preprocessing
@@ -28,8 +29,8 @@ models = {
     'mnist': {'vae': VAE, 'vqvae': VQ_CVAE},
 }
 datasets_classes = {
-    'custom': datasets.ImageFolder,
-    'imagenet': datasets.ImageFolder,
+    'custom': data_loaders.IndexedImageFolder,
+    'imagenet': data_loaders.IndexedImageFolder,
     'coco': torch.utils.data.DataLoader,
     'cifar10': datasets.CIFAR10,
     'mnist': datasets.MNIST
@@ -12,7 +12,7 @@
 # def get_augmented_dataset(dataset_name, traindir, colour_transformations,
 #                           other_transformations, chns_transformation,
 #                           normalize, target_size, original_train,
-#                           target_transform):
+#                           target_transform, seed=None):
 #     # for label augmentation, we don't want to perform crazy cropping
 #     augmented_transformations = prepare_transformations_test(
 #         dataset_name, colour_transformations,
@@ -21,17 +21,18 @@
 #     )
 #     if dataset_name == 'imagenet':
 #         augmented_dataset = label_augmentation.RandomNegativeLabelFolder(
-#             traindir, augmented_transformations, target_transform
+#             traindir, augmented_transformations, target_transform,
+#             seed=seed
 #         )
 #     elif dataset_name == 'cifar10':
 #         augmented_dataset = label_augmentation.RandomNegativeLabelArray(
 #             original_train.data, original_train.targets,
-#             augmented_transformations, target_transform
+#             augmented_transformations, target_transform, seed=seed
 #         )
 #     elif dataset_name == 'cifar100':
 #         augmented_dataset = label_augmentation.RandomNegativeLabelArray(
 #             original_train.data, original_train.targets,
-#             augmented_transformations, target_transform
+#             augmented_transformations, target_transform, seed=seed
 #         )
 #     else:
 #         sys.exit('Augmented dataset %s is not supported.' % dataset_name)
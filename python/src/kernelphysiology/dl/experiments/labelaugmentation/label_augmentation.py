@@ -7,73 +7,60 @@ from torch.utils.data import Dataset
 from torchvision.datasets.folder import pil_loader
 
 import numpy as np
-import glob
-import random
 
 from PIL import Image
 
-
-def _initialize_neg_labels_correct(targets, v_total_images, neg_labels,
-                                   num_images_label_org):
-    num_images_label_c1 = num_images_label_org.copy()
-
-    correct = 1
-    new_labels = []
-    for i in v_total_images:
-        new_label, num_images_label_c1 = _select_new_label(
-            targets[i], neg_labels, num_images_label_c1, num_images_label_org
+from kernelphysiology.utils import path_utils
+
+
+class NegativeLabelSampler(object):
+    """
+    Assigns every sample a negative label different from its own, each label
+    being used as many times as it occurs in the targets. Samples are sorted
+    by class (random class order and random order within a class) and the
+    labels are cyclically shifted by at least the largest class size, which
+    always yields a valid assignment in one vectorised pass.
+    """
+
+    def __init__(self, targets, seed=None):
+        self.targets = np.asarray(targets)
+        self.num_samples_label = np.bincount(self.targets)
+        self.max_samples_label = self.num_samples_label.max()
+        if 2 * self.max_samples_label > len(self.targets):
+            raise ValueError(
+                'No negative labels possible, %d out of %d samples belong to '
+                'one class.' % (self.max_samples_label, len(self.targets))
+            )
+        self.seed = seed
+        self.rng = np.random.RandomState(seed)
+
+    def sample(self, epoch=None):
+        rng = self.rng
+        if epoch is not None and self.seed is not None:
+            # identical across processes that share the seed
+            rng = np.random.RandomState(self.seed + epoch)
+        num_samples = len(self.targets)
+        num_labels = len(self.num_samples_label)
+
+        class_rank = np.empty(num_labels, dtype=np.int64)
+        class_rank[rng.permutation(num_labels)] = np.arange(num_labels)
+        perm = rng.permutation(num_samples)
+        sorted_inds = perm[
+            np.argsort(class_rank[self.targets[perm]], kind='stable')
+        ]
+
+        # any shift in this range moves every sample out of its class block
+        shift = rng.randint(
+            self.max_samples_label, num_samples - self.max_samples_label + 1
         )
-
-        if new_label == -1:
-            print('No luck!!!!')
-            return 0, num_images_label_org
-
-        # Add it to target list
-        new_labels.append(new_label)
-
-    return correct, new_labels
-
-
-def _select_new_label(current_label, neg_labels, num_images_label,
-                      num_images_label_orig):
-    aux = neg_labels.copy()
-    aux[current_label] = -1
-    aux = aux[aux != -1]
-
-    aux_im = num_images_label.copy()
-    aux_im[current_label] = -1
-    aux_im = aux_im[aux_im != -1]
-
-    data = random.sample(range(0, len(aux)), 1)
-
-    # Select random label
-    while num_images_label[aux[data] - neg_labels[0]] <= 0:
-        data = random.sample(range(0, len(aux)), 1)
-        if aux_im.sum() == 0:
-            return -1, num_images_label_orig
-
-    num_images_label[aux[data] - neg_labels[0]] -= 1
-
-    return aux[data], num_images_label
-
-
-def _get_negative_sample_array(targets):
-    total_images = np.arange(0, len(targets))
-    neg_labels = np.arange(0, max(targets) + 1)
-    return total_images, neg_labels
+        new_labels = np.empty_like(self.targets)
+        new_labels[sorted_inds] = self.targets[np.roll(sorted_inds, -shift)]
+        return new_labels
 
 
-def _get_new_labels(num_samples_label, targets, v_total_samples, neg_labels):
-    # In case of emergency (not lucky) use one copy
-    num_images_label_c1 = num_samples_label.copy()
-
-    correct = 0
-    while correct == 0:
-        correct, new_labels = _initialize_neg_labels_correct(
-            targets, v_total_samples, neg_labels, num_images_label_c1
-        )
-
-    sort_i = sorted(range(len(new_labels)), key=lambda k: new_labels[k])
+def _get_new_labels(neg_sampler, epoch=None):
+    new_labels = neg_sampler.sample(epoch)
+    sort_i = np.argsort(new_labels, kind='stable')
     return sort_i, new_labels
 
 
@@ -113,40 +100,27 @@ class ExplicitNegativeLabelArray(Dataset):
 
 
 class RandomNegativeLabelArray(Dataset):
-    def __init__(self, data, targets, transform=None, target_transform=None):
+    def __init__(self, data, targets, transform=None, target_transform=None,
+                 seed=None):
         self.data = data
         self.targets = targets
         self.transform = transform
         self.target_transform = target_transform
 
-        self.num_samples_label = self.compute_images_per_label()
+        self.neg_sampler = NegativeLabelSampler(self.targets, seed=seed)
+        self.num_samples_label = self.neg_sampler.num_samples_label
         self.shuffle_augmented_labels()
 
-    def compute_images_per_label(self):
-        unique_labels = np.unique(np.array(self.targets))
-        num_samples_label = []
-        for label in unique_labels:
-            num_samples_label.append(self.targets.count(label))
-        return np.array(num_samples_label)
-
-    def shuffle_augmented_labels(self):
+    def shuffle_augmented_labels(self, epoch=None):
         # Indirect labels (implicit labels)
-        ind_map_to_org, targets_neg = self.initialize_neg_labels()
-
-        self.ind_map_to_org = ind_map_to_org.copy()
-        self.targets_neg = targets_neg.copy()
-
-    def initialize_neg_labels(self):
-        v_total_samples, neg_labels = _get_negative_sample_array(self.targets)
+        ind_map_to_org, targets_neg = self.initialize_neg_labels(epoch)
 
-        ind_map_to_org, new_labels = _get_new_labels(
-            self.num_samples_label, self.targets, v_total_samples, neg_labels
-        )
+        self.ind_map_to_org = ind_map_to_org
+        self.targets_neg = targets_neg
 
-        targets_neg = []
-        for i in v_total_samples:
-            targets_neg.append(new_labels[ind_map_to_org[i]].item())
-        return ind_map_to_org, targets_neg
+    def initialize_neg_labels(self, epoch=None):
+        ind_map_to_org, new_labels = _get_new_labels(self.neg_sampler, epoch)
+        return ind_map_to_org, new_labels[ind_map_to_org]
 
     def __getitem__(self, index):
         img = self.data[self.ind_map_to_org[index]]
@@ -167,9 +141,7 @@ class RandomNegativeLabelArray(Dataset):
         return len(self.targets_neg)
 
 
-IMG_EXTENSIONS = [
-    '.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', 'webp'
-]
+IMG_EXTENSIONS = path_utils.IMG_EXTENSIONS
 
 
 class ExplicitNegativeLabelFolder(Dataset):
@@ -190,28 +162,19 @@ class ExplicitNegativeLabelFolder(Dataset):
         self.num_pos_classes = len(self.num_samples_label) - 1
 
     def read_real_labels(self):
-        all_subfolders = sorted(glob.glob(self.data_root + '/*/'))
+        index = path_utils.index_image_folder(self.data_root, self.extensions)
+        image_paths = list(index.paths)
+        targets = list(index.labels)
         # adding the nagative folder
-        all_subfolders.append(self.negative_root)
-        image_paths = []
-        targets = []
-        num_images_label = []
-        for target_id, sub_folder in enumerate(all_subfolders):
-            sub_folder_imgs = []
-            # reading all extensions
-            for extension in self.extensions:
-                sub_folder_imgs.extend(
-                    sorted(glob.glob(sub_folder + '*' + extension))
-                )
-                # with upper case
-                sub_folder_imgs.extend(
-                    sorted(glob.glob(sub_folder + '*' + extension.upper()))
-                )
-            for image_path in sub_folder_imgs:
-                image_paths.append(image_path)
-                targets.append(target_id)
-            num_images_label.append(len(sub_folder_imgs))
-        return image_paths, targets, np.array(num_images_label)
+        negative_paths = path_utils.index_image_folder(
+            self.negative_root, self.extensions, labelled=False
+        ).paths
+        image_paths.extend(negative_paths)
+        targets.extend([len(index.classes)] * len(negative_paths))
+        num_images_label = np.bincount(
+            targets, minlength=len(index.classes) + 1
+        )
+        return image_paths, targets, num_images_label
 
     def __getitem__(self, index):
         path = self.image_paths[index]
@@ -237,7 +200,7 @@ class ExplicitNegativeLabelFolder(Dataset):
 class RandomNegativeLabelFolder(Dataset):
 
     def __init__(self, data_root, transform=None, target_transform=None,
-                 loader=pil_loader, extensions=None):
+                 loader=pil_loader, extensions=None, seed=None):
         if extensions is None:
             extensions = IMG_EXTENSIONS
         self.data_root = data_root
@@ -249,48 +212,26 @@ class RandomNegativeLabelFolder(Dataset):
         (self.image_paths,
          self.targets,
          self.num_samples_label) = self.read_real_labels()
+        self.neg_sampler = NegativeLabelSampler(self.targets, seed=seed)
         self.shuffle_augmented_labels()
 
     def read_real_labels(self):
-        all_subfolders = sorted(glob.glob(self.data_root + '/*/'))
-        image_paths = []
-        targets = []
-        num_images_label = []
-        for target_id, sub_folder in enumerate(all_subfolders):
-            sub_folder_imgs = []
-            # reading all extensions
-            for extension in self.extensions:
-                sub_folder_imgs.extend(
-                    sorted(glob.glob(sub_folder + '*' + extension))
-                )
-                # with upper case
-                sub_folder_imgs.extend(
-                    sorted(glob.glob(sub_folder + '*' + extension.upper()))
-                )
-            for image_path in sub_folder_imgs:
-                image_paths.append(image_path)
-                targets.append(target_id)
-            num_images_label.append(len(sub_folder_imgs))
-        return image_paths, targets, np.array(num_images_label)
-
-    def shuffle_augmented_labels(self):
-        # Indirect labels (implicit labels)
-        ind_map_to_org, targets_neg = self.initialize_neg_labels()
-
-        self.ind_map_to_org = ind_map_to_org.copy()
-        self.targets_neg = targets_neg.copy()
+        index = path_utils.index_image_folder(self.data_root, self.extensions)
+        num_images_label = np.bincount(
+            index.labels, minlength=len(index.classes)
+        )
+        return index.paths, index.labels, num_images_label
 
-    def initialize_neg_labels(self):
-        v_total_samples, neg_labels = _get_negative_sample_array(self.targets)
+    def shuffle_augmented_labels(self, epoch=None):
+        # Indirect labels (implicit labels)
+        ind_map_to_org, targets_neg = self.initialize_neg_labels(epoch)
 
-        ind_map_to_org, new_labels = _get_new_labels(
-            self.num_samples_label, self.targets, v_total_samples, neg_labels
-        )
+        self.ind_map_to_org = ind_map_to_org
+        self.targets_neg = targets_neg
 
-        targets_neg = []
-        for i in v_total_samples:
-            targets_neg.append(new_labels[ind_map_to_org[i]].item())
-        return ind_map_to_org, targets_neg
+    def initialize_neg_labels(self, epoch=None):
+        ind_map_to_org, new_labels = _get_new_labels(self.neg_sampler, epoch)
+        return ind_map_to_org, new_labels[ind_map_to_org]
 
     def __getitem__(self, index):
         path = self.image_paths[self.ind_map_to_org[index]]
@@ -3,9 +3,10 @@
 #         train_sampler.set_epoch(epoch)
 #     adjust_learning_rate(optimizer, epoch, args)
 #
-#     # if doing label augmentation, shuffle the labels
+#     # if doing label augmentation, shuffle the labels (reproducibly if the
+#     # dataset is seeded, identical across the distributed processes)
 #     if args.augment_labels:
-#         train_loader.dataset.datasets[1].shuffle_augmented_labels()
+#         train_loader.dataset.datasets[1].shuffle_augmented_labels(epoch)
 
 
 # other than doubleing labels?
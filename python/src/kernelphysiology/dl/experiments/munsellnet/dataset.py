@@ -1,16 +1,33 @@
 """
-
+The WCS MunsellNet dataset, as individual files or packed into one array.
 """
 
-import glob
+import os
+import sys
+import numpy as np
 
 import torch
 from torch.utils.data import Dataset
 import torchvision.transforms as transforms
-
-from skimage import color
+from torchvision.datasets.folder import pil_loader
+from PIL import Image
 
 from kernelphysiology.dl.pytorch.datasets import utils_db
+from kernelphysiology.utils import path_utils
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+color = lazy_import('skimage.color')
+
+
+def _parse_targets(inputs):
+    """The object, Munsell and illuminant labels are in the file names."""
+    targets = []
+    for img in inputs:
+        img_parsed = img.split('/')[-1].split('.')
+        targets.append(
+            [int(img_parsed[1]), int(img_parsed[2]), int(img_parsed[3])]
+        )
+    return targets
 
 
 class MunsellNetDataset(Dataset):
@@ -20,30 +37,32 @@ class MunsellNetDataset(Dataset):
         self.data_dir = '%s/%s/' % (data_dir, sub_type)
         self.normalise = False
         if self.is_pill_img:
-            self.inputs = glob.glob('%s/*.png' % self.data_dir)
-            from torchvision.datasets.folder import pil_loader
+            self.inputs = path_utils.index_image_folder(
+                self.data_dir, ['.png'], labelled=False
+            ).paths
             self.data_loader = pil_loader
         else:
-            self.inputs = glob.glob('%s/*.npy' % self.data_dir)
+            self.inputs = path_utils.index_image_folder(
+                self.data_dir, ['.npy'], labelled=False
+            ).paths
             self.data_loader = utils_db.npy_data_loader
             if imgnet is not None:
                 self.normalise = True
-        self.targets = []
-        for img in self.inputs:
-            img_parsed = img.split('/')[-1].split('.')
-            gt = [int(img_parsed[1]), int(img_parsed[2]), int(img_parsed[3])]
-            self.targets.append(gt)
-        self.targets = torch.tensor(self.targets)
+        self.targets = torch.tensor(_parse_targets(self.inputs))
         self.transforms = transforms
 
-    def __getitem__(self, index):
-        img_path = self.inputs[index]
-        targets = self.targets[index]
-
-        img = self.data_loader(img_path)
+    def read_image(self, index):
+        """The image in the space it is trained on."""
+        img = self.data_loader(self.inputs[index])
         if self.normalise:
             img /= 31.97249
             img = color.xyz2rgb(img)
+        return img
+
+    def __getitem__(self, index):
+        targets = self.targets[index]
+
+        img = self.read_image(index)
 
         if self.transforms is not None:
             img = self.transforms(img)
@@ -54,8 +73,134 @@ class MunsellNetDataset(Dataset):
         return len(self.inputs)
 
 
+def _packed_files(data_dir, sub_type, cache_dir, imgnet):
+    # only the npy images are converted to rgb
+    is_pill_img = 'wcs_xyz_png_1600' in data_dir
+    space = 'org' if imgnet is None or is_pill_img else 'rgb'
+    prefix = os.path.join(cache_dir, '%s_%s_%s' % (
+        os.path.basename(os.path.normpath(data_dir)), sub_type, space
+    ))
+    return prefix + '_imgs.npy', prefix + '_targets.npy'
+
+
+def pack_munsell(data_dir, sub_type, cache_dir, imgnet=None):
+    """
+    Packs all images of a subset, already converted to the space they are
+    trained on, into one array (uint8 for png and float32 for npy files)
+    and their labels into an int16 matrix. Existing packs are reused.
+    """
+    imgs_file, targets_file = _packed_files(
+        data_dir, sub_type, cache_dir, imgnet
+    )
+    if os.path.exists(imgs_file) and os.path.exists(targets_file):
+        return imgs_file, targets_file
+    path_utils.create_dir(cache_dir)
+
+    db = MunsellNetDataset(data_dir, sub_type, imgnet=imgnet)
+    print('Packing %s %s into %s' % (data_dir, sub_type, imgs_file))
+    first_img = np.asarray(db.read_image(0))
+    dtype = np.uint8 if db.is_pill_img else np.float32
+    # writing to a temporary file so interrupted packs are never reused
+    tmp_file = imgs_file + '.tmp'
+    imgs = np.lib.format.open_memmap(
+        tmp_file, mode='w+', dtype=dtype, shape=(len(db), *first_img.shape)
+    )
+    for i in range(len(db)):
+        img = np.asarray(db.read_image(i))
+        if img.shape != first_img.shape:
+            sys.exit(
+                'Images of different sizes cannot be packed: %s' % db.inputs[i]
+            )
+        imgs[i] = img
+    imgs.flush()
+    del imgs
+    os.rename(tmp_file, imgs_file)
+    np.save(targets_file, db.targets.numpy().astype(np.int16))
+    return imgs_file, targets_file
+
+
+class PackedMunsellNetDataset(Dataset):
+    """
+    A packed subset, memory-mapped so all workers share the same pages.
+    """
+
+    def __init__(self, data_dir, sub_type, cache_dir, transforms=None,
+                 imgnet=None):
+        imgs_file, targets_file = pack_munsell(
+            data_dir, sub_type, cache_dir, imgnet
+        )
+        self.imgs = np.load(imgs_file, mmap_mode='r')
+        self.targets = np.load(targets_file)
+        self.is_pill_img = self.imgs.dtype == np.uint8
+        self.transforms = transforms
+
+    def __getitem__(self, index):
+        targets = torch.from_numpy(self.targets[index].astype(np.int64))
+        img = np.array(self.imgs[index])
+        if self.is_pill_img:
+            img = Image.fromarray(img)
+
+        if self.transforms is not None:
+            img = self.transforms(img)
+
+        return img, targets
+
+    def __len__(self):
+        return len(self.imgs)
+
+
+class PackedBatchLoader(object):
+    """
+    Batches of a packed dataset read straight from its memory map, the
+    conversion to float, the random flips and the normalisation are done
+    on the device (i.e. the GPU) in one go for the whole batch.
+    """
+
+    def __init__(self, dataset, batch_size, device, normalize, shuffle=False,
+                 flip=False):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.shuffle = shuffle
+        self.flip = flip
+        self.mean = torch.tensor(normalize.mean, device=self.device)
+        self.std = torch.tensor(normalize.std, device=self.device)
+
+    def __len__(self):
+        return int(np.ceil(len(self.dataset) / self.batch_size))
+
+    def _to_device(self, array):
+        tensor = torch.from_numpy(array)
+        if self.device.type == 'cuda':
+            tensor = tensor.pin_memory()
+        return tensor.to(self.device, non_blocking=True)
+
+    def __iter__(self):
+        num_imgs = len(self.dataset)
+        if self.shuffle:
+            order = torch.randperm(num_imgs).numpy()
+        else:
+            order = np.arange(num_imgs)
+        for start in range(0, num_imgs, self.batch_size):
+            # sorted indices read the memory map sequentially
+            indices = np.sort(order[start:start + self.batch_size])
+            imgs = self._to_device(self.dataset.imgs[indices])
+            targets = self._to_device(
+                self.dataset.targets[indices].astype(np.int64)
+            )
+
+            imgs = imgs.permute(0, 3, 1, 2).float()
+            if self.dataset.is_pill_img:
+                imgs /= 255
+            if self.flip:
+                flips = torch.rand(len(indices), device=self.device) < 0.5
+                imgs = torch.where(flips[:, None, None, None], imgs.flip(3), imgs)
+            imgs = (imgs - self.mean[:, None, None]) / self.std[:, None, None]
+            yield imgs.contiguous(), targets
+
+
 def get_train_val_dataset(data_dir, train_transformations, val_transformations,
-                          normalize, imgnet):
+                          normalize, imgnet, cache_dir=None):
     is_pill_img = 'wcs_xyz_png_1600' in data_dir
     if is_pill_img:
         train_transforms = transforms.Compose([
@@ -82,12 +227,20 @@ def get_train_val_dataset(data_dir, train_transformations, val_transformations,
             normalize,
         ])
 
-    train_dataset = MunsellNetDataset(
-        data_dir, 'train', train_transforms, imgnet
-    )
-    val_dataset = MunsellNetDataset(
-        data_dir, 'val', val_transforms, imgnet
-    )
+    if cache_dir is None:
+        train_dataset = MunsellNetDataset(
+            data_dir, 'train', train_transforms, imgnet
+        )
+        val_dataset = MunsellNetDataset(
+            data_dir, 'val', val_transforms, imgnet
+        )
+    else:
+        train_dataset = PackedMunsellNetDataset(
+            data_dir, 'train', cache_dir, train_transforms, imgnet
+        )
+        val_dataset = PackedMunsellNetDataset(
+            data_dir, 'val', cache_dir, val_transforms, imgnet
+        )
 
     # db_data = np.loadtxt(data_dir + '/ds.csv', delimiter=',', dtype='str')
 
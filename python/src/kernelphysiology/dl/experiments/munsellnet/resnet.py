@@ -5,6 +5,8 @@ Custom version of ResNet
 import torch
 import torch.nn as nn
 
+from kernelphysiology.dl.pytorch.models.contrast_pooling import ContrastPoolingBlock
+
 __all__ = [
     'ResNet', 'resnet_basic_custom', 'resnet_bottleneck_custom'
 ]
@@ -23,93 +25,6 @@ def conv1x1(in_planes, out_planes, stride=1):
                      bias=False)
 
 
-def conv_avg(in_planes, kernel_size, stride=1, groups=None, dilation=1):
-    if groups is None:
-        groups = in_planes
-    num_pixels = kernel_size * kernel_size * (in_planes / groups)
-    initial_value = 1.0 / num_pixels
-    conv_kernel = nn.Conv2d(in_planes, in_planes, kernel_size=3, stride=stride,
-                            padding=dilation, groups=groups, bias=False,
-                            dilation=dilation)
-    nn.init.constant_(conv_kernel.weight, initial_value)
-    conv_kernel.requires_grad = False
-    return conv_kernel
-
-
-class LocalContrastBlock(nn.Module):
-
-    def __init__(self, planes, kernel_size=3, stride=1, groups=None):
-        super(LocalContrastBlock, self).__init__()
-        self.conv_average = conv_avg(planes, kernel_size=kernel_size,
-                                     stride=stride, groups=groups)
-
-    def forward(self, x):
-        x_avg = self.conv_average(x)
-        x = x - x_avg
-        x = x ** 2
-        x = self.conv_average(x)
-        # x = x ** 0.5
-
-        return x
-
-
-class ContrastPoolingBlock(nn.Module):
-
-    def __init__(self, planes, pooling_type, kernel_size=3, stride=2,
-                 padding=1):
-        super(ContrastPoolingBlock, self).__init__()
-        self.pooling_type = pooling_type
-        self.max_pool = nn.MaxPool2d(kernel_size=kernel_size, stride=stride,
-                                     padding=padding)
-        self.avg_pool = nn.AvgPool2d(kernel_size=kernel_size, stride=stride,
-                                     padding=padding)
-        # TODO: merge all reductions to one type
-        if self.pooling_type in {'mix', 'contrast'}:
-            self.reduction = conv1x1(planes * 2, planes)
-        if self.pooling_type in {'contrast_avg', 'contrast_max'}:
-            self.reduction3 = conv1x1(planes * 3, planes)
-        if 'contrast' in self.pooling_type:
-            self.local_contrast = self._local_contrast(planes,
-                                                       kernel_size=3, stride=1)
-        if self.pooling_type not in {'max', 'avg'}:
-            self.bn = nn.BatchNorm2d(planes)
-
-    def _local_contrast(self, planes, kernel_size=3, stride=1):
-        layers = []
-        layers.append(
-            LocalContrastBlock(planes, kernel_size=kernel_size, stride=stride))
-        return nn.Sequential(*layers)
-
-    def forward(self, x):
-        if self.pooling_type == 'max':
-            out = self.max_pool(x)
-        elif self.pooling_type == 'avg':
-            out = self.avg_pool(x)
-        else:
-            x_max = self.max_pool(x)
-            x_avg = self.avg_pool(x)
-            if self.pooling_type == 'mix':
-                x = torch.cat((x_max, x_avg), dim=1)
-                x = self.reduction(x)
-            elif self.pooling_type == 'contrast_avg':
-                x = self.local_contrast(x)
-                x = self.avg_pool(x)
-                x = torch.cat((x_max, x_avg, x), dim=1)
-                x = self.reduction3(x)
-            elif self.pooling_type == 'contrast_max':
-                x = self.local_contrast(x)
-                x = self.max_pool(x)
-                x = torch.cat((x_max, x_avg, x), dim=1)
-                x = self.reduction3(x)
-            elif self.pooling_type == 'contrast':
-                x = self.local_contrast(x)
-                x = self.avg_pool(x)
-                x = x_max * x + x_avg * (1 - x)
-            out = self.bn(x)
-
-        return out
-
-
 class BasicBlock(nn.Module):
     expansion = 1
 
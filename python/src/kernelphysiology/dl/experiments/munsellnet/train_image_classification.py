@@ -24,7 +24,7 @@ import torchvision.models as models
 
 from kernelphysiology.dl.experiments.munsellnet import resnet
 from kernelphysiology.dl.pytorch.utils.misc import accuracy_preds
-from kernelphysiology.dl.pytorch.utils import preprocessing, cv2_transforms
+from kernelphysiology.dl.pytorch.utils import preprocessing
 from kernelphysiology.dl.pytorch.utils import argument_handler
 from kernelphysiology.dl.pytorch.utils.misc import AverageMeter, accuracy
 from kernelphysiology.dl.pytorch.utils.misc import adjust_learning_rate
@@ -36,6 +36,8 @@ from kernelphysiology.utils.path_utils import create_dir
 
 from kernelphysiology.dl.experiments.munsellnet.dataset import \
     get_train_val_dataset
+from kernelphysiology.dl.experiments.munsellnet.dataset import \
+    PackedBatchLoader
 
 best_acc1 = 0
 
@@ -178,24 +180,86 @@ def predict(val_loader, model, criterion, device, print_freq=100):
     return prediction_output
 
 
+class MultiHeadMeter(object):
+    """
+    Losses and top-k accuracies of the object, Munsell and illuminant heads.
+    The statistics of a batch are stacked into one tensor and accumulated on
+    the device, they are copied to the host (at once) only when read.
+    """
+
+    def __init__(self, topks):
+        self.topks = topks
+        self.last = None
+        self.sums = None
+        self.count = 0
+        self.reset()
+
+    def reset(self):
+        self.last = None
+        self.sums = None
+        self.count = 0
+
+    def update(self, outputs, targets, criterion):
+        """Returns the summed loss of the heads that exist."""
+        loss = 0
+        stats = []
+        zero = torch.zeros((), device=targets.device)
+        for i, output in enumerate(outputs):
+            if output is None:
+                stats.extend([zero] * (1 + len(self.topks)))
+                continue
+            loss_head = criterion(output, targets[:, i])
+            loss = loss + loss_head
+            stats.append(loss_head.detach())
+            stats.extend(
+                acc[0] for acc in accuracy(output, targets[:, i], self.topks)
+            )
+        stats.append(loss.detach())
+
+        batch_size = targets.shape[0]
+        self.last = torch.stack([stat.float() for stat in stats])
+        if self.sums is None:
+            self.sums = self.last * batch_size
+        else:
+            self.sums += self.last * batch_size
+        self.count += batch_size
+        return loss
+
+    def values(self):
+        """The values of the last batch and the averages, as dictionaries."""
+        last, avg = torch.stack([self.last, self.sums / self.count]).tolist()
+        return self._named(last), self._named(avg)
+
+    def _named(self, stats):
+        named = {'loss': stats[-1]}
+        stats_per_head = 1 + len(self.topks)
+        for i, head in enumerate(['obj', 'mun', 'ill']):
+            head_stats = stats[i * stats_per_head:(i + 1) * stats_per_head]
+            named['loss_%s' % head] = head_stats[0]
+            named['top1_%s' % head] = head_stats[1]
+        return named
+
+    def summary(self):
+        last, avg = self.values()
+        return (
+            'Loss {0[loss]:.2f} ({1[loss]:.2f})\t'
+            'LO {0[loss_obj]:.2f} ({1[loss_obj]:.2f})\t'
+            'LM {0[loss_mun]:.2f} ({1[loss_mun]:.2f})\t'
+            'LI {0[loss_ill]:.2f} ({1[loss_ill]:.2f})\t'
+            'Ao {0[top1_obj]:.2f} ({1[top1_obj]:.2f})\t'
+            'AM {0[top1_mun]:.2f} ({1[top1_mun]:.2f})\t'
+            'AI {0[top1_ill]:.2f} ({1[top1_ill]:.2f})'.format(last, avg)
+        )
+
+
 def validate_on_data(val_loader, model, criterion, args):
-    losses = AverageMeter()
     batch_time = AverageMeter()
 
-    losses_obj = AverageMeter()
-    top1_obj = AverageMeter()
-    top5_obj = AverageMeter()
-    losses_mun = AverageMeter()
-    top1_mun = AverageMeter()
-    top5_mun = AverageMeter()
-    losses_ill = AverageMeter()
-    top1_ill = AverageMeter()
-    top5_ill = AverageMeter()
-
     if args.top_k is None:
         topks = (1,)
     else:
         topks = (1, args.top_k)
+    meter = MultiHeadMeter(topks)
 
     # switch to evaluate mode
     model.eval()
@@ -208,37 +272,8 @@ def validate_on_data(val_loader, model, criterion, args):
             targets = targets.cuda(args.gpus, non_blocking=True)
 
             # compute output
-            out_obj, out_mun, out_ill = model(input_image)
-            if out_obj is None:
-                loss_obj = 0
-            else:
-                loss_obj = criterion(out_obj, targets[:, 0])
-                acc1_obj, acc5_obj = accuracy(out_obj, targets[:, 0],
-                                              topk=topks)
-                losses_obj.update(loss_obj.item(), input_image.size(0))
-                top1_obj.update(acc1_obj[0], input_image.size(0))
-                top5_obj.update(acc5_obj[0], input_image.size(0))
-            if out_mun is None:
-                loss_mun = 0
-            else:
-                loss_mun = criterion(out_mun, targets[:, 1])
-                acc1_mun, acc5_mun = accuracy(out_mun, targets[:, 1],
-                                              topk=topks)
-                losses_mun.update(loss_mun.item(), input_image.size(0))
-                top1_mun.update(acc1_mun[0], input_image.size(0))
-                top5_mun.update(acc5_mun[0], input_image.size(0))
-            if out_ill is None:
-                loss_ill = 0
-            else:
-                loss_ill = criterion(out_ill, targets[:, 2])
-                acc1_ill, acc5_ill = accuracy(out_ill, targets[:, 2],
-                                              topk=topks)
-                losses_ill.update(loss_ill.item(), input_image.size(0))
-                top1_ill.update(acc1_ill[0], input_image.size(0))
-                top5_ill.update(acc5_ill[0], input_image.size(0))
-
-            loss = loss_obj + loss_mun + loss_ill
-            losses.update(loss.item(), input_image.size(0))
+            outputs = model(input_image)
+            meter.update(outputs, targets, criterion)
 
             # measure elapsed time
             batch_time.update(time.time() - end)
@@ -249,80 +284,57 @@ def validate_on_data(val_loader, model, criterion, args):
                 print(
                     'Test: [{0}/{1}]\t'
                     'Time {batch_time.val:.2f} ({batch_time.avg:.2f})\t'
-                    'Loss {loss.val:.2f} ({loss.avg:.2f})\t'
-                    'LO {obj_loss.val:.2f} ({obj_loss.avg:.2f})\t'
-                    'LM {mun_loss.val:.2f} ({mun_loss.avg:.2f})\t'
-                    'LI {ill_loss.val:.2f} ({ill_loss.avg:.2f})\t'
-                    'Ao {obj_acc.val:.2f} ({obj_acc.avg:.2f})\t'
-                    'AM {mun_acc.val:.2f} ({mun_acc.avg:.2f})\t'
-                    'AI {ill_acc.val:.2f} ({ill_acc.avg:.2f})'.format(
-                        i, len(val_loader), batch_time=batch_time,
-                        loss=losses, obj_loss=losses_obj,
-                        mun_loss=losses_mun, ill_loss=losses_ill,
-                        obj_acc=top1_obj, mun_acc=top1_mun, ill_acc=top1_ill
+                    '{2}'.format(
+                        i, len(val_loader), meter.summary(),
+                        batch_time=batch_time
                     )
                 )
         # printing the accuracy of the epoch
+        _, avg = meter.values()
         print(
-            ' * AccObj {obj_acc.avg:.2f} AccMun {mun_acc.avg:.2f}'
-            ' AccIll {ill_acc.avg:.2f}'.format(
-                obj_acc=top1_obj, mun_acc=top1_mun, ill_acc=top1_ill
-            )
+            ' * AccObj {0[top1_obj]:.2f} AccMun {0[top1_mun]:.2f}'
+            ' AccIll {0[top1_ill]:.2f}'.format(avg)
         )
 
-    return [batch_time.avg, losses.avg, losses_obj.avg, losses_mun.avg,
-            losses_ill.avg, top1_obj.avg, top1_mun.avg, top1_ill.avg]
-
-
-def correct_image(normalise_inverse, normalise_back, input_image, out_ill,
-                  ill_colours):
-    corrected_images = input_image.clone()
-    for i in range(out_ill.shape[0]):
-        current_image = corrected_images[i].squeeze()
-        current_image = normalise_inverse.__call__(current_image)
-        ill_ind = out_ill[i, :].argmax()
-        illuminant = ill_colours[ill_ind]
-        # from skimage import io
-        # im_save = current_image.cpu().numpy().transpose([1, 2, 0])
-        # io.imsave('/home/arash/Desktop/before.png', im_save / im_save.max())
-        for j in range(3):
-            current_image[j,] /= illuminant[j]
-        # im_save = current_image.cpu().numpy().transpose([1, 2, 0])
-        # io.imsave('/home/arash/Desktop/after.png', im_save / im_save.max())
-        # import pdb
-        # pdb.set_trace()
-        corrected_images[i] = normalise_back.__call__(current_image)
-    return corrected_images
+    return [batch_time.avg, avg['loss'], avg['loss_obj'], avg['loss_mun'],
+            avg['loss_ill'], avg['top1_obj'], avg['top1_mun'], avg['top1_ill']]
+
+
+def correct_image(input_image, out_ill, ill_colours, mean, std):
+    """
+    Divides the (unnormalised) images by the colour of their most likely
+    illuminant. With x the normalised image and c the illuminant, the
+    inverse normalisation, division and normalisation fuse into
+    x / c + mean / std * (1 / c - 1).
+    """
+    scale = 1 / ill_colours[out_ill.argmax(dim=1)][:, :, None, None]
+    shift = (mean / std)[None, :, None, None] * (scale - 1)
+    return torch.addcmul(shift, input_image.detach(), scale)
 
 
 def train_on_data(train_loader, model, criterion, optimizer, epoch, args):
-    losses = AverageMeter()
     batch_time = AverageMeter()
     data_time = AverageMeter()
 
-    losses_obj = AverageMeter()
-    top1_obj = AverageMeter()
-    top5_obj = AverageMeter()
-    losses_mun = AverageMeter()
-    top1_mun = AverageMeter()
-    top5_mun = AverageMeter()
-    losses_ill = AverageMeter()
-    top1_ill = AverageMeter()
-    top5_ill = AverageMeter()
-
     if args.top_k is None:
         topks = (1,)
     else:
         topks = (1, args.top_k)
+    meter = MultiHeadMeter(topks)
 
     # switch to train mode
     model.train()
 
+    device = torch.device('cpu' if args.gpus is None else args.gpus)
     mean, std = model_utils.get_preprocessing_function(
         args.colour_space, args.vision_type
     )
-    normalise_inverse = cv2_transforms.NormalizeInverse(mean, std)
-    normalise_back = transforms.Normalize(mean=mean, std=std)
+    mean = torch.tensor(mean, device=device)
+    std = torch.tensor(std, device=device)
+    if args.ill_colour is not None:
+        ill_colours = torch.tensor(
+            args.ill_colour, dtype=torch.float32, device=device
+        )
 
     end = time.time()
     for i, (input_image, targets) in enumerate(train_loader):
@@ -335,34 +347,7 @@ def train_on_data(train_loader, model, criterion, optimizer, epoch, args):
 
         # compute output
         out_obj, out_mun, out_ill = model(input_image)
-
-        if out_obj is None:
-            loss_obj = 0
-        else:
-            loss_obj = criterion(out_obj, targets[:, 0])
-            acc1_obj, acc5_obj = accuracy(out_obj, targets[:, 0], topk=topks)
-            losses_obj.update(loss_obj.item(), input_image.size(0))
-            top1_obj.update(acc1_obj[0], input_image.size(0))
-            top5_obj.update(acc5_obj[0], input_image.size(0))
-        if out_mun is None:
-            loss_mun = 0
-        else:
-            loss_mun = criterion(out_mun, targets[:, 1])
-            acc1_mun, acc5_mun = accuracy(out_mun, targets[:, 1], topk=topks)
-            losses_mun.update(loss_mun.item(), input_image.size(0))
-            top1_mun.update(acc1_mun[0], input_image.size(0))
-            top5_mun.update(acc5_mun[0], input_image.size(0))
-        if out_ill is None:
-            loss_ill = 0
-        else:
-            loss_ill = criterion(out_ill, targets[:, 2])
-            acc1_ill, acc5_ill = accuracy(out_ill, targets[:, 2], topk=topks)
-            losses_ill.update(loss_ill.item(), input_image.size(0))
-            top1_ill.update(acc1_ill[0], input_image.size(0))
-            top5_ill.update(acc5_ill[0], input_image.size(0))
-
-        loss = loss_obj + loss_mun + loss_ill
-        losses.update(loss.item(), input_image.size(0))
+        loss = meter.update([out_obj, out_mun, out_ill], targets, criterion)
 
         # compute gradient and do SGD step
         optimizer.zero_grad()
@@ -371,8 +356,7 @@ def train_on_data(train_loader, model, criterion, optimizer, epoch, args):
 
         if out_mun is None and args.ill_colour is not None:
             input_image2 = correct_image(
-                normalise_inverse, normalise_back, input_image, out_ill,
-                args.ill_colour
+                input_image, out_ill, ill_colours, mean, std
             )
             out_obj2, out_mun2, _ = model(input_image2)
             loss_mun2 = 0
@@ -396,21 +380,15 @@ def train_on_data(train_loader, model, criterion, optimizer, epoch, args):
                 'Epoch: [{0}][{1}/{2}]\t'
                 'Time {batch_time.val:.2f} ({batch_time.avg:.2f})\t'
                 'Data {data_time.val:.2f} ({data_time.avg:.2f})\t'
-                'Loss {loss.val:.2f} ({loss.avg:.2f})\t'
-                'LO {obj_loss.val:.2f} ({obj_loss.avg:.2f})\t'
-                'LM {mun_loss.val:.2f} ({mun_loss.avg:.2f})\t'
-                'LI {ill_loss.val:.2f} ({ill_loss.avg:.2f})\t'
-                'Ao {obj_acc.val:.2f} ({obj_acc.avg:.2f})\t'
-                'AM {mun_acc.val:.2f} ({mun_acc.avg:.2f})\t'
-                'AI {ill_acc.val:.2f} ({ill_acc.avg:.2f})'.format(
-                    epoch, i, len(train_loader), batch_time=batch_time,
-                    data_time=data_time, loss=losses, obj_loss=losses_obj,
-                    mun_loss=losses_mun, ill_loss=losses_ill,
-                    obj_acc=top1_obj, mun_acc=top1_mun, ill_acc=top1_ill
+                '{3}'.format(
+                    epoch, i, len(train_loader), meter.summary(),
+                    batch_time=batch_time, data_time=data_time
                 )
             )
-    return [epoch, batch_time.avg, losses.avg, losses_obj.avg, losses_mun.avg,
-            losses_ill.avg, top1_obj.avg, top1_mun.avg, top1_ill.avg]
+    _, avg = meter.values()
+    return [epoch, batch_time.avg, avg['loss'], avg['loss_obj'],
+            avg['loss_mun'], avg['loss_ill'], avg['top1_obj'],
+            avg['top1_mun'], avg['top1_ill']]
 
 
 def extra_args_fun(parser):
@@ -472,6 +450,20 @@ def extra_args_fun(parser):
         help='ImageNet wieghts (default: None)'
     )
 
+    specific_group.add_argument(
+        '--packed_dir',
+        type=str,
+        default=None,
+        help='Directory of the packed dataset, packed if absent (default: None)'
+    )
+
+    specific_group.add_argument(
+        '--device_augmentation',
+        action='store_true',
+        default=False,
+        help='Augmenting the packed batches on the GPU (default: False)'
+    )
+
     specific_group.add_argument(
         '--ill_colour',
         type=str,
@@ -716,7 +708,7 @@ def main_worker(ngpus_per_node, args):
 
     train_dataset, validation_dataset = get_train_val_dataset(
         args.data_dir, other_transformations, [], normalize,
-        args.imagenet_weights
+        args.imagenet_weights, cache_dir=args.packed_dir
     )
 
     if args.distributed:
@@ -739,7 +731,7 @@ def main_worker(ngpus_per_node, args):
             other_transformations = [prediction_transformation]
             _, validation_dataset = get_train_val_dataset(
                 args.data_dir, other_transformations, other_transformations,
-                normalize, args.imagenet_weights
+                normalize, args.imagenet_weights, cache_dir=args.packed_dir
             )
 
             val_loader = torch.utils.data.DataLoader(
@@ -758,18 +750,38 @@ def main_worker(ngpus_per_node, args):
             )
         return
 
-    val_loader = torch.utils.data.DataLoader(
-        validation_dataset,
-        batch_size=args.batch_size, shuffle=False,
-        num_workers=args.workers, pin_memory=True
-    )
+    if args.device_augmentation and (
+            args.packed_dir is None or args.num_augmentations != 0 or
+            args.distributed
+    ):
+        warnings.warn(
+            'Device augmentation only flips packed datasets without other '
+            'augmentations on one GPU, using the data loaders instead.'
+        )
+        args.device_augmentation = False
 
-    train_loader = torch.utils.data.DataLoader(
-        train_dataset,
-        batch_size=args.batch_size, shuffle=(train_sampler is None),
-        num_workers=args.workers, pin_memory=True,
-        sampler=train_sampler
-    )
+    if args.device_augmentation:
+        device = torch.device('cpu' if args.gpus is None else args.gpus)
+        val_loader = PackedBatchLoader(
+            validation_dataset, args.batch_size, device, normalize
+        )
+        train_loader = PackedBatchLoader(
+            train_dataset, args.batch_size, device, normalize, shuffle=True,
+            flip=True
+        )
+    else:
+        val_loader = torch.utils.data.DataLoader(
+            validation_dataset,
+            batch_size=args.batch_size, shuffle=False,
+            num_workers=args.workers, pin_memory=True
+        )
+
+        train_loader = torch.utils.data.DataLoader(
+            train_dataset,
+            batch_size=args.batch_size, shuffle=(train_sampler is None),
+            num_workers=args.workers, pin_memory=True,
+            sampler=train_sampler
+        )
 
     if args.ill_colour is not None:
         print('Performing with illuminant correction')
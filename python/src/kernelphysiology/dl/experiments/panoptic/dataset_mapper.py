@@ -4,17 +4,18 @@ import sys
 import logging
 import numpy as np
 import random
-from fvcore.common.file_io import PathManager
-
-from detectron2.data import transforms as T
-from detectron2.data import detection_utils as utils
 
 from PIL import Image, ImageOps
 
 from kernelphysiology.utils import imutils
+from kernelphysiology.utils.lazy_imports import lazy_import, lazy_from
 import torch
 import ntpath
 
+PathManager = lazy_from('fvcore.common.file_io', 'PathManager')
+T = lazy_import('detectron2.data.transforms')
+utils = lazy_import('detectron2.data.detection_utils')
+
 """
 This file contains the default mapping that's applied to "dataset dicts".
 """
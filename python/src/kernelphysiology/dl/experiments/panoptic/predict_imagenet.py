@@ -13,6 +13,7 @@ from kernelphysiology.dl.pytorch.utils.preprocessing import inv_normalise_tensor
 from kernelphysiology.transformations import colour_spaces
 
 from kernelphysiology.dl.pytorch.models import model_utils
+from kernelphysiology.dl.pytorch.datasets import data_loaders
 from kernelphysiology.dl.pytorch.utils import cv2_transforms
 from kernelphysiology.dl.pytorch.utils import cv2_preprocessing
 from kernelphysiology.transformations import normalisations
@@ -21,10 +22,9 @@ from kernelphysiology.dl.pytorch.utils.misc import accuracy_preds
 from kernelphysiology.utils import imutils
 import argparse
 
-from torchvision import datasets as tdatasets
 
 
-class ImageFolder(tdatasets.ImageFolder):
+class ImageFolder(data_loaders.IndexedImageFolder):
     def __init__(self, intransform=None, outtransform=None, **kwargs):
         super(ImageFolder, self).__init__(**kwargs)
         self.imgs = self.samples
@@ -10,11 +10,77 @@ import torch.nn.functional as F
 
 import pdb
 
+# on the GPU, kernels from this size on are convolved in the frequency domain
+FFT_MIN_KERNEL_SIZE = 15
+
+
+def _fft_size(n):
+    """The smallest size from n on with only 2, 3 and 5 as factors."""
+    while True:
+        m = n
+        for factor in [2, 3, 5]:
+            while m % factor == 0:
+                m //= factor
+        if m == 1:
+            return n
+        n += 1
+
+
+def fft_conv2d(x, weight, bias=None, stride=1, padding=0):
+    """
+    Same as F.conv2d (without groups) computed with the FFT, which is faster
+    for large kernels. The circular cross-correlation of the padded input
+    equals the convolution over the valid positions.
+    """
+    if isinstance(stride, int):
+        stride = (stride, stride)
+    if isinstance(padding, int):
+        padding = (padding, padding)
+    x = F.pad(x, [padding[1], padding[1], padding[0], padding[0]])
+    H, W = x.shape[-2:]
+    kh, kw = weight.shape[-2:]
+    fft_size = (_fft_size(H), _fft_size(W))
+    x_f = torch.fft.rfft2(x, s=fft_size)
+    weight_f = torch.fft.rfft2(weight, s=fft_size).conj()
+    if x.shape[1] == 1:
+        out_f = x_f * weight_f.transpose(0, 1)
+    else:
+        out_f = torch.einsum('nchw,ochw->nohw', x_f, weight_f)
+    out = torch.fft.irfft2(out_f, s=fft_size)
+    out = out[:, :, :H - kh + 1:stride[0], :W - kw + 1:stride[1]]
+    if bias is not None:
+        out = out + bias.view(1, -1, 1, 1)
+    return out
+
+
+def _params_key(module):
+    """Changes whenever a parameter is moved or updated in place."""
+    return tuple((p.data_ptr(), p._version) for p in module.parameters())
+
+
 class GaborLayer(nn.Module):
+    """
+    The Gabor kernels are regenerated at every training step. Otherwise
+    (eval mode or no gradients) they are cached until a parameter changes.
+    conv_method is one of 'direct', 'fft' or 'auto' (fft on the GPU for
+    kernels of FFT_MIN_KERNEL_SIZE or larger). With fold_1x1 and no relu,
+    conv1x1 is merged into the Gabor bank at inference and one dense
+    convolution is computed instead of the two.
+    """
+
     def __init__(self, in_channels, out_channels, kernel_size, stride, padding, 
         kernels, extra_kernels=0, orientations=8, bias1=False, 
-        bias2=False, relu=True, use_alphas=True):
+        bias2=False, relu=True, use_alphas=True, conv_method='auto',
+        fold_1x1=False):
         super(GaborLayer, self).__init__()
+        if conv_method not in ['direct', 'fft', 'auto']:
+            raise ValueError('Unsupported conv_method %s.' % conv_method)
+        if fold_1x1 and relu:
+            raise ValueError('conv1x1 cannot be folded across the relu.')
+        self.conv_method = conv_method
+        self.fold_1x1 = fold_1x1
+        self._cache_key = None
+        self._cache = None
         self.in_channels = in_channels
         self.out_channels = out_channels
         self.stride = stride
@@ -74,13 +140,51 @@ class GaborLayer(nn.Module):
             in_channels=self.channels1x1, out_channels=out_channels, 
             kernel_size=1, bias=bias2)
 
+    def _conv2d(self, x, weight, bias):
+        use_fft = self.conv_method == 'fft' or (
+            self.conv_method == 'auto' and x.is_cuda and
+            self.kernel_size >= FFT_MIN_KERNEL_SIZE
+        )
+        if use_fft:
+            return fft_conv2d(x, weight, bias, self.stride, self.padding)
+        return F.conv2d(input=x, weight=weight, bias=bias,
+            stride=self.stride, padding=self.padding)
+
+    def cached_kernels(self):
+        """
+        The Gabor kernels, and if fold_1x1 the folded weights and bias,
+        computed without gradients and reused while the parameters hold.
+        """
+        key = _params_key(self)
+        if key != self._cache_key:
+            with torch.no_grad():
+                gabor_kernels = self.generate_gabor_kernels()
+                folded = None
+                if self.fold_1x1:
+                    folded = self.folded_weights(gabor_kernels)
+            self._cache = (gabor_kernels, folded)
+            self._cache_key = key
+        return self._cache
+
+    def folded_weights(self, gabor_kernels):
+        """The weights and bias of conv1x1 applied after the Gabor bank."""
+        w1x1 = self.conv1x1.weight.view(
+            self.out_channels, self.in_channels, self.responses)
+        weight = torch.einsum('ocr,rhw->ochw', w1x1, gabor_kernels[:, 0])
+        bias = self.conv1x1.bias
+        if self.bias is not None:
+            folded_bias = torch.einsum('ocr,r->o', w1x1, self.bias)
+            bias = folded_bias if bias is None else bias + folded_bias
+        return weight, bias
+
     def forward(self, x):
         # Generate the Gabor kernels
-        if not hasattr(self, 'gabor_kernels'):
-            self.gabor_kernels = self.generate_gabor_kernels()
-
-        if self.training:
+        if self.training and torch.is_grad_enabled():
             self.gabor_kernels = self.generate_gabor_kernels()
+        else:
+            self.gabor_kernels, folded = self.cached_kernels()
+            if folded is not None:
+                return self._conv2d(x, *folded)
         # kernels are of shape 
         # [self.kernels*self.orientations + self.extra_kernels, 1, self.kernel_size, self.kernel_size]
         # Reshape the input: x is of size
@@ -90,8 +194,7 @@ class GaborLayer(nn.Module):
         bs, _, H, W = x.size()
         x = x.view(bs*self.in_channels, H, W).unsqueeze(dim=1)
         # Perform convolution
-        out = F.conv2d(input=x, weight=self.gabor_kernels, bias=self.bias, 
-            stride=self.stride, padding=self.padding)
+        out = self._conv2d(x, self.gabor_kernels, self.bias)
         if self.relu:
             out = torch.relu(out)
         # 'out' is of size [batch_size*in_channels, newH, newW]
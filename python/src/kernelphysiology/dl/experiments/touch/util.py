@@ -5,11 +5,13 @@ import logging.config
 from datetime import datetime
 import json
 
-from skimage import io
-
 import torch
 from torchvision.utils import save_image, make_grid
 
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+io = lazy_import('skimage.io')
+
 
 def setup_logging_from_args(args):
     """
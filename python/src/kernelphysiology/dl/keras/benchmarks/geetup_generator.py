@@ -0,0 +1,68 @@
+"""
+Frames per second of the serial and the shared-memory GEETUP generators.
+"""
+
+import sys
+import argparse
+import pickle
+import time
+
+from kernelphysiology.dl.keras.video import geetup_db
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='GEETUP generator benchmark')
+    parser.add_argument(
+        'video_file', type=str,
+        help='A pickle of the video list (e.g. the training file)'
+    )
+    parser.add_argument('--batch_size', default=8, type=int)
+    parser.add_argument(
+        '--target_size', nargs='+', default=[360, 640], type=int
+    )
+    parser.add_argument('--num_batches', default=20, type=int)
+    parser.add_argument(
+        '--num_producers', nargs='+', default=[2, 4, 8], type=int
+    )
+    return parser.parse_args(argv)
+
+
+def frames_per_second(generator, num_batches):
+    num_batches = min(num_batches, len(generator))
+    start = time.perf_counter()
+    for i in range(num_batches):
+        generator[i]
+    elapsed = time.perf_counter() - start
+    num_frames = num_batches * generator.batch_size * generator.sequence_length
+    return num_frames / elapsed
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    with open(args.video_file, 'rb') as f:
+        video_info = pickle.load(f)
+    kwargs = {
+        'batch_size': args.batch_size,
+        'target_size': tuple(args.target_size),
+        'frames_gap': video_info['frames_gap'],
+        'sequence_length': video_info['sequence_length'],
+        'shuffle': False
+    }
+
+    generator = geetup_db.GeetupGenerator(video_info['video_list'], **kwargs)
+    print('%-24s %10.2f frames/s' % (
+        'serial', frames_per_second(generator, args.num_batches)
+    ))
+    for num_producers in args.num_producers:
+        generator = geetup_db.SharedGeetupGenerator(
+            video_info['video_list'], num_producers=num_producers, **kwargs
+        )
+        print('%-24s %10.2f frames/s' % (
+            'shared (%d producers)' % num_producers,
+            frames_per_second(generator, args.num_batches)
+        ))
+        generator.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -9,6 +9,8 @@ import time
 from pycocotools.cocoeval import COCOeval
 from pycocotools import mask as maskUtils
 
+from kernelphysiology.dl.keras.models import mrcnn_utils
+
 
 def build_coco_results(dataset, image_ids, rois, class_ids, scores, masks):
     """Arrange resutls to match COCO specs in http://cocodataset.org/#format
@@ -37,10 +39,30 @@ def build_coco_results(dataset, image_ids, rois, class_ids, scores, masks):
     return results
 
 
+def compute_image_ap_range(dataset, image_id, r, iou_thresholds=None):
+    """AP over the IoU thresholds (default 0.5-0.95) of the detections r of
+    one image. Returns None if the image has no (non crowd) instances.
+    """
+    gt_masks, gt_class_ids = dataset.load_mask(image_id)
+    # crowds have negative class IDs
+    instances = gt_class_ids > 0
+    if not np.any(instances):
+        return None
+    gt_masks = gt_masks[..., instances]
+    gt_class_ids = gt_class_ids[instances]
+    gt_boxes = mrcnn_utils.extract_bboxes(gt_masks)
+    return mrcnn_utils.compute_ap_range(
+        gt_boxes, gt_class_ids, gt_masks,
+        r['rois'], r['class_ids'], r['scores'], r['masks'],
+        iou_thresholds=iou_thresholds, verbose=0
+    )
+
+
 def evaluate_coco(model, dataset, coco, eval_type=['bbox', 'segm'], limit=None, image_ids=None, preprocessing_function=None):
     """Runs official COCO evaluation.
     dataset: A Dataset object with valiadtion data
-    eval_type: "bbox" or "segm" for bounding box or segmentation evaluation
+    eval_type: "bbox" or "segm" for bounding box or segmentation evaluation,
+               "ap_range" for the mean mask AP@[.5:.95] of mrcnn_utils
     limit: if not 0, it's the number of images to use for evaluation
     """
     # Pick COCO images from the dataset
@@ -57,6 +79,7 @@ def evaluate_coco(model, dataset, coco, eval_type=['bbox', 'segm'], limit=None,
     t_start = time.time()
 
     results = []
+    image_aps = []
     for i, image_id in enumerate(image_ids):
         # Load image
         image = dataset.load_image(image_id)
@@ -76,12 +99,25 @@ def evaluate_coco(model, dataset, coco, eval_type=['bbox', 'segm'], limit=None,
                                            np.uint8(r['masks']))
         results.extend(image_results)
 
+        if 'ap_range' in eval_type:
+            image_ap = compute_image_ap_range(dataset, image_id, r)
+            if image_ap is not None:
+                image_aps.append(image_ap)
+
     # Load results. This modifies results with additional attributes.
     coco_results = coco.loadRes(results)
 
     results = []
     # evaluate
     for et in eval_type:
+        if et == 'ap_range':
+            if len(image_aps) == 0:
+                print('AP @0.50-0.95: no image with instances')
+                results.append(np.array([np.nan]))
+                continue
+            print('AP @0.50-0.95: {:.3f}'.format(np.mean(image_aps)))
+            results.append(np.array([np.mean(image_aps)]))
+            continue
         cocoEval = COCOeval(coco, coco_results, et)
         cocoEval.params.imgIds = coco_image_ids
         cocoEval.evaluate()
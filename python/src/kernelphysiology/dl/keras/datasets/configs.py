@@ -4,9 +4,12 @@ The utility functoins for datasets.
 
 
 import numpy as np
-import skimage
 import logging
 
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+skimage = lazy_import('skimage')
+
 
 class Config(object):
     """Base configuration class. For custom configurations, create a
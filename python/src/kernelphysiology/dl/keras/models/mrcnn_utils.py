@@ -77,11 +77,11 @@ def compute_iou(box, boxes, box_area, boxes_area):
     return iou
 
 
-def compute_overlaps(boxes1, boxes2):
+def compute_overlaps(boxes1, boxes2, chunk_size=4096):
     """Computes IoU overlaps between two sets of boxes.
     boxes1, boxes2: [N, (y1, x1, y2, x2)].
-
-    For better performance, pass the largest set first and the smaller second.
+    chunk_size: number of boxes1 rows computed at once, bounding the
+        temporary matrices (e.g. for the anchors of build_rpn_targets).
     """
     # Areas of anchors and GT boxes
     area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
@@ -90,9 +90,18 @@ def compute_overlaps(boxes1, boxes2):
     # Compute overlaps to generate matrix [boxes1 count, boxes2 count]
     # Each cell contains the IoU value.
     overlaps = np.zeros((boxes1.shape[0], boxes2.shape[0]))
-    for i in range(overlaps.shape[1]):
-        box2 = boxes2[i]
-        overlaps[:, i] = compute_iou(box2, boxes1, area2[i], area1)
+    for start in range(0, boxes1.shape[0], chunk_size):
+        chunk = boxes1[start:start + chunk_size]
+        # (in place, to keep the number of temporary matrices low)
+        height = np.minimum(chunk[:, None, 2], boxes2[None, :, 2])
+        height -= np.maximum(chunk[:, None, 0], boxes2[None, :, 0])
+        width = np.minimum(chunk[:, None, 3], boxes2[None, :, 3])
+        width -= np.maximum(chunk[:, None, 1], boxes2[None, :, 1])
+        intersection = np.maximum(height, 0, out=height)
+        intersection *= np.maximum(width, 0, out=width)
+        union = area1[start:start + chunk_size, None] + area2[None, :]
+        union -= intersection
+        np.divide(intersection, union, out=overlaps[start:start + chunk_size])
     return overlaps
 
 
@@ -118,41 +127,39 @@ def compute_overlaps_masks(masks1, masks2):
     return overlaps
 
 
-def non_max_suppression(boxes, scores, threshold):
+def non_max_suppression(boxes, scores, threshold, chunk_size=256):
     """Performs non-maximum suppression and returns indices of kept boxes.
     boxes: [N, (y1, x1, y2, x2)]. Notice that (y2, x2) lays outside the box.
     scores: 1-D array of box scores.
     threshold: Float. IoU threshold to use for filtering.
+    chunk_size: number of boxes suppressed at once.
+
+    Boxes are processed in chunks of decreasing score: a chunk is first
+    suppressed by all the boxes kept so far in one IoU matrix, the greedy
+    loop then only runs over the IoU matrix of its surviving boxes.
     """
     assert boxes.shape[0] > 0
     if boxes.dtype.kind != "f":
         boxes = boxes.astype(np.float32)
 
-    # Compute box areas
-    y1 = boxes[:, 0]
-    x1 = boxes[:, 1]
-    y2 = boxes[:, 2]
-    x2 = boxes[:, 3]
-    area = (y2 - y1) * (x2 - x1)
-
     # Get indicies of boxes sorted by scores (highest first)
     ixs = scores.argsort()[::-1]
+    boxes = boxes[ixs]
 
     pick = []
-    while len(ixs) > 0:
-        # Pick top box and add its index to the list
-        i = ixs[0]
-        pick.append(i)
-        # Compute IoU of the picked box with the rest
-        iou = compute_iou(boxes[i], boxes[ixs[1:]], area[i], area[ixs[1:]])
-        # Identify boxes with IoU over the threshold. This
-        # returns indices into ixs[1:], so add 1 to get
-        # indices into ixs.
-        remove_ixs = np.where(iou > threshold)[0] + 1
-        # Remove indices of the picked and overlapped boxes.
-        ixs = np.delete(ixs, remove_ixs)
-        ixs = np.delete(ixs, 0)
-    return np.array(pick, dtype=np.int32)
+    for start in range(0, boxes.shape[0], chunk_size):
+        chunk = np.arange(start, min(start + chunk_size, boxes.shape[0]))
+        if len(pick) > 0:
+            suppressed = compute_overlaps(boxes[chunk], boxes[pick]) > threshold
+            chunk = chunk[~suppressed.any(axis=1)]
+        suppresses = compute_overlaps(boxes[chunk], boxes[chunk]) > threshold
+        removed = np.zeros(len(chunk), dtype=bool)
+        for i in range(len(chunk)):
+            if removed[i]:
+                continue
+            pick.append(chunk[i])
+            removed |= suppresses[i]
+    return ixs[pick].astype(np.int32)
 
 
 def apply_box_deltas(boxes, deltas):
@@ -652,19 +659,9 @@ def trim_zeros(x):
     return x[~np.all(x == 0, axis=1)]
 
 
-def compute_matches(gt_boxes, gt_class_ids, gt_masks,
-                    pred_boxes, pred_class_ids, pred_scores, pred_masks,
-                    iou_threshold=0.5, score_threshold=0.0):
-    """Finds matches between prediction and ground truth instances.
-
-    Returns:
-        gt_match: 1-D array. For each GT box it has the index of the matched
-                  predicted box.
-        pred_match: 1-D array. For each predicted box, it has the index of
-                    the matched ground truth box.
-        overlaps: [pred_boxes, gt_boxes] IoU overlaps.
-    """
-    # Trim zero padding
+def _sorted_instances(gt_boxes, gt_masks, pred_boxes, pred_class_ids,
+                      pred_scores, pred_masks):
+    """Trims the zero padding and sorts predictions by score."""
     # TODO: cleaner to do zero unpadding upstream
     gt_boxes = trim_zeros(gt_boxes)
     gt_masks = gt_masks[..., :gt_boxes.shape[0]]
@@ -676,58 +673,87 @@ def compute_matches(gt_boxes, gt_class_ids, gt_masks,
     pred_class_ids = pred_class_ids[indices]
     pred_scores = pred_scores[indices]
     pred_masks = pred_masks[..., indices]
+    return gt_boxes, gt_masks, pred_boxes, pred_class_ids, pred_masks
+
+
+def compute_matches_range(gt_boxes, gt_class_ids, gt_masks,
+                          pred_boxes, pred_class_ids, pred_scores, pred_masks,
+                          iou_thresholds, score_threshold=0.0):
+    """Finds matches between prediction and ground truth instances at
+    several IoU thresholds, computing the overlaps once.
+
+    Returns:
+        gt_match: [thresholds, gt_boxes]. For each GT box it has the index of
+                  the matched predicted box.
+        pred_match: [thresholds, pred_boxes]. For each predicted box, it has
+                    the index of the matched ground truth box.
+        overlaps: [pred_boxes, gt_boxes] IoU overlaps.
+    """
+    gt_boxes, gt_masks, pred_boxes, pred_class_ids, pred_masks = \
+        _sorted_instances(gt_boxes, gt_masks, pred_boxes, pred_class_ids,
+                          pred_scores, pred_masks)
 
     # Compute IoU overlaps [pred_masks, gt_masks]
     overlaps = compute_overlaps_masks(pred_masks, gt_masks)
 
-    # Loop through predictions and find matching ground truth boxes
-    match_count = 0
-    pred_match = -1 * np.ones([pred_boxes.shape[0]])
-    gt_match = -1 * np.ones([gt_boxes.shape[0]])
-    for i in range(len(pred_boxes)):
-        # Find best matching ground truth box
-        # 1. Sort matches by score
+    iou_thresholds = np.asarray(iou_thresholds)[:, None]
+    num_gts = gt_boxes.shape[0]
+    pred_match = -1 * np.ones([len(iou_thresholds), pred_boxes.shape[0]])
+    gt_match = -1 * np.ones([len(iou_thresholds), num_gts])
+    if num_gts == 0:
+        return gt_match, pred_match, overlaps
+    all_thresholds = np.arange(len(iou_thresholds))
+    # The greedy matching of each prediction depends on the previous ones,
+    # but is independent across thresholds. For every threshold a
+    # prediction matches the first unmatched ground truth box of its class
+    # in the order of decreasing IoU, if the IoU reaches the threshold.
+    for i in range(pred_boxes.shape[0]):
         sorted_ixs = np.argsort(overlaps[i])[::-1]
-        # 2. Remove low scores
-        low_score_idx = np.where(overlaps[i, sorted_ixs] < score_threshold)[0]
-        if low_score_idx.size > 0:
-            sorted_ixs = sorted_ixs[:low_score_idx[0]]
-        # 3. Find the match
-        for j in sorted_ixs:
-            # If ground truth box is already matched, go to next one
-            if gt_match[j] > -1:
-                continue
-            # If we reach IoU smaller than the threshold, end the loop
-            iou = overlaps[i, j]
-            if iou < iou_threshold:
-                break
-            # Do we have a match?
-            if pred_class_ids[i] == gt_class_ids[j]:
-                match_count += 1
-                gt_match[j] = i
-                pred_match[i] = j
-                break
+        sorted_overlaps = overlaps[i, sorted_ixs]
+        candidates = (
+            (sorted_overlaps >= score_threshold) &
+            (gt_class_ids[:num_gts][sorted_ixs] == pred_class_ids[i])
+        )
+        valid = (
+            candidates[None, :] &
+            (sorted_overlaps[None, :] >= iou_thresholds) &
+            (gt_match[:, sorted_ixs] == -1)
+        )
+        matched = valid.any(axis=1)
+        js = sorted_ixs[valid.argmax(axis=1)][matched]
+        gt_match[all_thresholds[matched], js] = i
+        pred_match[matched, i] = js
 
     return gt_match, pred_match, overlaps
 
 
-def compute_ap(gt_boxes, gt_class_ids, gt_masks,
-               pred_boxes, pred_class_ids, pred_scores, pred_masks,
-               iou_threshold=0.5):
-    """Compute Average Precision at a set IoU threshold (default 0.5).
+def compute_matches(gt_boxes, gt_class_ids, gt_masks,
+                    pred_boxes, pred_class_ids, pred_scores, pred_masks,
+                    iou_threshold=0.5, score_threshold=0.0):
+    """Finds matches between prediction and ground truth instances.
 
     Returns:
-    mAP: Mean Average Precision
-    precisions: List of precisions at different class score thresholds.
-    recalls: List of recall values at different class score thresholds.
-    overlaps: [pred_boxes, gt_boxes] IoU overlaps.
+        gt_match: 1-D array. For each GT box it has the index of the matched
+                  predicted box.
+        pred_match: 1-D array. For each predicted box, it has the index of
+                    the matched ground truth box.
+        overlaps: [pred_boxes, gt_boxes] IoU overlaps.
     """
-    # Get matches and overlaps
-    gt_match, pred_match, overlaps = compute_matches(
+    gt_match, pred_match, overlaps = compute_matches_range(
         gt_boxes, gt_class_ids, gt_masks,
         pred_boxes, pred_class_ids, pred_scores, pred_masks,
-        iou_threshold)
+        [iou_threshold], score_threshold)
+    return gt_match[0], pred_match[0], overlaps
+
 
+def average_precision(gt_match, pred_match):
+    """Compute Average Precision from the matches of compute_matches.
+
+    Returns:
+    mAP: Mean Average Precision
+    precisions: List of precisions at different class score thresholds.
+    recalls: List of recall values at different class score thresholds.
+    """
     # Compute precision and recall at each prediction box step
     precisions = np.cumsum(pred_match > -1) / (np.arange(len(pred_match)) + 1)
     recalls = np.cumsum(pred_match > -1).astype(np.float32) / len(gt_match)
@@ -739,14 +765,33 @@ def compute_ap(gt_boxes, gt_class_ids, gt_masks,
     # Ensure precision values decrease but don't increase. This way, the
     # precision value at each recall threshold is the maximum it can be
     # for all following recall thresholds, as specified by the VOC paper.
-    for i in range(len(precisions) - 2, -1, -1):
-        precisions[i] = np.maximum(precisions[i], precisions[i + 1])
+    precisions = np.maximum.accumulate(precisions[::-1])[::-1]
 
     # Compute mean AP over recall range
     indices = np.where(recalls[:-1] != recalls[1:])[0] + 1
     mAP = np.sum((recalls[indices] - recalls[indices - 1]) *
                  precisions[indices])
 
+    return mAP, precisions, recalls
+
+
+def compute_ap(gt_boxes, gt_class_ids, gt_masks,
+               pred_boxes, pred_class_ids, pred_scores, pred_masks,
+               iou_threshold=0.5):
+    """Compute Average Precision at a set IoU threshold (default 0.5).
+
+    Returns:
+    mAP: Mean Average Precision
+    precisions: List of precisions at different class score thresholds.
+    recalls: List of recall values at different class score thresholds.
+    overlaps: [pred_boxes, gt_boxes] IoU overlaps.
+    """
+    # Get matches and overlaps
+    gt_match, pred_match, overlaps = compute_matches(
+        gt_boxes, gt_class_ids, gt_masks,
+        pred_boxes, pred_class_ids, pred_scores, pred_masks,
+        iou_threshold)
+    mAP, precisions, recalls = average_precision(gt_match, pred_match)
     return mAP, precisions, recalls, overlaps
 
 
@@ -755,15 +800,17 @@ def compute_ap_range(gt_box, gt_class_id, gt_mask,
                      iou_thresholds=None, verbose=1):
     """Compute AP over a range or IoU thresholds. Default range is 0.5-0.95."""
     # Default is 0.5 to 0.95 with increments of 0.05
-    iou_thresholds = iou_thresholds or np.arange(0.5, 1.0, 0.05)
-    
-    # Compute AP over range of IoU thresholds
+    if iou_thresholds is None:
+        iou_thresholds = np.arange(0.5, 1.0, 0.05)
+
+    # The overlaps and matches of all thresholds at once
+    gt_match, pred_match, _ = compute_matches_range(
+        gt_box, gt_class_id, gt_mask,
+        pred_box, pred_class_id, pred_score, pred_mask,
+        iou_thresholds)
     AP = []
-    for iou_threshold in iou_thresholds:
-        ap, precisions, recalls, overlaps =\
-            compute_ap(gt_box, gt_class_id, gt_mask,
-                        pred_box, pred_class_id, pred_score, pred_mask,
-                        iou_threshold=iou_threshold)
+    for t, iou_threshold in enumerate(iou_thresholds):
+        ap, _, _ = average_precision(gt_match[t], pred_match[t])
         if verbose:
             print("AP @{:.2f}:\t {:.3f}".format(iou_threshold, ap))
         AP.append(ap)
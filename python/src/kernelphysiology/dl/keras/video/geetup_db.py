@@ -4,6 +4,9 @@ Reading the GEETUP dataset and creating train and validation sets.
 
 import numpy as np
 import random
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
 
 import keras
 import keras.backend as K
@@ -35,6 +38,7 @@ class GeetupGenerator(keras.utils.Sequence):
         self.grey_scale = self.num_chns == 1
         self.gaussian_kernel = gaussian_kernel2(gaussian_sigma)
         self.only_last_frame = not all_frames
+        self.fixations = dict()
 
         if K.image_data_format() == 'channels_last':
             self.in_shape = (
@@ -93,43 +97,107 @@ class GeetupGenerator(keras.utils.Sequence):
         if self.shuffle is True:
             random.shuffle(self.check_list)
 
+    def fixation_points(self, fixation_path):
+        """The fixations of a video, read once per video."""
+        if fixation_path not in self.fixations:
+            self.fixations[fixation_path] = np.loadtxt(fixation_path)
+        return self.fixations[fixation_path]
+
+    def _sequence_info(self, video_id):
+        # get the video and frame number
+        segment_dir = self.video_list[video_id[0]][0]
+        video_num = self.video_list[video_id[0]][1]
+        selected_path = segment_dir + '/CutVid_' + video_num + \
+                        '/selected_frames/'
+        video_path = selected_path + 'frames'
+        fixation_points = self.fixation_points(selected_path + 'gt.txt')
+        frame_num = video_id[2]
+        start_frame = frame_num + 1
+        end_frame = start_frame + self.sequence_length * self.frames_gap
+        frame_nums = range(start_frame, end_frame, self.frames_gap)
+        return video_path, fixation_points, frame_nums
+
+    def read_sequence(self, video_id, frames, heat_maps):
+        """
+        Reads the uint8 frames [sequence_length, rows, cols, chns] and the
+        heat maps [1 or sequence_length, rows, cols, 1] of one sequence.
+        """
+        video_path, fixation_points, frame_nums = self._sequence_info(video_id)
+        for j, c_f_num in enumerate(frame_nums):
+            image_name = video_path + str(c_f_num) + '.jpg'
+            current_img = image.load_img(image_name, grayscale=self.grey_scale)
+            # [::-1] because PIL images have size ay XY, not rows cols
+            org_size = current_img.size[::-1]
+            current_img = current_img.resize(self.target_size[::-1])
+            frames[j] = np.asarray(current_img).reshape(frames.shape[1:])
+
+            if self.only_last_frame and j < len(frame_nums) - 1:
+                continue
+            gt_resized = map_point_to_image_size(
+                fixation_points[c_f_num - 1][::-1],
+                self.target_size,
+                org_size
+            )
+            heat_maps[0 if self.only_last_frame else j] = heat_map_from_point(
+                gt_resized,
+                target_size=self.target_size,
+                g_kernel=self.gaussian_kernel
+            )
+
+    def empty_buffers(self, num_imgs):
+        """The uint8 frames and float32 heat maps of a batch."""
+        num_frames = 1 if self.only_last_frame else self.sequence_length
+        frames = np.empty(
+            (num_imgs, self.sequence_length, *self.target_size,
+             self.num_chns), dtype='uint8'
+        )
+        heat_maps = np.empty(
+            (num_imgs, num_frames, *self.target_size, 1), dtype='float32'
+        )
+        return frames, heat_maps
+
+    def finalise_batch(self, frames, heat_maps):
+        """Converts the frames to float, only once the batch is complete."""
+        if K.image_data_format() == 'channels_first':
+            frames = np.moveaxis(frames, -1, 2)
+        x_batch = np.empty(frames.shape, dtype='float32')
+        x_batch[...] = frames
+        if self.preprocessing_function is not None:
+            x_batch = self.preprocessing_function(x_batch)
+
+        rows = self.target_size[1]
+        cols = self.target_size[0]
+        y_batch = np.reshape(
+            heat_maps, (-1, heat_maps.shape[1], rows * cols, 1)
+        )
+        return x_batch, y_batch
+
     def __data_generation(self, current_batch):
         """Generates data containing batch_size samples"""
+        if self.only_name_and_gt is False:
+            frames, heat_maps = self.empty_buffers(len(current_batch))
+            for i, video_id in enumerate(current_batch):
+                self.read_sequence(video_id, frames[i], heat_maps[i])
+            return self.finalise_batch(frames, heat_maps)
+
         # initialisation
         current_num_imgs = len(current_batch)
-        if self.only_name_and_gt:
-            x_batch = np.empty(
-                (current_num_imgs, self.sequence_length), dtype='<U180'
-            )
-            y_batch = np.empty(
-                (current_num_imgs, self.sequence_length, 2), dtype='float32'
-            )
-        else:
-            x_batch = np.empty(
-                (current_num_imgs, *self.in_shape), dtype='float32'
-            )
-            y_batch = np.empty(
-                (current_num_imgs, *self.out_shape), dtype='float32'
-            )
+        x_batch = np.empty(
+            (current_num_imgs, self.sequence_length), dtype='<U180'
+        )
+        y_batch = np.empty(
+            (current_num_imgs, self.sequence_length, 2), dtype='float32'
+        )
 
         # generate data
         for i, video_id in enumerate(current_batch):
-            # get the video and frame number
-            segment_dir = self.video_list[video_id[0]][0]
-            video_num = self.video_list[video_id[0]][1]
-            selected_path = segment_dir + '/CutVid_' + video_num + \
-                            '/selected_frames/'
-            video_path = selected_path + 'frames'
-            fixation_path = selected_path + 'gt.txt'
-            frame_num = video_id[2]
-            fixation_points = np.loadtxt(fixation_path)
-            start_frame = frame_num + 1
-            end_frame = start_frame + self.sequence_length * self.frames_gap
-            for j, c_f_num in enumerate(
-                    range(start_frame, end_frame, self.frames_gap)):
+            video_path, fixation_points, frame_nums = self._sequence_info(
+                video_id
+            )
+            for j, c_f_num in enumerate(frame_nums):
                 image_name = video_path + str(c_f_num) + '.jpg'
                 # if org_size is None, we assume different images are different
-                if self.org_size is None or self.only_name_and_gt is False:
+                if self.org_size is None:
                     current_img = image.load_img(image_name,
                                                  grayscale=self.grey_scale)
                     # [::-1] because PIL images have size ay XY, not rows cols
@@ -142,36 +210,132 @@ class GeetupGenerator(keras.utils.Sequence):
                     self.target_size,
                     org_size
                 )
+                x_batch[i, j,] = image_name
+                y_batch[i, j,] = gt_resized
 
-                if self.only_name_and_gt:
-                    x_batch[i, j,] = image_name
-                    y_batch[i, j,] = gt_resized
-                else:
-                    # [::-1] because PIL images have size ay XY, not rows cols
-                    current_img = current_img.resize(self.target_size[::-1])
-                    current_img = image.img_to_array(current_img)
-                    x_batch[i, j,] = current_img
-                    y_batch[i, j,] = heat_map_from_point(
-                        gt_resized,
-                        target_size=self.target_size,
-                        g_kernel=self.gaussian_kernel
-                    )
+        if self.only_last_frame:
+            x_batch = np.reshape(x_batch[:, -1, ], (-1, 1, 1))
+            y_batch = np.reshape(y_batch[:, -1, ], (-1, 1, 2))
+        return x_batch, y_batch
 
-        if self.only_name_and_gt is False:
-            if self.preprocessing_function is not None:
-                x_batch = self.preprocessing_function(x_batch)
-
-            rows = self.target_size[1]
-            cols = self.target_size[0]
-            # TODO: in case of only last frame, don't read all other GTs
-            if self.only_last_frame:
-                y_batch = np.reshape(y_batch[:, -1, ], (-1, 1, rows * cols, 1))
-            else:
-                y_batch = np.reshape(
-                    y_batch, (-1, self.sequence_length, rows * cols, 1)
-                )
+
+# the generator and the shared buffers of a producer process
+_PRODUCER = dict()
+
+
+def _init_producer(generator, frames_name, heat_maps_name, frames_shape,
+                   heat_maps_shape):
+    _PRODUCER['generator'] = generator
+    _PRODUCER['memories'] = [
+        shared_memory.SharedMemory(name=frames_name),
+        shared_memory.SharedMemory(name=heat_maps_name)
+    ]
+    _PRODUCER['frames'] = np.ndarray(
+        frames_shape, dtype='uint8', buffer=_PRODUCER['memories'][0].buf
+    )
+    _PRODUCER['heat_maps'] = np.ndarray(
+        heat_maps_shape, dtype='float32', buffer=_PRODUCER['memories'][1].buf
+    )
+
+
+def _produce_sequence(task):
+    slot, i, video_id = task
+    _PRODUCER['generator'].read_sequence(
+        video_id, _PRODUCER['frames'][slot, i], _PRODUCER['heat_maps'][slot, i]
+    )
+
+
+class SharedGeetupGenerator(GeetupGenerator):
+    """
+    GEETUP generator whose sequences are read by a pool of producer
+    processes directly into shared memory, the frames are stored as uint8
+    and converted to float once per batch. Every slot holds one batch, a
+    call to __getitem__ uses a free slot, therefore up to num_slots batches
+    can be produced concurrently (e.g. by the workers of fit_generator).
+    Call close() to stop the producers and to release the shared memory.
+    """
+
+    def __init__(self, video_list, num_producers=4, num_slots=2, **kwargs):
+        self.pool = None
+        self.memories = []
+        super(SharedGeetupGenerator, self).__init__(video_list, **kwargs)
+        if self.only_name_and_gt:
+            return
+
+        frames, heat_maps = self.empty_buffers(self.batch_size)
+        self.memories = [
+            shared_memory.SharedMemory(
+                create=True, size=num_slots * frames.nbytes
+            ),
+            shared_memory.SharedMemory(
+                create=True, size=num_slots * heat_maps.nbytes
+            )
+        ]
+        self.frames = np.ndarray(
+            (num_slots, *frames.shape), dtype=frames.dtype,
+            buffer=self.memories[0].buf
+        )
+        self.heat_maps = np.ndarray(
+            (num_slots, *heat_maps.shape), dtype=heat_maps.dtype,
+            buffer=self.memories[1].buf
+        )
+        self.free_slots = queue.Queue()
+        for slot in range(num_slots):
+            self.free_slots.put(slot)
+
+        # forking avoids pickling the generator and importing keras again
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
         else:
-            if self.only_last_frame:
-                x_batch = np.reshape(x_batch[:, -1, ], (-1, 1, 1))
-                y_batch = np.reshape(y_batch[:, -1, ], (-1, 1, 2))
+            context = multiprocessing.get_context()
+        self.pool = context.Pool(
+            num_producers, initializer=_init_producer, initargs=(
+                self, self.memories[0].name, self.memories[1].name,
+                self.frames.shape, self.heat_maps.shape
+            )
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ['pool', 'memories', 'frames', 'heat_maps', 'free_slots']:
+            state.pop(key, None)
+        return state
+
+    def __getitem__(self, index):
+        """Generate one batch of data"""
+        if self.pool is None:
+            return super(SharedGeetupGenerator, self).__getitem__(index)
+        current_batch = self.check_list[
+                        index * self.batch_size:(index + 1) * self.batch_size]
+
+        slot = self.free_slots.get()
+        try:
+            self.pool.map(
+                _produce_sequence,
+                [
+                    (slot, i, video_id)
+                    for i, video_id in enumerate(current_batch)
+                ]
+            )
+            num_imgs = len(current_batch)
+            x_batch, y_batch = self.finalise_batch(
+                self.frames[slot, :num_imgs], self.heat_maps[slot, :num_imgs]
+            )
+            # the heat maps are still a view of the slot
+            y_batch = y_batch.copy()
+        finally:
+            self.free_slots.put(slot)
         return x_batch, y_batch
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
+        self.memories = []
+
+    def __del__(self):
+        self.close()
@@ -252,7 +252,13 @@ if __name__ == "__main__":
         training_list, args.sequence_length, args.frames_gap = read_pickle(
             os.path.join(args.data_dir, args.train_file), args.frames_gap)
 
-        training_generator = geetup_db.GeetupGenerator(
+        if args.workers > 1:
+            generator_class = partial(
+                geetup_db.SharedGeetupGenerator, num_producers=args.workers
+            )
+        else:
+            generator_class = geetup_db.GeetupGenerator
+        training_generator = generator_class(
             training_list,
             batch_size=args.batch_size,
             target_size=args.target_size,
@@ -350,6 +356,8 @@ if __name__ == "__main__":
                         LearningRateScheduler(lr_schedule_lambda),
                         last_checkpoint_logger]
                 )
+            if isinstance(training_generator, geetup_db.SharedGeetupGenerator):
+                training_generator.close()
             args.validation_file = os.path.join(args.data_dir,
                                                 'testing_all_subjects.pickle')
             evaluate(model, args, 'all_subjects')
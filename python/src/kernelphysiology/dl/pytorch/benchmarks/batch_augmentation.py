@@ -0,0 +1,86 @@
+"""
+Images per second of the per sample cv2_transforms and the BatchAugmentation
+of a collated uint8 batch.
+"""
+
+import sys
+import argparse
+import time
+
+import numpy as np
+import torch
+import torchvision.transforms as torch_transforms
+
+from kernelphysiology.dl.pytorch.utils import cv2_transforms
+from kernelphysiology.dl.pytorch.utils import batch_transforms
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Batch augmentation benchmark')
+    parser.add_argument('--batch_size', default=64, type=int)
+    parser.add_argument(
+        '--image_size', nargs=2, default=[375, 500], type=int,
+        help='The rows and columns of the input images'
+    )
+    parser.add_argument('--target_size', default=224, type=int)
+    parser.add_argument('--repeats', default=5, type=int)
+    parser.add_argument(
+        '--device', default='cpu', type=str, help='e.g. cpu or cuda:0'
+    )
+    return parser.parse_args(argv)
+
+
+def images_per_second(fun, batch_size, repeats, device):
+    fun()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fun()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return batch_size * repeats / (time.perf_counter() - start)
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    device = torch.device(args.device)
+    imgs = np.random.randint(
+        0, 256, (args.batch_size, *args.image_size, 3), dtype=np.uint8
+    )
+
+    per_sample = torch_transforms.Compose([
+        cv2_transforms.RandomResizedCrop(args.target_size),
+        cv2_transforms.RandomHorizontalFlip(),
+        cv2_transforms.ToTensor(),
+        cv2_transforms.Normalize(MEAN, STD),
+    ])
+
+    def per_sample_fun():
+        batch = torch.stack([per_sample(img) for img in imgs])
+        return batch.to(device)
+
+    batch_augmentation = batch_transforms.BatchAugmentation(
+        args.target_size, mean=MEAN, std=STD
+    )
+    batch = torch.from_numpy(imgs)
+
+    def batch_fun():
+        # as in AugmentedLoader, only the crops are moved to device
+        return batch_augmentation(batch, device=device)
+
+    print('%-24s %10.2f images/s' % (
+        'cv2_transforms',
+        images_per_second(per_sample_fun, args.batch_size, args.repeats, device)
+    ))
+    print('%-24s %10.2f images/s' % (
+        'BatchAugmentation (%s)' % device.type,
+        images_per_second(batch_fun, args.batch_size, args.repeats, device)
+    ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""
+Comparing the convolutional and the box-filter implementations of the
+contrast pooling blocks.
+"""
+
+import sys
+import argparse
+import time
+
+import torch
+
+from kernelphysiology.dl.pytorch.models import contrast_pooling
+
+POOLING_TYPES = ['mix', 'contrast', 'contrast_avg', 'contrast_max']
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Contrast pooling benchmark')
+    parser.add_argument(
+        '--device', default=None, type=str,
+        help='the device to run on (default: cuda if available)'
+    )
+    parser.add_argument('--batch_size', default=64, type=int)
+    parser.add_argument('--planes', default=64, type=int)
+    parser.add_argument('--target_size', default=56, type=int)
+    parser.add_argument('--repeats', default=50, type=int)
+    parser.add_argument(
+        '--pooling_types', nargs='+', default=POOLING_TYPES, type=str
+    )
+    return parser.parse_args(argv)
+
+
+def convolutional_block(planes, pooling_type):
+    """A block computed as before, with averaging convolutions."""
+    block = contrast_pooling.ContrastPoolingBlock(planes, pooling_type)
+    block.fusable = False
+    if 'contrast' in pooling_type:
+        legacy = contrast_pooling.conv_avg(planes, kernel_size=3)
+        state_dict = block.state_dict()
+        state_dict['local_contrast.0.conv_average.weight'] = legacy.weight
+        block.load_state_dict(state_dict)
+    return block
+
+
+def _synchronize(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def time_block(block, x, repeats, backward=False):
+    """Returns the mean time of one pass in milliseconds."""
+    x = x.detach().requires_grad_(backward)
+    for _ in range(3):
+        out = block(x)
+        if backward:
+            out.sum().backward()
+    _synchronize(x.device)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = block(x)
+        if backward:
+            out.sum().backward()
+    _synchronize(x.device)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    if args.device is None:
+        args.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = torch.device(args.device)
+
+    x = torch.randn(
+        args.batch_size, args.planes, args.target_size, args.target_size,
+        device=device
+    )
+    print('%-14s %-9s %10s %10s %8s' % (
+        'pooling', 'pass', 'conv (ms)', 'box (ms)', 'speedup'
+    ))
+    for pooling_type in args.pooling_types:
+        blocks = [
+            convolutional_block(args.planes, pooling_type).to(device),
+            contrast_pooling.ContrastPoolingBlock(
+                args.planes, pooling_type
+            ).to(device)
+        ]
+        for backward in [False, True]:
+            timings = []
+            for block in blocks:
+                if backward:
+                    block.train()
+                    timings.append(time_block(block, x, args.repeats, True))
+                else:
+                    block.eval()
+                    with torch.no_grad():
+                        timings.append(time_block(block, x, args.repeats))
+            print('%-14s %-9s %10.3f %10.3f %7.2fx' % (
+                pooling_type, 'backward' if backward else 'forward',
+                timings[0], timings[1], timings[0] / timings[1]
+            ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,64 @@
+"""
+CPU throughput of the InferenceRunner for different architectures.
+"""
+
+import sys
+import argparse
+import time
+
+import torch
+
+from kernelphysiology.dl.pytorch.models import model_utils
+from kernelphysiology.dl.pytorch.utils import inference
+
+ARCHITECTURES = [
+    'resnet18', 'resnet50', 'vgg11', 'mobilenet_v2', 'densenet121'
+]
+
+SETTINGS = [
+    ('float32', False), ('bfloat16', False), ('float32', True),
+    ('bfloat16', True)
+]
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='CPU inference benchmark')
+    parser.add_argument(
+        '--architectures', nargs='+', default=ARCHITECTURES, type=str
+    )
+    parser.add_argument('--batch_size', default=16, type=int)
+    parser.add_argument('--target_size', default=224, type=int)
+    parser.add_argument('--repeats', default=10, type=int)
+    parser.add_argument('--num_threads', default=None, type=int)
+    return parser.parse_args(argv)
+
+
+def images_per_second(runner, x, repeats):
+    for _ in range(2):
+        runner(x)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        runner(x)
+    return repeats * x.shape[0] / (time.perf_counter() - start)
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    x = torch.randn(args.batch_size, 3, args.target_size, args.target_size)
+    print('%-16s %-9s %-9s %10s' % ('architecture', 'dtype', 'quantise',
+                                    'images/s'))
+    for architecture in args.architectures:
+        for cpu_dtype, quantise in SETTINGS:
+            model = model_utils.which_architecture(architecture)
+            runner = inference.InferenceRunner(
+                model, device='cpu', num_threads=args.num_threads,
+                cpu_dtype=cpu_dtype, quantise=quantise
+            )
+            print('%-16s %-9s %-9s %10.2f' % (
+                architecture, cpu_dtype, quantise,
+                images_per_second(runner, x, args.repeats)
+            ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
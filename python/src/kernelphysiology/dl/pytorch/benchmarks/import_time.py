@@ -0,0 +1,116 @@
+"""
+Cold import time of the entry points, each measured in a fresh interpreter.
+Exits with an error if any of them exceeds its budget (in seconds). A budget
+(baseline, seconds) is the time on top of the cold import of baseline, the
+framework the entry point cannot do without.
+"""
+
+import sys
+import argparse
+import json
+import subprocess
+
+# the torch entry points should cost little more than torchvision itself
+ENTRY_POINTS = {
+    'kernelphysiology.utils.imutils': 1.5,
+    'kernelphysiology.filterfactory.mask': 1.5,
+    'kernelphysiology.transformations.frequency_domains': 1.5,
+    'kernelphysiology.analysis.metrics.visual_attention': 1.0,
+    'kernelphysiology.dl.pytorch.utils.misc': ('torchvision', 0.5),
+    'kernelphysiology.dl.pytorch.predict_image_classification': (
+        'torchvision', 1.0
+    ),
+    'kernelphysiology.dl.pytorch.train_image_classification': (
+        'torchvision', 1.0
+    ),
+    'kernelphysiology.dl.pytorch.vaes.main': ('torchvision', 1.0),
+}
+
+# these should only be imported by the functions that use them
+HEAVY_MODULES = [
+    'detectron2', 'fvcore', 'pycocotools', 'pywt', 'skimage', 'matplotlib',
+    'torch.utils.tensorboard'
+]
+
+_IMPORT_CODE = '''
+import sys, time, json, importlib
+start = time.perf_counter()
+importlib.import_module(%r)
+elapsed = time.perf_counter() - start
+heavy = [name for name in %r if name in sys.modules]
+print(json.dumps([elapsed, heavy]))
+'''
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Import time benchmark')
+    parser.add_argument(
+        '--modules', nargs='+', default=None, type=str,
+        help='The entry points to measure (default: all with a budget)'
+    )
+    parser.add_argument(
+        '--budgets', default=None, type=str,
+        help='A json file of {module: seconds} overriding the budgets, '
+             'a list [baseline, seconds] is relative to baseline'
+    )
+    parser.add_argument('--repeats', default=3, type=int)
+    return parser.parse_args(argv)
+
+
+def cold_import(module_name, repeats):
+    """Returns the fastest of the cold imports and the heavy modules loaded."""
+    times = []
+    heavy = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', _IMPORT_CODE % (module_name, HEAVY_MODULES)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+        ).stdout
+        elapsed, heavy = json.loads(output.decode().strip().splitlines()[-1])
+        times.append(elapsed)
+    return min(times), heavy
+
+
+def absolute_budget(budget, baselines, repeats):
+    """The budget in seconds, measuring the baseline of a relative one."""
+    if budget is None or not isinstance(budget, (tuple, list)):
+        return budget
+    baseline, seconds = budget
+    if baseline not in baselines:
+        baselines[baseline] = cold_import(baseline, repeats)[0]
+    return baselines[baseline] + seconds
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    budgets = dict(ENTRY_POINTS)
+    if args.budgets is not None:
+        with open(args.budgets) as f:
+            budgets.update(json.load(f))
+    modules = args.modules if args.modules is not None else list(budgets)
+
+    baselines = dict()
+    over_budget = []
+    print('%-56s %8s %8s  %s' % ('module', 'seconds', 'budget', 'heavy'))
+    for module_name in modules:
+        try:
+            elapsed, heavy = cold_import(module_name, args.repeats)
+        except subprocess.CalledProcessError as e:
+            sys.exit('Importing %s failed:\n%s' % (
+                module_name, e.stderr.decode()
+            ))
+        budget = absolute_budget(
+            budgets.get(module_name, None), baselines, args.repeats
+        )
+        print('%-56s %8.3f %8s  %s' % (
+            module_name, elapsed, '-' if budget is None else '%.3f' % budget,
+            ', '.join(heavy)
+        ))
+        if budget is not None and elapsed > budget:
+            over_budget.append(module_name)
+    if len(over_budget) > 0:
+        sys.exit('Over the import time budget: %s' % ', '.join(over_budget))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
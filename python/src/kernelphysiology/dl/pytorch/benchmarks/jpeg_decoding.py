@@ -0,0 +1,72 @@
+"""
+Images per second of reading the ImageNet validation set with the full PIL
+decoding and with the JpegLoader decoding near the target size, both
+followed by the test transformations (Resize and CenterCrop).
+"""
+
+import sys
+import argparse
+import time
+
+import numpy as np
+import torchvision.transforms as torch_transforms
+from torchvision import datasets as tdatasets
+
+from kernelphysiology.dl.pytorch.datasets import image_loaders
+from kernelphysiology.dl.pytorch.utils import cv2_transforms
+from kernelphysiology.utils import path_utils
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='JPEG decoding benchmark')
+    parser.add_argument(
+        'validation_dir', type=str,
+        help='The ImageNet validation directory (one folder per class)'
+    )
+    parser.add_argument('--num_images', default=1000, type=int)
+    parser.add_argument('--target_size', default=224, type=int)
+    parser.add_argument(
+        '--backends', nargs='+', default=['pil', 'cv2'], type=str
+    )
+    return parser.parse_args(argv)
+
+
+def images_per_second(loader, transform, paths):
+    start = time.perf_counter()
+    for path in paths:
+        transform(loader(path))
+    return len(paths) / (time.perf_counter() - start)
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    paths = path_utils.index_image_folder(
+        args.validation_dir, labelled=True, recursive=True
+    ).paths
+    if len(paths) == 0:
+        sys.exit('Found no images in %s.' % args.validation_dir)
+    paths = paths[:args.num_images]
+    transform = torch_transforms.Compose([
+        cv2_transforms.Resize(args.target_size),
+        cv2_transforms.CenterCrop(args.target_size),
+    ])
+
+    def full_loader(path):
+        return np.asarray(tdatasets.folder.pil_loader(path)).copy()
+
+    loaders = [('full PIL', full_loader)]
+    for backend in args.backends:
+        loaders.append((
+            'JpegLoader (%s)' % backend,
+            image_loaders.JpegLoader(args.target_size, backend=backend)
+        ))
+    # a warm up of the disk cache
+    images_per_second(full_loader, transform, paths)
+    for name, loader in loaders:
+        print('%-24s %10.2f images/s' % (
+            name, images_per_second(loader, transform, paths)
+        ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
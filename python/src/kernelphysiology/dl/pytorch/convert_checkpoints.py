@@ -0,0 +1,44 @@
+"""
+Converting training checkpoints to slim, weights only, checkpoints.
+"""
+
+import os
+import sys
+import argparse
+
+from kernelphysiology.dl.pytorch.models import checkpoint_utils
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Slimming checkpoints')
+    parser.add_argument(
+        'checkpoints', nargs='+', type=str,
+        help='The training checkpoints (e.g. model_best.pth.tar)'
+    )
+    parser.add_argument(
+        '--out_dir', type=str, default=None,
+        help='The output directory (default: next to each checkpoint)'
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+    for checkpoint_path in args.checkpoints:
+        if not os.path.isfile(checkpoint_path):
+            sys.exit('Checkpoint %s does not exist.' % checkpoint_path)
+        out_path = checkpoint_utils.slim_path(checkpoint_path)
+        if args.out_dir is not None:
+            out_path = os.path.join(args.out_dir, os.path.basename(out_path))
+        checkpoint_utils.convert_checkpoint(checkpoint_path, out_path)
+        print('%s -> %s (%.1f MB -> %.1f MB)' % (
+            checkpoint_path, out_path,
+            os.path.getsize(checkpoint_path) / 2 ** 20,
+            os.path.getsize(out_path) / 2 ** 20
+        ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -9,17 +9,120 @@ import random
 from scipy.io import loadmat
 from PIL import Image
 
+import torch
 from torchvision import datasets as tdatasets
+import torchvision.transforms as torch_transforms
 
 from kernelphysiology.utils import path_utils
+from kernelphysiology.dl.pytorch.datasets import image_loaders
+
+
+# the imgout of the samples of single_output datasets, which is their imgin
+SAME_AS_INPUT = True
+
+
+def _is_identity(transform):
+    if transform is None:
+        return True
+    elif isinstance(transform, torch_transforms.Compose):
+        return all(_is_identity(t) for t in transform.transforms)
+    return getattr(transform, 'identity', False)
+
+
+def apply_copy_on_write(fun, img):
+    """
+    Applies fun to a read-only view of img, so img can stay shared with the
+    other output. Only if fun writes into its input, it gets its own copy.
+    """
+    if _is_identity(fun):
+        return img
+    elif not isinstance(img, np.ndarray):
+        return fun(img)
+    view = img.view()
+    view.flags.writeable = False
+    try:
+        out = fun(view)
+    except ValueError as e:
+        if 'read-only' not in str(e):
+            raise
+        return fun(img.copy())
+    return img if out is view else out
+
+
+def paired_images(img, intransform, outtransform, transform):
+    """
+    The imgin/imgout of one image. Both share the image buffer until one of
+    the transforms changes it, if they are still the same image the shared
+    transform is applied once.
+    """
+    img = np.asarray(img)
+    imgin = apply_copy_on_write(intransform, img)
+    imgout = apply_copy_on_write(outtransform, img)
+    if imgin is imgout:
+        if transform is not None:
+            imgin = transform([imgin])[0]
+        return imgin, imgin
+    if transform is not None:
+        imgin, imgout = transform([imgin, imgout])
+    return imgin, imgout
+
+
+def unpack_output(imgin, imgout):
+    """The imgout of a batch, which is imgin for single_output datasets."""
+    if imgout.dtype == torch.bool and imgout.dim() == 1:
+        return imgin
+    return imgout
+
+
+class IndexedImageFolder(tdatasets.ImageFolder):
+    """
+    torchvision's ImageFolder reading its samples from the cached directory
+    index of path_utils.index_image_folder instead of walking the tree.
+    """
+
+    def __init__(self, root, transform=None, target_transform=None,
+                 loader=tdatasets.folder.default_loader, is_valid_file=None,
+                 extensions=None):
+        if is_valid_file is not None:
+            super(IndexedImageFolder, self).__init__(
+                root, transform=transform, target_transform=target_transform,
+                loader=loader, is_valid_file=is_valid_file
+            )
+            return
+        tdatasets.VisionDataset.__init__(
+            self, root, transform=transform, target_transform=target_transform
+        )
+        if extensions is None:
+            extensions = tdatasets.folder.IMG_EXTENSIONS
+        index = path_utils.index_image_folder(
+            self.root, extensions=extensions, labelled=True, recursive=True
+        )
+        if len(index) == 0:
+            raise RuntimeError('Found 0 files in subfolders of: %s' % root)
+
+        self.loader = loader
+        self.extensions = extensions
+        self.classes = index.classes
+        self.class_to_idx = {c: i for i, c in enumerate(index.classes)}
+        self.samples = list(zip(index.paths, index.labels))
+        self.targets = index.labels
+        self.imgs = self.samples
 
 
-class ImageFolder(tdatasets.ImageFolder):
-    def __init__(self, intransform=None, outtransform=None, **kwargs):
+class ImageFolder(IndexedImageFolder):
+    """
+    With single_output and no in/out-transforms, imgout is returned as
+    SAME_AS_INPUT instead of a second copy of imgin (see unpack_output).
+    """
+
+    def __init__(self, intransform=None, outtransform=None,
+                 single_output=False, **kwargs):
         super(ImageFolder, self).__init__(**kwargs)
         self.imgs = self.samples
         self.intransform = intransform
         self.outtransform = outtransform
+        self.single_output = single_output and _is_identity(
+            intransform) and _is_identity(outtransform)
 
     def __getitem__(self, index):
         """
@@ -31,16 +134,12 @@ class ImageFolder(tdatasets.ImageFolder):
              original image after applied manipulations.
         """
         path, class_target = self.samples[index]
-        imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
-        imgout = imgin.copy()
-        if self.intransform is not None:
-            imgin = self.intransform(imgin)
-        if self.outtransform is not None:
-            imgout = self.outtransform(imgout)
-
-        if self.transform is not None:
-            imgin, imgout = self.transform([imgin, imgout])
+        imgin, imgout = paired_images(
+            self.loader(path), self.intransform, self.outtransform,
+            self.transform
+        )
+        if self.single_output:
+            imgout = SAME_AS_INPUT
 
         # right now we're not using the class target, but perhaps in the future
         if self.target_transform is not None:
@@ -50,13 +149,23 @@ class ImageFolder(tdatasets.ImageFolder):
 
 
 class OneFolder(tdatasets.VisionDataset):
-    def __init__(self, intransform=None, outtransform=None, **kwargs):
+    """
+    With single_output and no in/out-transforms, imgout is returned as
+    SAME_AS_INPUT instead of a second copy of imgin (see unpack_output).
+    """
+
+    def __init__(self, intransform=None, outtransform=None, loader=None,
+                 single_output=False, **kwargs):
         super(OneFolder, self).__init__(**kwargs)
-        self.samples = path_utils.image_in_folder(self.root)
+        self.samples = path_utils.index_image_folder(
+            self.root, labelled=False
+        ).paths
         print('Read %d images.' % len(self.samples))
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
         self.intransform = intransform
         self.outtransform = outtransform
+        self.single_output = single_output and _is_identity(
+            intransform) and _is_identity(outtransform)
 
     def __getitem__(self, index):
         """
@@ -68,16 +177,12 @@ class OneFolder(tdatasets.VisionDataset):
              original image after applied manipulations.
         """
         path = self.samples[index]
-        imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
-        imgout = imgin.copy()
-        if self.intransform is not None:
-            imgin = self.intransform(imgin)
-        if self.outtransform is not None:
-            imgout = self.outtransform(imgout)
-
-        if self.transform is not None:
-            imgin, imgout = self.transform([imgin, imgout])
+        imgin, imgout = paired_images(
+            self.loader(path), self.intransform, self.outtransform,
+            self.transform
+        )
+        if self.single_output:
+            imgout = SAME_AS_INPUT
 
         return imgin, imgout, path
 
@@ -93,9 +198,10 @@ class CategoryImages(OneFolder):
 
 class CocoDetection(tdatasets.CocoDetection):
 
-    def __init__(self, intransform=None, outtransform=None, **kwargs):
+    def __init__(self, intransform=None, outtransform=None, loader=None,
+                 **kwargs):
         super(CocoDetection, self).__init__(**kwargs)
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
         self.intransform = intransform
         self.outtransform = outtransform
 
@@ -108,7 +214,7 @@ class CocoDetection(tdatasets.CocoDetection):
         path = os.path.join(self.root, coco.loadImgs(img_id)[0]['file_name'])
 
         imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
+        imgin = image_loaders.writable_array(imgin)
 
         if self.intransform is not None:
             imgin = self.intransform(imgin)
@@ -125,18 +231,19 @@ class CocoDetection(tdatasets.CocoDetection):
 
 
 class VOCSegmentation(tdatasets.VOCSegmentation):
-    def __init__(self, intransform=None, outtransform=None, **kwargs):
+    def __init__(self, intransform=None, outtransform=None, loader=None,
+                 **kwargs):
         super(VOCSegmentation, self).__init__(**kwargs)
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
         self.intransform = intransform
         self.outtransform = outtransform
 
     def __getitem__(self, index):
         path = self.images[index]
         imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
+        imgin = image_loaders.writable_array(imgin)
         imgout = Image.open(self.masks[index])
-        imgout = np.asarray(imgout).copy()
+        imgout = image_loaders.writable_array(imgout)
 
         if self.intransform is not None:
             imgin = self.intransform(imgin)
@@ -153,20 +260,31 @@ class VOCSegmentation(tdatasets.VOCSegmentation):
 
 
 class CelebA(tdatasets.CelebA):
-    def __init__(self, intransform=None, outtransform=None, **kwargs):
+    """
+    With single_output and no in/out-transforms, imgout is returned as
+    SAME_AS_INPUT instead of a second copy of imgin (see unpack_output).
+    """
+
+    def __init__(self, intransform=None, outtransform=None, loader=None,
+                 single_output=False, **kwargs):
         super(CelebA, self).__init__(**kwargs)
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
         self.intransform = intransform
         self.outtransform = outtransform
+        self.single_output = single_output and _is_identity(
+            intransform) and _is_identity(outtransform)
 
     def __getitem__(self, index):
         path = os.path.join(
             self.root, self.base_folder, "img_align_celeba",
             self.filename[index]
         )
-        imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
-        imgout = imgin.copy()
+        imgin, imgout = paired_images(
+            self.loader(path), self.intransform, self.outtransform,
+            self.transform
+        )
+        if self.single_output:
+            imgout = SAME_AS_INPUT
 
         target = []
         for t in self.target_type:
@@ -191,24 +309,16 @@ class CelebA(tdatasets.CelebA):
         else:
             target = None
 
-        if self.intransform is not None:
-            imgin = self.intransform(imgin)
-        if self.outtransform is not None:
-            imgout = self.outtransform(imgout)
-
-        if self.transform is not None:
-            imgin, imgout = self.transform([imgin, imgout])
-
         return imgin, imgout, path
 
 
 class BSDSEdges(tdatasets.VisionDataset):
     def __init__(self, img_list='all_imgs.txt', intransform=None,
-                 outtransform=None, **kwargs):
+                 outtransform=None, loader=None, **kwargs):
         super(BSDSEdges, self).__init__(**kwargs)
         self.samples = np.loadtxt(os.path.join(self.root, img_list), dtype=str)
         print('Read %d images.' % len(self.samples))
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
         self.intransform = intransform
         self.outtransform = outtransform
         self.imgs_root = os.path.join(self.root, 'images')
@@ -225,7 +335,7 @@ class BSDSEdges(tdatasets.VisionDataset):
         """
         path = os.path.join(self.imgs_root, self.samples[index] + '.jpg')
         imgin = self.loader(path)
-        imgin = np.asarray(imgin).copy()
+        imgin = image_loaders.writable_array(imgin)
         edge_path = os.path.join(self.gts_root, self.samples[index] + '.mat')
         imgout = loadmat(edge_path)
         gt_ind = random.randint(0, imgout['groundTruth'].shape[1] - 1)
@@ -5,16 +5,17 @@ import logging
 import numpy as np
 import random
 import torch
-from fvcore.common.file_io import PathManager
-
-from detectron2.data import transforms as T
-from detectron2.data import detection_utils as utils
 
 from PIL import Image, ImageOps
 
 from kernelphysiology.utils import imutils
+from kernelphysiology.utils.lazy_imports import lazy_import, lazy_from
 from kernelphysiology.dl.utils.augmentation import get_testing_augmentations
 
+PathManager = lazy_from('fvcore.common.file_io', 'PathManager')
+T = lazy_import('detectron2.data.transforms')
+utils = lazy_import('detectron2.data.detection_utils')
+
 """
 This file contains the default mapping that's applied to "dataset dicts".
 """
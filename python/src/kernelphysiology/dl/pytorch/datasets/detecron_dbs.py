@@ -4,8 +4,10 @@
 
 import os
 
-from detectron2.data import DatasetCatalog, MetadataCatalog
-from detectron2.data.datasets.pascal_voc import CLASS_NAMES, load_voc_instances
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+detectron_data = lazy_import('detectron2.data')
+pascal_voc = lazy_import('detectron2.data.datasets.pascal_voc')
 
 __all__ = ["register_all_pascal_voc_org"]
 
@@ -23,11 +25,14 @@ def register_all_pascal_voc_org(root):
     for name, dirname, split in SPLITS:
         year = 2007 if "2007" in name else 2012
         register_voc_org(name, os.path.join(root, dirname), split, year)
-        MetadataCatalog.get(name).evaluator_type = "pascal_voc"
+        detectron_data.MetadataCatalog.get(name).evaluator_type = "pascal_voc"
 
 
 def register_voc_org(name, dirname, split, year):
-    DatasetCatalog.register(name, lambda: load_voc_instances(dirname, split))
-    MetadataCatalog.get(name).set(
-        thing_classes=CLASS_NAMES, dirname=dirname, year=year, split=split
+    detectron_data.DatasetCatalog.register(
+        name, lambda: pascal_voc.load_voc_instances(dirname, split)
+    )
+    detectron_data.MetadataCatalog.get(name).set(
+        thing_classes=pascal_voc.CLASS_NAMES, dirname=dirname, year=year,
+        split=split
     )
@@ -0,0 +1,104 @@
+"""
+Image loaders decoding JPEGs directly near the size they are used at. The
+JPEG decoder can downscale by 1/2, 1/4 or 1/8 in the DCT domain, which is
+much cheaper than decoding the full image and resizing it afterwards.
+"""
+
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+JPEG_FACTORS = [8, 4, 2]
+
+_CV2_REDUCED_FLAGS = {
+    2: 'IMREAD_REDUCED_COLOR_2', 4: 'IMREAD_REDUCED_COLOR_4',
+    8: 'IMREAD_REDUCED_COLOR_8'
+}
+
+
+def reduction_factor(img_size, min_size):
+    """
+    The largest JPEG scale factor for which the shorter edge of the decoded
+    image is not smaller than min_size.
+    """
+    if min_size is None:
+        return 1
+    shorter = min(img_size)
+    for factor in JPEG_FACTORS:
+        if shorter // factor >= min_size:
+            return factor
+    return 1
+
+
+def writable_array(img):
+    """np.asarray(img).copy(), without copying already writable arrays."""
+    img = np.asarray(img)
+    if not img.flags.writeable:
+        img = img.copy()
+    return img
+
+
+class JpegLoader(object):
+    """
+    Loading an image as an RGB (writable) numpy array. JPEGs are decoded at
+    the smallest DCT scale whose shorter edge is at least min_size, other
+    formats at their full size.
+
+    For a Resize(min_size) and CenterCrop this gives (nearly) the same
+    images. Random resized crops of small areas should use a larger min_size
+    (e.g. target_size / sqrt(scale[0])) not to upsample the crops.
+
+    Args:
+        min_size: the minimum shorter edge, None decodes at the full size.
+        backend: 'pil' uses PIL's draft, 'cv2' OpenCV's IMREAD_REDUCED_COLOR
+         (BGR converted in place to RGB).
+    """
+
+    def __init__(self, min_size=None, backend='pil'):
+        if backend not in ['pil', 'cv2']:
+            raise ValueError('Unsupported backend %s.' % backend)
+        if backend == 'cv2' and cv2 is None:
+            raise ImportError('The cv2 backend requires opencv-python.')
+        self.min_size = min_size
+        self.backend = backend
+
+    def _pil_load(self, path):
+        with open(path, 'rb') as f:
+            img = Image.open(f)
+            if img.format == 'JPEG':
+                factor = reduction_factor(img.size, self.min_size)
+                if factor > 1:
+                    img.draft(
+                        'RGB', (img.size[0] // factor, img.size[1] // factor)
+                    )
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            # one copy out of the decoder, a writable one
+            return np.array(img)
+
+    def _cv2_load(self, path):
+        factor = 1
+        with Image.open(path) as img:
+            # only the header is read
+            if img.format == 'JPEG':
+                factor = reduction_factor(img.size, self.min_size)
+        if factor > 1:
+            flag = getattr(cv2, _CV2_REDUCED_FLAGS[factor])
+        else:
+            flag = cv2.IMREAD_COLOR
+        img = cv2.imread(path, flag)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
+
+    def __call__(self, path):
+        if self.backend == 'cv2':
+            return self._cv2_load(path)
+        return self._pil_load(path)
+
+    def __repr__(self):
+        return self.__class__.__name__ + '(min_size={0}, backend={1})'.format(
+            self.min_size, self.backend
+        )
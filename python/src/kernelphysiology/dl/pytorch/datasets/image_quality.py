@@ -14,14 +14,89 @@ import torch
 from torchvision import datasets as tdatasets
 
 from kernelphysiology.utils import path_utils
+from kernelphysiology.dl.pytorch.datasets import image_loaders
+
+
+BAPPS_PATCH_SIZE = 256
+
+
+def _bapps_cache_files(cache_dir, task, split, distortion):
+    prefix = os.path.join(cache_dir, '%s_%s_%s' % (task, split, distortion))
+    return prefix + '_imgs.npy', prefix + '_gts.npy'
+
+
+def pack_bapps(root, task, split, distortion, cache_dir):
+    """
+    Packs all patches of one split/distortion into one uint8 array of shape
+    (N, P, 256, 256, 3) plus a vector of N judgements. Existing packs are
+    reused.
+    """
+    imgs_file, gts_file = _bapps_cache_files(cache_dir, task, split, distortion)
+    if os.path.exists(imgs_file) and os.path.exists(gts_file):
+        return imgs_file, gts_file
+    path_utils.create_dir(cache_dir)
+
+    if task == '2afc':
+        db = BAPPS2afc(root=root, split=split, distortion=distortion)
+    else:
+        db = BAPPSjnd(root=root, split=split, distortion=distortion)
+    print('Packing %s %s %s into %s' % (task, split, distortion, imgs_file))
+    patches, _ = db.read_patches(0)
+    # writing to a temporary file so interrupted packs are never reused
+    tmp_file = imgs_file + '.tmp'
+    imgs = np.lib.format.open_memmap(
+        tmp_file, mode='w+', dtype=np.uint8,
+        shape=(len(db), len(patches), BAPPS_PATCH_SIZE, BAPPS_PATCH_SIZE, 3)
+    )
+    gts = np.zeros(len(db), dtype=np.float32)
+    for i in range(len(db)):
+        patches, gt = db.read_patches(i)
+        imgs[i] = np.stack(patches)
+        gts[i] = gt
+    imgs.flush()
+    del imgs
+    os.rename(tmp_file, imgs_file)
+    np.save(gts_file, gts)
+    return imgs_file, gts_file
+
+
+class _PackedBAPPS(object):
+    """
+    Memory-mapped packs of several distortions indexed as one dataset.
+    """
+
+    def __init__(self, root, task, split, distortions, cache_dir):
+        self.imgs = []
+        self.gts = []
+        for dist in distortions:
+            imgs_file, gts_file = pack_bapps(
+                root, task, split, dist, cache_dir
+            )
+            self.imgs.append(np.load(imgs_file, mmap_mode='r'))
+            self.gts.append(np.load(gts_file))
+        lens = np.array([len(gts) for gts in self.gts])
+        self.ends = np.cumsum(lens)
+        self.starts = self.ends - lens
+
+    def read_patches(self, index):
+        dist_ind = np.searchsorted(self.ends, index, side='right')
+        local_ind = index - self.starts[dist_ind]
+        # one copy of the sample, writable and detached from the file
+        imgs = np.array(self.imgs[dist_ind][local_ind])
+        return [*imgs], self.gts[dist_ind][local_ind]
+
+    def __len__(self):
+        return int(self.ends[-1])
 
 
 class BAPPS2afc(tdatasets.VisionDataset):
-    def __init__(self, split, distortion=None, concat=-1, **kwargs):
+    def __init__(self, split, distortion=None, concat=-1, cache_dir=None,
+                 loader=None, **kwargs):
         super(BAPPS2afc, self).__init__(**kwargs)
         self.split = split
         self.concat = concat
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
+        db_root = self.root
         self.root = os.path.join(self.root, '2afc', split)
         if distortion is None:
             distortion = [
@@ -32,35 +107,49 @@ class BAPPS2afc(tdatasets.VisionDataset):
             distortion = [distortion]
         self.ref_imgs = []
         self.ref_dist = []
-        for dist in distortion:
-            dist_paths = path_utils.image_in_folder(
-                os.path.join(self.root, dist) + '/ref/'
+        self.packed = None
+        if cache_dir is not None:
+            self.packed = _PackedBAPPS(
+                db_root, '2afc', split, distortion, cache_dir
             )
+            print('Read %d packed images.' % len(self.packed))
+            return
+        for dist in distortion:
+            dist_paths = path_utils.index_image_folder(
+                os.path.join(self.root, dist) + '/ref/', labelled=False
+            ).paths
             self.ref_imgs.extend(dist_paths)
             self.ref_dist.extend([dist] * len(dist_paths))
         print('Read %d images.' % len(self.ref_imgs))
 
-    def __getitem__(self, index):
+    def read_patches(self, index):
+        if self.packed is not None:
+            return self.packed.read_patches(index)
         path_ref = self.ref_imgs[index]
         img_ref = self.loader(path_ref)
-        img_ref = np.asarray(img_ref).copy()
+        img_ref = image_loaders.writable_array(img_ref)
         base_name = ntpath.basename(path_ref)[:-4]
 
         dist_root = os.path.join(self.root, self.ref_dist[index])
         path_p0 = '%s/p0/%s.png' % (dist_root, base_name)
         img_p0 = self.loader(path_p0)
-        img_p0 = np.asarray(img_p0).copy()
+        img_p0 = image_loaders.writable_array(img_p0)
         path_p1 = '%s/p1/%s.png' % (dist_root, base_name)
         img_p1 = self.loader(path_p1)
-        img_p1 = np.asarray(img_p1).copy()
+        img_p1 = image_loaders.writable_array(img_p1)
         # a few images are of size 252, so we convert themt o 256
-        if img_ref.shape[0] != 256:
-            img_ref = cv2.resize(img_ref, (256, 256))
-            img_p0 = cv2.resize(img_p0, (256, 256))
-            img_p1 = cv2.resize(img_p1, (256, 256))
+        if img_ref.shape[0] != BAPPS_PATCH_SIZE:
+            target_size = (BAPPS_PATCH_SIZE, BAPPS_PATCH_SIZE)
+            img_ref = cv2.resize(img_ref, target_size)
+            img_p0 = cv2.resize(img_p0, target_size)
+            img_p1 = cv2.resize(img_p1, target_size)
 
         path_judge = '%s/judge/%s.npy' % (dist_root, base_name)
         gt = np.load(path_judge)[0]
+        return [img_ref, img_p0, img_p1], gt
+
+    def __getitem__(self, index):
+        (img_ref, img_p0, img_p1), gt = self.read_patches(index)
 
         if self.transform is not None:
             img_ref, img_p0, img_p1 = self.transform([img_ref, img_p0, img_p1])
@@ -82,49 +171,72 @@ class BAPPS2afc(tdatasets.VisionDataset):
         return img_ref, img_p0, img_p1, gt
 
     def __len__(self):
+        if self.packed is not None:
+            return len(self.packed)
         return len(self.ref_imgs)
 
 
 class BAPPSjnd(tdatasets.VisionDataset):
-    def __init__(self, split, distortion, **kwargs):
+    def __init__(self, split, distortion, cache_dir=None, loader=None,
+                 **kwargs):
         super(BAPPSjnd, self).__init__(**kwargs)
         self.split = split
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
+        db_root = self.root
         self.root = os.path.join(self.root, 'jnd', split, distortion)
-        self.img0_paths = path_utils.image_in_folder(self.root + '/p0/')
+        self.img0_paths = []
+        self.packed = None
+        if cache_dir is not None:
+            self.packed = _PackedBAPPS(
+                db_root, 'jnd', split, [distortion], cache_dir
+            )
+            print('Read %d packed images.' % len(self.packed))
+            return
+        self.img0_paths = path_utils.index_image_folder(
+            self.root + '/p0/', labelled=False
+        ).paths
         print('Read %d images.' % len(self.img0_paths))
 
-    def __getitem__(self, index):
+    def read_patches(self, index):
+        if self.packed is not None:
+            return self.packed.read_patches(index)
         path0 = self.img0_paths[index]
         img0 = self.loader(path0)
-        img0 = np.asarray(img0).copy()
+        img0 = image_loaders.writable_array(img0)
         base_name = ntpath.basename(path0)[:-4]
 
         path1 = '%s/p1/%s.png' % (self.root, base_name)
         img1 = self.loader(path1)
-        img1 = np.asarray(img1).copy()
+        img1 = image_loaders.writable_array(img1)
         # a few images are of size 252, so we convert themt o 256
-        if img0.shape[0] != 256:
-            img0 = cv2.resize(img0, (256, 256))
-            img1 = cv2.resize(img1, (256, 256))
+        if img0.shape[0] != BAPPS_PATCH_SIZE:
+            target_size = (BAPPS_PATCH_SIZE, BAPPS_PATCH_SIZE)
+            img0 = cv2.resize(img0, target_size)
+            img1 = cv2.resize(img1, target_size)
 
         path_same = '%s/same/%s.npy' % (self.root, base_name)
-        gt = np.load(path_same)
+        gt = np.load(path_same).reshape(-1)[0]
+        return [img0, img1], gt
+
+    def __getitem__(self, index):
+        (img0, img1), gt = self.read_patches(index)
 
         if self.transform is not None:
             img0, img1 = self.transform([img0, img1])
 
-        return img0, img1, gt
+        return img0, img1, np.array([gt])
 
     def __len__(self):
+        if self.packed is not None:
+            return len(self.packed)
         return len(self.img0_paths)
 
 
 class LIVE(tdatasets.VisionDataset):
-    def __init__(self, part, **kwargs):
+    def __init__(self, part, loader=None, **kwargs):
         super(LIVE, self).__init__(**kwargs)
         self.part = part
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
         self.root = os.path.join(self.root, part)
         self.img_dir = os.path.join(self.root, 'imgs')
         self.image_list = loadmat(self.root + '/Imagelists.mat')
@@ -135,13 +247,13 @@ class LIVE(tdatasets.VisionDataset):
         img_name = self.image_list['distimgs'][index][0][0]
         img_path = os.path.join(self.img_dir, img_name)
         img = self.loader(img_path)
-        img = np.asarray(img).copy()
+        img = image_loaders.writable_array(img)
 
         ref_ind = self.image_list['ref4dist'][index][0] - 1
         ref_name = self.image_list['refimgs'][ref_ind][0][0]
         ref_path = os.path.join(self.img_dir, ref_name)
         ref = self.loader(ref_path)
-        ref = np.asarray(ref).copy()
+        ref = image_loaders.writable_array(ref)
 
         mos = self.scores['DMOSscores'][0][index]
         zscore = self.scores['Zscores'][0][index]
@@ -156,10 +268,10 @@ class LIVE(tdatasets.VisionDataset):
 
 
 class AADB(tdatasets.VisionDataset):
-    def __init__(self, split, **kwargs):
+    def __init__(self, split, loader=None, **kwargs):
         super(AADB, self).__init__(**kwargs)
         self.split = split
-        self.loader = tdatasets.folder.pil_loader
+        self.loader = tdatasets.folder.pil_loader if loader is None else loader
         self.img_dir = os.path.join(self.root, self.split)
         info = loadmat(self.root + '/AADBinfo.mat')
         self.img_list = info['%sNameList' % self.split]
@@ -170,7 +282,7 @@ class AADB(tdatasets.VisionDataset):
         img_name = self.img_list[0][index][0]
         img_path = os.path.join(self.img_dir, img_name)
         img = self.loader(img_path)
-        img = np.asarray(img).copy()
+        img = image_loaders.writable_array(img)
 
         score = self.scores[0][index]
 
@@ -11,10 +11,11 @@ import torchvision
 
 from PIL import Image
 
-from pycocotools import mask as coco_mask
-
 from kernelphysiology.dl.pytorch.utils.transforms import Compose
 from kernelphysiology.dl.pytorch.datasets import shadows_db
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+coco_mask = lazy_import('pycocotools.mask')
 
 
 class FilterAndRemapCocoCategories(object):
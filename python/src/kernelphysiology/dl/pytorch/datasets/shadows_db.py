@@ -2,40 +2,20 @@
 Handling all shadow related datasetes.
 """
 
-import glob
-
 from PIL import Image
 
 from torchvision.datasets.vision import VisionDataset
 
-IMG_EXTENSIONS = [
-    '.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', 'webp'
-]
-
-
-def _read_extension(root, extension):
-    img_paths = []
-    img_paths.extend(
-        sorted(glob.glob(root + '/*' + extension))
-    )
-    # with upper case
-    img_paths.extend(
-        sorted(glob.glob(root + '/*' + extension.upper()))
-    )
-    return img_paths
+from kernelphysiology.utils import path_utils
 
 
 def _read_paths(root, extensions=None):
-    if extensions is None:
-        extensions = IMG_EXTENSIONS
-
-    img_paths = []
-    target_paths = []
-    # reading all extensions
-    for extension in extensions:
-        img_paths.extend(_read_extension(root + '/imgs/', extension))
-        target_paths.extend(_read_extension(root + '/masks/', extension))
-
+    img_paths = path_utils.index_image_folder(
+        root + '/imgs/', extensions, labelled=False
+    ).paths
+    target_paths = path_utils.index_image_folder(
+        root + '/masks/', extensions, labelled=False
+    ).paths
     return img_paths, target_paths
 
 
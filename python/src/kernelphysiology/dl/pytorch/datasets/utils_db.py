@@ -10,28 +10,45 @@ import torch
 import torchvision.datasets as datasets
 import torchvision.transforms as torch_transforms
 
+from kernelphysiology.dl.pytorch.datasets import data_loaders
 from kernelphysiology.dl.pytorch.utils import cv2_transforms
 from kernelphysiology.dl.pytorch.utils import preprocessing
-from kernelphysiology.dl.pytorch.utils import segmentation_utils
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+segmentation_utils = lazy_import(
+    'kernelphysiology.dl.pytorch.utils.segmentation_utils'
+)
 
 folder_dbs = ['imagenet', 'fruits', 'leaves', 'land', 'vggface2']
 
 
+def get_train_crop_scale(dataset_name):
+    """The scale range of the random resized crop of the folder datasets."""
+    if 'imagenet' in dataset_name:
+        return 0.08, 1.0
+    return 0.50, 1.0
+
+
 def prepare_transformations_train(dataset_name, colour_transformations,
                                   other_transformations, chns_transformation,
-                                  normalize, target_size):
-    if 'cifar' in dataset_name or dataset_name in folder_dbs:
+                                  normalize, target_size,
+                                  batch_augmentation=False):
+    if batch_augmentation:
+        # the crop, flip and normalisation are of the collated batch, see
+        # batch_transforms.BatchAugmentation
+        if (dataset_name not in folder_dbs or len(other_transformations) > 0
+                or len(chns_transformation) > 0):
+            sys.exit(
+                'Batch augmentation is only supported for the folder '
+                'datasets without other or channel transformations.'
+            )
+        transformations = torch_transforms.Compose([*colour_transformations])
+    elif 'cifar' in dataset_name or dataset_name in folder_dbs:
         if 'cifar' in dataset_name:
             size_transform = cv2_transforms.RandomCrop(target_size, padding=4)
-        elif 'imagenet' in dataset_name:
-            scale = (0.08, 1.0)
-            size_transform = cv2_transforms.RandomResizedCrop(
-                target_size, scale=scale
-            )
         else:
-            scale = (0.50, 1.0)
             size_transform = cv2_transforms.RandomResizedCrop(
-                target_size, scale=scale
+                target_size, scale=get_train_crop_scale(dataset_name)
             )
         transformations = torch_transforms.Compose([
             size_transform,
@@ -107,7 +124,7 @@ def prepare_transformations_test(dataset_name, colour_transformations,
 
 def get_validation_dataset(dataset_name, valdir, vision_type, colour_space,
                            other_transformations, normalize, target_size,
-                           task=None):
+                           task=None, loader=None):
     colour_transformations = preprocessing.colour_transformation(
         vision_type, colour_space
     )
@@ -120,6 +137,8 @@ def get_validation_dataset(dataset_name, valdir, vision_type, colour_space,
         other_transformations, chns_transformation,
         normalize, target_size, task=task
     )
+    # e.g. image_loaders.JpegLoader(target_size) decodes near the target size
+    image_loader = pil2numpy_loader if loader is None else loader
     if task == 'segmentation' or 'voc' in dataset_name:
         # TODO: dataset shouldn't return num classes
         data_reading_kwargs = {
@@ -131,8 +150,8 @@ def get_validation_dataset(dataset_name, valdir, vision_type, colour_space,
             dataset_name, valdir, 'val', **data_reading_kwargs
         )
     elif dataset_name in folder_dbs:
-        validation_dataset = datasets.ImageFolder(
-            valdir, transformations, loader=pil2numpy_loader
+        validation_dataset = data_loaders.IndexedImageFolder(
+            valdir, transformations, loader=image_loader
         )
     elif dataset_name == 'cifar10':
         validation_dataset = datasets.CIFAR10(
@@ -146,12 +165,13 @@ def get_validation_dataset(dataset_name, valdir, vision_type, colour_space,
         # FIXME: colour transformation in lms is different from rgb or lab
         data_loader_validation = lambda x: npy_data_loader(x)
 
-        validation_dataset = datasets.DatasetFolder(
-            valdir, data_loader_validation, ('.npy',), transformations
+        validation_dataset = data_loaders.IndexedImageFolder(
+            valdir, transformations, loader=data_loader_validation,
+            extensions=('.npy',)
         )
     elif 'wcs_jpg' in dataset_name:
-        validation_dataset = datasets.ImageFolder(
-            valdir, transformations, loader=pil2numpy_loader
+        validation_dataset = data_loaders.IndexedImageFolder(
+            valdir, transformations, loader=image_loader
         )
     else:
         sys.exit('Dataset %s is not supported.' % dataset_name)
@@ -160,7 +180,8 @@ def get_validation_dataset(dataset_name, valdir, vision_type, colour_space,
 
 # TODO: train and validation merge together
 def get_train_dataset(dataset_name, traindir, vision_type, colour_space,
-                      other_transformations, normalize, target_size):
+                      other_transformations, normalize, target_size,
+                      loader=None, batch_augmentation=False):
     colour_transformations = preprocessing.colour_transformation(
         vision_type, colour_space
     )
@@ -171,11 +192,12 @@ def get_train_dataset(dataset_name, traindir, vision_type, colour_space,
     transformations = prepare_transformations_train(
         dataset_name, colour_transformations,
         other_transformations, chns_transformation,
-        normalize, target_size
+        normalize, target_size, batch_augmentation=batch_augmentation
     )
+    image_loader = pil2numpy_loader if loader is None else loader
     if dataset_name in folder_dbs:
-        train_dataset = datasets.ImageFolder(
-            traindir, transformations, loader=pil2numpy_loader
+        train_dataset = data_loaders.IndexedImageFolder(
+            traindir, transformations, loader=image_loader
         )
     elif dataset_name == 'cifar10':
         train_dataset = datasets.CIFAR10(
@@ -188,12 +210,13 @@ def get_train_dataset(dataset_name, traindir, vision_type, colour_space,
     elif 'wcs_lms' in dataset_name:
         data_loader_train = lambda x: npy_data_loader(x)
 
-        train_dataset = datasets.DatasetFolder(
-            traindir, data_loader_train, ('.npy',), transformations
+        train_dataset = data_loaders.IndexedImageFolder(
+            traindir, transformations, loader=data_loader_train,
+            extensions=('.npy',)
         )
     elif 'wcs_jpg' in dataset_name:
-        train_dataset = datasets.ImageFolder(
-            traindir, transformations, loader=pil2numpy_loader
+        train_dataset = data_loaders.IndexedImageFolder(
+            traindir, transformations, loader=image_loader
         )
     else:
         sys.exit('Dataset %s is not supported.' % dataset_name)
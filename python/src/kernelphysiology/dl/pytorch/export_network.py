@@ -0,0 +1,61 @@
+"""
+Exporting a configured network to TorchScript and ONNX.
+"""
+
+import sys
+import argparse
+
+from kernelphysiology.dl.pytorch.models import model_utils
+from kernelphysiology.dl.pytorch.models import model_export
+from kernelphysiology.dl.utils import argument_groups
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Exporting a network')
+    parser.add_argument(
+        '--network_name', type=str, required=True,
+        help='A checkpoint or the name of a pretrained network'
+    )
+    parser.add_argument(
+        '--task_type', type=str, default='classification',
+        choices=['classification', 'segmentation']
+    )
+    parser.add_argument('--num_classes', type=int, default=1000)
+    parser.add_argument(
+        '--out_file', type=str, required=True,
+        help='The path of the artifacts without extension'
+    )
+    parser.add_argument(
+        '--formats', nargs='+', type=str, default=['torchscript', 'onnx'],
+        choices=['torchscript', 'onnx']
+    )
+    parser.add_argument(
+        '--target_size', type=int, default=None,
+        help='Size of the example input (default: of the checkpoint)'
+    )
+    parser.add_argument('--opset_version', type=int, default=13)
+    argument_groups.get_network_manipulation_group(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    if args.lesion_sweep is not None:
+        sys.exit('Lesion sweeps cannot be exported.')
+    (model, target_size) = model_utils.which_network(
+        args.network_name, args.task_type, num_classes=args.num_classes,
+        kill_kernels=args.kill_kernels, kill_planes=args.kill_planes,
+        kill_lines=args.kill_lines
+    )
+    if args.target_size is not None:
+        target_size = args.target_size
+    artifacts = model_export.export_network(
+        model, args.out_file, target_size, task_type=args.task_type,
+        formats=args.formats, opset_version=args.opset_version
+    )
+    for artifact in artifacts:
+        print('Exported %s' % artifact)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -19,6 +19,7 @@ from kernelphysiology.dl.pytorch.utils.misc import AverageMeter
 from kernelphysiology.dl.pytorch.utils.misc import save_checkpoint
 from kernelphysiology.dl.pytorch.utils.misc import prepare_device
 from kernelphysiology.dl.pytorch.utils.cv2_transforms import NormalizeInverse
+from kernelphysiology.dl.pytorch.utils import saliency_metrics
 from kernelphysiology.dl.utils import prepare_training
 from kernelphysiology.utils.system_utils import set_visible_gpus
 from kernelphysiology.utils.path_utils import write_pickle
@@ -179,6 +180,19 @@ def predict(validation_loader, model, criterion, args):
 
     all_eucs = np.zeros(validation_loader.dataset.num_sequences)
     all_preds = np.zeros((validation_loader.dataset.num_sequences, 2))
+    # the saliency metrics of the predicted heat maps, against the target
+    # point (AUCs and NSS) or the target heat map (CC and SIM)
+    metric_funs = {
+        'auc_judd': saliency_metrics.auc_judd,
+        'auc_borji': saliency_metrics.auc_borji,
+        'nss': saliency_metrics.nss,
+        'cc': saliency_metrics.cc,
+        'sim': saliency_metrics.sim
+    }
+    all_metrics = {
+        key: np.zeros(validation_loader.dataset.num_sequences)
+        for key in metric_funs.keys()
+    }
 
     with torch.no_grad():
         end = time.time()
@@ -202,6 +216,15 @@ def predict(validation_loader, model, criterion, args):
             batch_time.update(time.time() - end)
             end = time.time()
 
+            fixations = saliency_metrics.argmax_fixations(y_target)
+            for key, metric_fun in metric_funs.items():
+                if key in ['cc', 'sim']:
+                    batch_metric = metric_fun(output, y_target)
+                else:
+                    batch_metric = metric_fun(output, fixations)
+                all_metrics[key][out_ind:out_ind + output.shape[0]] = \
+                    batch_metric.cpu().numpy()
+
             for b in range(y_target.shape[0]):
                 gt = y_target[b].squeeze()
                 pred = output[b].squeeze()
@@ -231,7 +254,11 @@ def predict(validation_loader, model, criterion, args):
                 loss=losses, euc=eucs
             )
         )
-    preds_out = {'eucs': all_eucs, 'preds': all_preds}
+        print(' * ' + ' '.join(
+            '%s %.3f' % (key, np.nanmean(metric[:out_ind]))
+            for key, metric in all_metrics.items()
+        ))
+    preds_out = {'eucs': all_eucs, 'preds': all_preds, **all_metrics}
     return preds_out
 
 
@@ -0,0 +1,95 @@
+"""
+Slim (weights only) checkpoints and an in-process cache of loaded networks.
+"""
+
+import os
+import copy
+import hashlib
+import collections
+
+import torch
+
+SLIM_KEYS = ['arch', 'customs', 'preprocessing', 'target_size', 'state_dict']
+SLIM_EXTENSION = '.slim.pth'
+
+
+def slim_checkpoint(checkpoint):
+    """Drops the optimiser and other training states of a checkpoint."""
+    slim = {key: checkpoint[key] for key in SLIM_KEYS if key in checkpoint}
+    slim['state_dict'] = collections.OrderedDict(
+        (key, val.detach().cpu().contiguous())
+        for key, val in slim['state_dict'].items()
+    )
+    slim['slim'] = True
+    return slim
+
+
+def slim_path(checkpoint_path):
+    for extension in ['.pth.tar', '.pth', '.tar']:
+        if checkpoint_path.endswith(extension):
+            return checkpoint_path[:-len(extension)] + SLIM_EXTENSION
+    return checkpoint_path + SLIM_EXTENSION
+
+
+def convert_checkpoint(checkpoint_path, out_path=None):
+    """Writes the slim version of a training checkpoint, returns its path."""
+    if out_path is None:
+        out_path = slim_path(checkpoint_path)
+    checkpoint = load_checkpoint(checkpoint_path)
+    torch.save(slim_checkpoint(checkpoint), out_path)
+    return out_path
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Memory-maps the checkpoint, tensors are only read from the disk when
+    accessed (e.g. the optimiser state of a training checkpoint is not).
+    Slim checkpoints are loaded with weights_only. Checkpoints in the legacy
+    (non-zip) serialisation are read fully.
+    """
+    try:
+        checkpoint = torch.load(
+            checkpoint_path, map_location='cpu', mmap=True,
+            weights_only=checkpoint_path.endswith(SLIM_EXTENSION)
+        )
+    except RuntimeError:
+        checkpoint = torch.load(checkpoint_path, map_location='cpu')
+    return checkpoint
+
+
+def file_key(file_path):
+    """
+    Identifies the content of a file by its device, inode, size and
+    modification time, without reading it.
+    """
+    stat = os.stat(file_path)
+    identity = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    return hashlib.md5(repr(identity).encode()).hexdigest()
+
+
+class ModelCache(object):
+    """
+    Least recently used cache of networks. Every load returns a copy, so
+    callers can lesion or train it without changing the cached network.
+    """
+
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+
+    def load(self, key, load_fun):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            entry = self.entries[key]
+        else:
+            entry = load_fun()
+            self.entries[key] = entry
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return copy.deepcopy(entry)
+
+    def clear(self):
+        self.entries.clear()
+
+
+MODEL_CACHE = ModelCache()
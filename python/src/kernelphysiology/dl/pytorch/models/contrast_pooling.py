@@ -0,0 +1,223 @@
+"""
+Local contrast and contrast pooling blocks.
+
+The local contrast of a window is its variance, computed as E[x^2] - E[x]^2
+with one pass of a box filter rather than two chained convolutions.
+"""
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def conv1x1(in_planes, out_planes, stride=1):
+    """1x1 convolution"""
+    return nn.Conv2d(in_planes, out_planes, kernel_size=1, stride=stride,
+                     bias=False)
+
+
+def conv_avg(in_planes, kernel_size, stride=1, groups=None, dilation=1):
+    if groups is None:
+        groups = in_planes
+    num_pixels = kernel_size * kernel_size * (in_planes / groups)
+    initial_value = 1.0 / num_pixels
+    conv_kernel = nn.Conv2d(in_planes, in_planes, kernel_size=3, stride=stride,
+                            padding=dilation, groups=groups, bias=False,
+                            dilation=dilation)
+    nn.init.constant_(conv_kernel.weight, initial_value)
+    conv_kernel.requires_grad = False
+    return conv_kernel
+
+
+def box_mean(x, kernel_size=3, stride=1):
+    """Zero-padded mean of every kernel_size window, as conv_avg."""
+    padding = kernel_size // 2
+    # the weight below depends on the runtime number of channels, which the
+    # ONNX exporter can not turn into a kernel of known shape
+    if x.is_cuda or torch.jit.is_tracing() or torch.onnx.is_in_onnx_export():
+        return F.avg_pool2d(
+            x, kernel_size, stride=stride, padding=padding,
+            count_include_pad=True
+        )
+    # on the CPU a depthwise convolution is much faster than avg_pool2d
+    planes = x.shape[1]
+    weight = x.new_full(
+        (planes, 1, kernel_size, kernel_size), 1.0 / kernel_size ** 2
+    )
+    return F.conv2d(x, weight, stride=stride, padding=padding, groups=planes)
+
+
+def _local_variance(x, kernel_size, stride):
+    # both moments in one pass of the box filter
+    x_moments = box_mean(torch.cat((x, x * x), dim=1), kernel_size, stride)
+    x_mean, x_sqr_mean = x_moments.chunk(2, dim=1)
+    x_var = x_sqr_mean - x_mean * x_mean
+    return x_var.clamp(min=0), x_mean
+
+
+class _LocalVarianceFunction(torch.autograd.Function):
+    """
+    Only the input is kept for the backward pass, the box means are
+    recomputed. For a stride of one the zero-padded box filter is its own
+    adjoint, hence: dx = 2 * (x * A(g) - A(g * A(x))).
+    """
+
+    @staticmethod
+    def forward(ctx, x, kernel_size):
+        x_var, _ = _local_variance(x, kernel_size, 1)
+        ctx.save_for_backward(x, x_var)
+        ctx.kernel_size = kernel_size
+        return x_var
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        x, x_var = ctx.saved_tensors
+        kernel_size = ctx.kernel_size
+        # no gradient where the variance was clamped
+        grad_output = grad_output * (x_var > 0)
+        x_mean = box_mean(x, kernel_size)
+        grad_input = 2 * (
+                x * box_mean(grad_output, kernel_size) -
+                box_mean(grad_output * x_mean, kernel_size)
+        )
+        return grad_input, None
+
+
+def local_variance(x, kernel_size=3, stride=1, recompute=False):
+    """
+    Variance of every kernel_size window (zero-padded), kernel_size must be
+    odd. With recompute the intermediate tensors are not stored for the
+    backward pass, which saves memory at the cost of two box filters.
+    """
+    if kernel_size % 2 == 0:
+        raise ValueError('kernel_size must be odd, got %d.' % kernel_size)
+    if recompute and stride == 1 and torch.is_grad_enabled():
+        return _LocalVarianceFunction.apply(x, kernel_size)
+    x_var, _ = _local_variance(x, kernel_size, stride)
+    return x_var
+
+
+class LocalContrastBlock(nn.Module):
+
+    def __init__(self, planes, kernel_size=3, stride=1, groups=None,
+                 recompute=False):
+        super(LocalContrastBlock, self).__init__()
+        self.planes = planes
+        self.kernel_size = kernel_size
+        self.stride = stride
+        self.groups = groups
+        self.recompute = recompute
+        # only used by checkpoints of the convolutional implementation
+        self.conv_average = None
+        self.register_buffer('_anchor', torch.zeros(0), persistent=False)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # older checkpoints trained the weights of the averaging convolution,
+        # they keep running with their convolution to reproduce the results
+        if prefix + 'conv_average.weight' in state_dict and (
+                self.conv_average is None
+        ):
+            self.conv_average = conv_avg(
+                self.planes, kernel_size=self.kernel_size, stride=self.stride,
+                groups=self.groups
+            ).to(self._anchor.device)
+        super(LocalContrastBlock, self)._load_from_state_dict(
+            state_dict, prefix, *args, **kwargs
+        )
+
+    def _conv_average(self, x):
+        # the weights of the checkpoint are float32, x may be half precision
+        conv = self.conv_average
+        return F.conv2d(
+            x, conv.weight.to(x.dtype), None, conv.stride, conv.padding,
+            conv.dilation, conv.groups
+        )
+
+    def forward(self, x):
+        if self.conv_average is not None:
+            x_avg = self._conv_average(x)
+            x = x - x_avg
+            x = x ** 2
+            x = self._conv_average(x)
+            return x
+        # TODO: x ** 0.5 could be applied, this part should not have
+        #  gradient and in eval mode
+        return local_variance(x, self.kernel_size, self.stride, self.recompute)
+
+
+class ContrastPoolingBlock(nn.Module):
+
+    def __init__(self, planes, pooling_type, kernel_size=3, stride=2,
+                 padding=1):
+        super(ContrastPoolingBlock, self).__init__()
+        self.pooling_type = pooling_type
+        self.max_pool = nn.MaxPool2d(kernel_size=kernel_size, stride=stride,
+                                     padding=padding)
+        self.avg_pool = nn.AvgPool2d(kernel_size=kernel_size, stride=stride,
+                                     padding=padding)
+        # TODO: merge all reductions to one type
+        if self.pooling_type in {'mix', 'contrast'}:
+            self.reduction = conv1x1(planes * 2, planes)
+        if self.pooling_type in {'contrast_avg', 'contrast_max'}:
+            self.reduction3 = conv1x1(planes * 3, planes)
+        if 'contrast' in self.pooling_type:
+            self.local_contrast = self._local_contrast(planes,
+                                                       kernel_size=3, stride=1)
+        if self.pooling_type not in {'max', 'avg'}:
+            self.bn = nn.BatchNorm2d(planes)
+        # the stride one box mean of the local contrast is subsampled to
+        # the average pooling when both windows are the same
+        self.fusable = (
+                kernel_size == 3 and padding == 1 and isinstance(stride, int)
+        )
+
+    def _local_contrast(self, planes, kernel_size=3, stride=1):
+        layers = []
+        layers.append(
+            LocalContrastBlock(planes, kernel_size=kernel_size, stride=stride))
+        return nn.Sequential(*layers)
+
+    def _avg_pool(self, x):
+        if self.fusable:
+            return box_mean(x, 3, self.avg_pool.stride)
+        return self.avg_pool(x)
+
+    def _contrast_avg(self, x):
+        """Returns the average pooling and local contrast of x."""
+        local_contrast = self.local_contrast[0]
+        if not self.fusable or local_contrast.conv_average is not None:
+            return self._avg_pool(x), local_contrast(x)
+        x_var, x_mean = _local_variance(x, 3, 1)
+        stride = self.avg_pool.stride
+        return x_mean[:, :, ::stride, ::stride], x_var
+
+    def forward(self, x):
+        if self.pooling_type == 'none':
+            out = x
+        elif self.pooling_type == 'max':
+            out = self.max_pool(x)
+        elif self.pooling_type == 'avg':
+            out = self._avg_pool(x)
+        else:
+            x_max = self.max_pool(x)
+            if self.pooling_type == 'mix':
+                x_avg = self._avg_pool(x)
+                x = torch.cat((x_max, x_avg), dim=1)
+                x = self.reduction(x)
+            elif self.pooling_type == 'contrast_avg':
+                x_avg, x = self._contrast_avg(x)
+                x = self._avg_pool(x)
+                x = torch.cat((x_max, x_avg, x), dim=1)
+                x = self.reduction3(x)
+            elif self.pooling_type == 'contrast_max':
+                x_avg, x = self._contrast_avg(x)
+                x = self.max_pool(x)
+                x = torch.cat((x_max, x_avg, x), dim=1)
+                x = self.reduction3(x)
+            elif self.pooling_type == 'contrast':
+                x_avg, x = self._contrast_avg(x)
+                x = self._avg_pool(x)
+                x = x_max * x + x_avg * (1 - x)
+            out = self.bn(x)
+
+        return out
@@ -0,0 +1,315 @@
+"""
+Evaluating many lesioned variants of one network in a single forward pass.
+"""
+
+import sys
+import copy
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from kernelphysiology.dl.pytorch.models.lesion_utility import _lesion_kernels
+
+
+def lesion_sweep_specs(model, sweep_kernels, kill_planes=None,
+                       kill_lines=None):
+    """
+    Returns one lesion spec (the keyword arguments of lesion_kernels) for
+    every kernel in sweep_kernels, which follows the format of kill_kernels:
+    a layer name followed by kernel indices. A layer name without indices
+    sweeps all its kernels.
+    """
+    state_dict = model.state_dict()
+    layer_kernels = []
+    for k_item in sweep_kernels:
+        if k_item.isdigit():
+            if len(layer_kernels) == 0:
+                sys.exit(
+                    'The order of kernels to be swept should follow '
+                    'layer name and kernel indices.'
+                )
+            layer_kernels[-1][1].append(int(k_item))
+        else:
+            if k_item not in state_dict:
+                sys.exit('Layer %s does not exist in the network.' % k_item)
+            layer_kernels.append((k_item, []))
+
+    specs = []
+    for layer_name, kernels in layer_kernels:
+        if len(kernels) == 0:
+            kernels = range(state_dict[layer_name].shape[0])
+        for kernel_index in kernels:
+            specs.append({
+                'kill_kernels': [layer_name, str(kernel_index)],
+                'kill_planes': kill_planes,
+                'kill_lines': kill_lines
+            })
+    return specs
+
+
+def spec_label(spec):
+    label = []
+    for key in ['kill_kernels', 'kill_planes', 'kill_lines']:
+        if spec.get(key, None) is not None:
+            label.append('_'.join(spec[key]))
+    return '-'.join(label)
+
+
+def lesioned_weights(model, specs):
+    """
+    Returns a dictionary of the lesioned layers, each one of shape
+    (V, *weight.shape) holding the weights of all V variants.
+    """
+    state_dict = model.state_dict()
+    variant_weights = []
+    for spec in specs:
+        weights = _SpecWeights(state_dict)
+        _lesion_kernels(weights, **spec)
+        variant_weights.append(weights.lesioned)
+    layer_names = [
+        name for name in state_dict.keys()
+        if any(name in weights for weights in variant_weights)
+    ]
+    return {
+        name: torch.stack([
+            weights.get(name, state_dict[name]) for weights in variant_weights
+        ])
+        for name in layer_names
+    }
+
+
+class _SpecWeights(object):
+    """Copies a weight from the state dict the first time it's lesioned."""
+
+    def __init__(self, state_dict):
+        self.state_dict = state_dict
+        self.lesioned = dict()
+
+    def __getitem__(self, name):
+        if name not in self.lesioned:
+            self.lesioned[name] = self.state_dict[name].detach().clone()
+        return self.lesioned[name]
+
+
+class _SweepState(object):
+    def __init__(self, num_variants):
+        self.batch_size = None
+        self.variants = slice(0, num_variants)
+        self.num_chunk = num_variants
+
+
+def _to_variants(y, num_variants, batch_size):
+    """(B, V * C, ...) to (V * B, C, ...)"""
+    y = y.view(batch_size, num_variants, -1, *y.shape[2:])
+    return y.transpose(0, 1).reshape(-1, *y.shape[2:])
+
+
+def _from_variants(x, num_variants):
+    """(V * B, C, ...) to (B, V * C, ...)"""
+    x = x.view(num_variants, -1, *x.shape[1:]).transpose(0, 1)
+    return x.reshape(x.shape[0], -1, *x.shape[3:])
+
+
+def _expand_batch(x, num_variants):
+    return x.unsqueeze(0).expand(num_variants, *x.shape).reshape(
+        -1, *x.shape[1:]
+    )
+
+
+class _VariantConv2d(nn.Module):
+    """
+    A convolution with one set of weights per variant. The input is either
+    the shared batch of shape (B, I, H, W), convolved with all variants at
+    once, or already expanded to (V * B, I, H, W) and convolved as V groups.
+    """
+
+    def __init__(self, conv, weights, state):
+        super(_VariantConv2d, self).__init__()
+        self.conv = conv
+        self.register_buffer('weights', weights)
+        self.state = state
+
+    def forward(self, x):
+        conv = self.conv
+        state = self.state
+        num_variants = state.num_chunk
+        weights = self.weights[state.variants]
+        expand = x.shape[0] == state.batch_size
+        if expand and conv.groups != 1:
+            x = _expand_batch(x, num_variants)
+            expand = False
+
+        if conv.padding_mode != 'zeros':
+            x = F.pad(
+                x, conv._reversed_padding_repeated_twice, mode=conv.padding_mode
+            )
+            padding = 0
+        else:
+            padding = conv.padding
+        bias = None if conv.bias is None else conv.bias.repeat(num_variants)
+        weights = weights.reshape(-1, *weights.shape[2:])
+
+        if expand:
+            y = F.conv2d(
+                x, weights, bias, conv.stride, padding, conv.dilation, 1
+            )
+            return _to_variants(y, num_variants, x.shape[0])
+        y = F.conv2d(
+            _from_variants(x, num_variants), weights, bias, conv.stride,
+            padding, conv.dilation, conv.groups * num_variants
+        )
+        return _to_variants(y, num_variants, y.shape[0])
+
+
+class _VariantLinear(nn.Module):
+    """A fully connected layer with one set of weights per variant."""
+
+    def __init__(self, linear, weights, state):
+        super(_VariantLinear, self).__init__()
+        self.linear = linear
+        self.register_buffer('weights', weights)
+        self.state = state
+
+    def forward(self, x):
+        state = self.state
+        num_variants = state.num_chunk
+        weights = self.weights[state.variants]
+        bias = self.linear.bias
+        out_features = weights.shape[1]
+
+        if x.shape[0] == state.batch_size:
+            if bias is not None:
+                bias = bias.repeat(num_variants)
+            y = F.linear(x, weights.reshape(-1, weights.shape[2]), bias)
+            y = y.view(*x.shape[:-1], num_variants, out_features)
+            return y.movedim(-2, 0).reshape(-1, *x.shape[1:-1], out_features)
+        y = torch.bmm(
+            x.reshape(num_variants, -1, x.shape[-1]), weights.transpose(1, 2)
+        )
+        if bias is not None:
+            y = y + bias
+        return y.view(*x.shape[:-1], out_features)
+
+
+def _set_module(model, module_name, module):
+    parent_name, _, child_name = module_name.rpartition('.')
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child_name, module)
+
+
+def _split_variants(out, num_variants):
+    if torch.is_tensor(out):
+        return out.view(num_variants, -1, *out.shape[1:])
+    elif isinstance(out, dict):
+        return {key: _split_variants(val, num_variants)
+                for key, val in out.items()}
+    elif isinstance(out, (list, tuple)):
+        return type(out)(_split_variants(val, num_variants) for val in out)
+    return out
+
+
+def _cat_variants(outs):
+    if torch.is_tensor(outs[0]):
+        return torch.cat(outs, dim=0)
+    elif isinstance(outs[0], dict):
+        return {key: _cat_variants([out[key] for out in outs])
+                for key in outs[0].keys()}
+    elif isinstance(outs[0], (list, tuple)):
+        return type(outs[0])(_cat_variants(vals) for vals in zip(*outs))
+    return outs[0]
+
+
+class LesionSweep(nn.Module):
+    """
+    Wraps a network and returns the outputs of all lesioned variants, of
+    shape (V, B, ...), for a batch of shape (B, ...).
+
+    The lesioned convolutions and fully connected layers are replaced by
+    layers with per-variant weights. The batch is only expanded across the
+    variants where the first lesioned layer starts, assuming the children
+    of the network run in their registration order (as in the torchvision
+    classification networks), so the unlesioned prefix is computed once.
+    variants_per_pass limits the number of variants evaluated together.
+    """
+
+    def __init__(self, model, specs, variants_per_pass=None):
+        super(LesionSweep, self).__init__()
+        self.specs = specs
+        self.labels = [spec_label(spec) for spec in specs]
+        self.num_variants = len(specs)
+        if variants_per_pass is None:
+            variants_per_pass = self.num_variants
+        self.variants_per_pass = variants_per_pass
+        self.state = _SweepState(self.num_variants)
+
+        weights = lesioned_weights(model, specs)
+        self.model = copy.deepcopy(model)
+        lesioned_modules = []
+        for layer_name, variant_weights in weights.items():
+            module_name, _, param_name = layer_name.rpartition('.')
+            module = self.model.get_submodule(module_name)
+            if param_name != 'weight':
+                sys.exit('Only weights can be swept, not %s.' % layer_name)
+            if isinstance(module, nn.Conv2d):
+                module = _VariantConv2d(module, variant_weights, self.state)
+            elif isinstance(module, nn.Linear):
+                module = _VariantLinear(module, variant_weights, self.state)
+            else:
+                sys.exit(
+                    'Layer %s is not a convolution or fully connected '
+                    'layer.' % layer_name
+                )
+            _set_module(self.model, module_name, module)
+            lesioned_modules.append(module_name)
+
+        self._expansion_point(lesioned_modules)
+
+    def _expansion_point(self, lesioned_modules):
+        """
+        Finds the first child containing a lesioned layer, descending into
+        sequential containers, and expands its input across the variants
+        unless it is a lesioned layer itself.
+        """
+        if len(lesioned_modules) == 0:
+            self.model.register_forward_pre_hook(self._expand_input)
+            return
+        parent = self.model
+        prefix = ''
+        while True:
+            child_name, child = None, None
+            for name, module in parent.named_children():
+                full_name = prefix + name
+                if any(
+                        m == full_name or m.startswith(full_name + '.')
+                        for m in lesioned_modules
+                ):
+                    child_name, child = full_name, module
+                    break
+            if isinstance(child, (_VariantConv2d, _VariantLinear)):
+                return
+            if not isinstance(child, nn.Sequential):
+                break
+            parent = child
+            prefix = child_name + '.'
+        child.register_forward_pre_hook(self._expand_input)
+
+    def _expand_input(self, module, inputs):
+        return tuple(
+            _expand_batch(x, self.state.num_chunk)
+            if torch.is_tensor(x) and x.shape[0] == self.state.batch_size
+            else x
+            for x in inputs
+        )
+
+    def forward(self, x):
+        self.state.batch_size = x.shape[0]
+        outs = []
+        for i in range(0, self.num_variants, self.variants_per_pass):
+            end = min(i + self.variants_per_pass, self.num_variants)
+            self.state.variants = slice(i, end)
+            self.state.num_chunk = end - i
+            outs.append(
+                _split_variants(self.model(x), self.state.num_chunk)
+            )
+        return _cat_variants(outs)
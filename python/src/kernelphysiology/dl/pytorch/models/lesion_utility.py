@@ -6,6 +6,11 @@ import sys
 
 
 def lesion_lines(model, layer, kernel, kill_lines):
+    _lesion_lines(model.state_dict(), layer, kernel, kill_lines)
+    return model
+
+
+def _lesion_lines(weights, layer, kernel, kill_lines):
     for l_item in kill_lines:
         # pattern <P1>_<L1>_<P2>_<L2>
         current_line = l_item.split('_')
@@ -24,15 +29,20 @@ def lesion_lines(model, layer, kernel, kill_lines):
             ln0 = int(current_line[1])
             ln1 = int(current_line[3])
             if ax0 == 0 and ax1 == 1:
-                model.state_dict()[layer][kernel, ln0, ln1, :] = 0
+                weights[layer][kernel, ln0, ln1, :] = 0
             elif ax0 == 0 and ax1 == 2:
-                model.state_dict()[layer][kernel, ln0, :, ln1] = 0
+                weights[layer][kernel, ln0, :, ln1] = 0
             elif ax0 == 1 and ax1 == 2:
-                model.state_dict()[layer][kernel, :, ln0, ln1] = 0
-    return model
+                weights[layer][kernel, :, ln0, ln1] = 0
+    return weights
 
 
 def lesion_planes(model, layer, kernel, kill_planes):
+    _lesion_planes(model.state_dict(), layer, kernel, kill_planes)
+    return model
+
+
+def _lesion_planes(weights, layer, kernel, kill_planes):
     axis_num = None
     for p_item in kill_planes:
         if p_item.isdigit():
@@ -48,18 +58,25 @@ def lesion_planes(model, layer, kernel, kill_planes):
                     'Removing axis %d plane %d' % (axis_num, plane_index)
                 )
                 if axis_num == 0:
-                    model.state_dict()[layer][kernel, plane_index, :, :] = 0
+                    weights[layer][kernel, plane_index, :, :] = 0
                 elif axis_num == 1:
-                    model.state_dict()[layer][kernel, :, plane_index, ] = 0
+                    weights[layer][kernel, :, plane_index, ] = 0
                 elif axis_num == 2:
-                    model.state_dict()[layer][kernel, :, :, plane_index, ] = 0
+                    weights[layer][kernel, :, :, plane_index, ] = 0
         else:
             # pattern ax_<NUMBER>
             axis_num = int(p_item.split('_')[-1])
-    return model
+    return weights
 
 
 def lesion_kernels(model, kill_kernels=None, kill_planes=None, kill_lines=None):
+    _lesion_kernels(model.state_dict(), kill_kernels, kill_planes, kill_lines)
+    return model
+
+
+def _lesion_kernels(weights, kill_kernels=None, kill_planes=None,
+                    kill_lines=None):
+    """Zeroes the lesioned parts of a dictionary of weights in place."""
     if kill_kernels is not None:
         layer_name = ''
         for k_item in kill_kernels:
@@ -79,15 +96,15 @@ def lesion_kernels(model, kill_kernels=None, kill_planes=None, kill_lines=None):
                     # check whether planes or lines are specified
                     # TODO: move this to TXT file to allow better combinations
                     if kill_planes is not None:
-                        model = lesion_planes(
-                            model, layer_name, kernel_index, kill_planes
+                        _lesion_planes(
+                            weights, layer_name, kernel_index, kill_planes
                         )
                     elif kill_lines is not None:
-                        model = lesion_lines(
-                            model, layer_name, kernel_index, kill_lines
+                        _lesion_lines(
+                            weights, layer_name, kernel_index, kill_lines
                         )
                     else:
-                        model.state_dict()[layer_name][kernel_index,] = 0
+                        weights[layer_name][kernel_index,] = 0
             else:
                 layer_name = k_item
-    return model
+    return weights
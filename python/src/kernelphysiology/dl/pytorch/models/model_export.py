@@ -0,0 +1,164 @@
+"""
+Freezing configured networks (custom architectures, lesions applied) to
+TorchScript and ONNX, and running those artifacts for evaluation.
+"""
+
+import os
+import sys
+import json
+import inspect
+
+import torch
+import torch.nn as nn
+
+from kernelphysiology.dl.pytorch.models import model_utils
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+FORMAT_EXTENSIONS = {'torchscript': '.pt', 'onnx': '.onnx'}
+
+
+class _SegmentationOutput(nn.Module):
+    """Exports only the main output of the segmentation networks."""
+
+    def __init__(self, model):
+        super(_SegmentationOutput, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x)['out']
+
+
+def _onnx_exporter_kwargs():
+    # newer versions default to the dynamo exporter, dynamic_axes belong to
+    # the tracing one
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        return {'dynamo': False}
+    return {}
+
+
+def _meta_file(artifact_file):
+    return os.path.splitext(artifact_file)[0] + '.json'
+
+
+def export_network(model, out_file, target_size, task_type='classification',
+                   formats=None, batch_size=1, opset_version=13):
+    """
+    Exports the model in eval mode to out_file with the extension of each
+    format. The batch and spatial dimensions are dynamic in ONNX. The task
+    and target size are stored in a json file next to the artifacts.
+    """
+    if formats is None:
+        formats = ['torchscript', 'onnx']
+    model = model.eval().cpu()
+    if task_type == 'segmentation':
+        model = _SegmentationOutput(model)
+    example = torch.randn(batch_size, 3, target_size, target_size)
+
+    out_dir = os.path.dirname(out_file)
+    if out_dir != '':
+        os.makedirs(out_dir, exist_ok=True)
+    artifacts = []
+    with torch.no_grad():
+        for export_format in formats:
+            artifact_file = out_file + FORMAT_EXTENSIONS[export_format]
+            if export_format == 'torchscript':
+                traced = torch.jit.freeze(torch.jit.trace(model, example))
+                traced.save(artifact_file)
+            else:
+                torch.onnx.export(
+                    model, example, artifact_file, input_names=['input'],
+                    output_names=['output'], opset_version=opset_version,
+                    dynamic_axes={
+                        'input': {0: 'batch', 2: 'height', 3: 'width'},
+                        'output': {0: 'batch'}
+                    },
+                    **_onnx_exporter_kwargs()
+                )
+            artifacts.append(artifact_file)
+    with open(out_file + '.json', 'w') as f:
+        json.dump({'task_type': task_type, 'target_size': target_size}, f)
+    return artifacts
+
+
+class ExportedNetwork(nn.Module):
+    """
+    Runs an exported artifact as a module: TorchScript on any device and
+    ONNX with the CPU provider of onnxruntime (its outputs are returned on
+    the device of the input). Segmentation outputs are wrapped in a
+    dictionary as the eager networks do.
+    """
+
+    def __init__(self, artifact_file, backend, task_type='classification',
+                 num_threads=None):
+        super(ExportedNetwork, self).__init__()
+        self.backend = backend
+        self.task_type = task_type
+        self.session = None
+        self.scripted = None
+        if backend == 'torchscript':
+            self.scripted = torch.jit.load(artifact_file, map_location='cpu')
+        elif backend == 'onnx':
+            if onnxruntime is None:
+                sys.exit('The onnx backend requires onnxruntime.')
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = (
+                onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            )
+            if num_threads is not None:
+                options.intra_op_num_threads = num_threads
+            self.session = onnxruntime.InferenceSession(
+                artifact_file, options, providers=['CPUExecutionProvider']
+            )
+        else:
+            sys.exit('Unsupported backend %s.' % backend)
+
+    def forward(self, x):
+        if self.scripted is not None:
+            out = self.scripted(x)
+        else:
+            out = self.session.run(
+                None, {'input': x.detach().cpu().float().numpy()}
+            )[0]
+            out = torch.from_numpy(out).to(x.device)
+        if self.task_type == 'segmentation':
+            return {'out': out}
+        return out
+
+
+def load_exported(network_file, backend, num_threads=None):
+    """
+    Returns the network and target size of an exported artifact, the
+    extension of the backend is added to network_file if missing.
+    """
+    extension = FORMAT_EXTENSIONS[backend]
+    if not network_file.endswith(extension):
+        network_file = network_file + extension
+    if not os.path.isfile(network_file):
+        sys.exit('Exported network %s does not exist.' % network_file)
+    meta = {'task_type': 'classification', 'target_size': None}
+    if os.path.isfile(_meta_file(network_file)):
+        with open(_meta_file(network_file)) as f:
+            meta.update(json.load(f))
+    model = ExportedNetwork(
+        network_file, backend, meta['task_type'], num_threads
+    )
+    return model, meta['target_size']
+
+
+def which_network(network_name, task_type, backend='torch', **kwargs):
+    """model_utils.which_network or the exported artifact of the backend."""
+    if backend == 'torch':
+        return model_utils.which_network(network_name, task_type, **kwargs)
+    lesions = [kwargs.get(key, None) for key in [
+        'kill_kernels', 'kill_planes', 'kill_lines'
+    ]]
+    if any(lesion is not None for lesion in lesions):
+        sys.exit(
+            'Lesions are frozen in the exported networks, export them with '
+            'the lesions instead.'
+        )
+    return load_exported(network_name, backend)
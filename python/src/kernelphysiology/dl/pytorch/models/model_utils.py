@@ -17,6 +17,7 @@ except ImportError:
 
 from kernelphysiology.dl.pytorch import models as custom_models
 from kernelphysiology.dl.pytorch.models.lesion_utility import lesion_kernels
+from kernelphysiology.dl.pytorch.models import checkpoint_utils
 
 
 def _get_conv_ind(module, layer_num, conv_num):
@@ -158,34 +159,43 @@ class NewClassificationModel(nn.Module):
         return x
 
 
+def _load_classification(network_name, num_classes):
+    print('Loading %s' % network_name)
+    checkpoint = checkpoint_utils.load_checkpoint(network_name)
+    customs = None
+    if 'customs' in checkpoint:
+        customs = checkpoint['customs']
+        # TODO: num_classes is just for backward compatibility
+        if 'num_classes' not in customs:
+            customs['num_classes'] = num_classes
+    model = which_architecture(checkpoint['arch'], customs=customs)
+
+    # TODO: for each dataset a class of network should be defined
+    # if dataset == 'leaf':
+    #     num_ftrs = model.fc.in_features
+    #     model.fc = nn.Linear(num_ftrs, 30)
+    # elif dataset == 'fruits':
+    #     num_ftrs = model.fc.in_features
+    #     model.fc = nn.Linear(num_ftrs, 23)
+    # FIXME: this is for transfer learning or adding a dropout
+    # elif 'wcs' in dataset:
+    #     if '_330' in dataset:
+    #         model = IntermediateModel(model, 330, 0, checkpoint['arch'])
+    #     elif '_1600' in dataset:
+    #         model = IntermediateModel(model, 1600, 0, checkpoint['arch'])
+
+    model.load_state_dict(checkpoint['state_dict'])
+    target_size = checkpoint['target_size']
+    return model, target_size
+
+
 def which_network_classification(network_name, num_classes, **kwargs):
     if os.path.isfile(network_name):
-        print('Loading %s' % network_name)
-        checkpoint = torch.load(network_name, map_location='cpu')
-        customs = None
-        if 'customs' in checkpoint:
-            customs = checkpoint['customs']
-            # TODO: num_classes is just for backward compatibility
-            if 'num_classes' not in customs:
-                customs['num_classes'] = num_classes
-        model = which_architecture(checkpoint['arch'], customs=customs)
-
-        # TODO: for each dataset a class of network should be defined
-        # if dataset == 'leaf':
-        #     num_ftrs = model.fc.in_features
-        #     model.fc = nn.Linear(num_ftrs, 30)
-        # elif dataset == 'fruits':
-        #     num_ftrs = model.fc.in_features
-        #     model.fc = nn.Linear(num_ftrs, 23)
-        # FIXME: this is for transfer learning or adding a dropout
-        # elif 'wcs' in dataset:
-        #     if '_330' in dataset:
-        #         model = IntermediateModel(model, 330, 0, checkpoint['arch'])
-        #     elif '_1600' in dataset:
-        #         model = IntermediateModel(model, 1600, 0, checkpoint['arch'])
-
-        model.load_state_dict(checkpoint['state_dict'])
-        target_size = checkpoint['target_size']
+        (model, target_size) = checkpoint_utils.MODEL_CACHE.load(
+            ('classification', checkpoint_utils.file_key(network_name),
+             num_classes),
+            lambda: _load_classification(network_name, num_classes)
+        )
     elif network_name == 'inception_v3':
         target_size = 299
         model = pmodels.__dict__[network_name](
@@ -199,28 +209,37 @@ def which_network_classification(network_name, num_classes, **kwargs):
     return model, target_size
 
 
+def _load_segmentation(network_name, num_classes):
+    checkpoint = checkpoint_utils.load_checkpoint(network_name)
+    customs = None
+    aux_loss = None
+    if 'customs' in checkpoint:
+        customs = checkpoint['customs']
+        # TODO: num_classes is just for backward compatibility
+        if 'num_classes' not in customs:
+            customs['num_classes'] = num_classes
+        if 'aux_loss' in customs:
+            aux_loss = customs['aux_loss']
+        backbone = customs['backbone']
+    # TODO: for now only predefined models
+    # model = which_architecture(checkpoint['arch'], customs=customs)
+    model = custom_models.__dict__[checkpoint['arch']](
+        backbone, num_classes=num_classes, pretrained=False,
+        aux_loss=aux_loss
+    )
+
+    model.load_state_dict(checkpoint['state_dict'])
+    target_size = checkpoint['target_size']
+    return model, target_size
+
+
 def which_network_segmentation(network_name, num_classes, **kwargs):
     if os.path.isfile(network_name):
-        checkpoint = torch.load(network_name, map_location='cpu')
-        customs = None
-        aux_loss = None
-        if 'customs' in checkpoint:
-            customs = checkpoint['customs']
-            # TODO: num_classes is just for backward compatibility
-            if 'num_classes' not in customs:
-                customs['num_classes'] = num_classes
-            if 'aux_loss' in customs:
-                aux_loss = customs['aux_loss']
-            backbone = customs['backbone']
-        # TODO: for now only predefined models
-        # model = which_architecture(checkpoint['arch'], customs=customs)
-        model = custom_models.__dict__[checkpoint['arch']](
-            backbone, num_classes=num_classes, pretrained=False,
-            aux_loss=aux_loss
+        (model, target_size) = checkpoint_utils.MODEL_CACHE.load(
+            ('segmentation', checkpoint_utils.file_key(network_name),
+             num_classes),
+            lambda: _load_segmentation(network_name, num_classes)
         )
-
-        model.load_state_dict(checkpoint['state_dict'])
-        target_size = checkpoint['target_size']
     else:
         model = seg_models.__dict__[network_name](
             num_classes=num_classes, pretrained=True, aux_loss=True
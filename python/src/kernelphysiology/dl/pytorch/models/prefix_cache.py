@@ -0,0 +1,176 @@
+"""
+Running the frozen prefix of a network once over a dataset and training or
+evaluating the rest of the network from the stored intermediate tensors.
+"""
+
+import os
+import hashlib
+import numpy as np
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def prefix_key(*items):
+    """An identifier of everything the cached features depend on."""
+    return hashlib.md5(repr(items).encode()).hexdigest()[:10]
+
+
+def _unwrap(model):
+    if isinstance(
+            model, (nn.DataParallel, nn.parallel.DistributedDataParallel)
+    ):
+        return model.module
+    return model
+
+
+class SkippedPrefix(nn.Module):
+    """
+    Stands in for a cached prefix, its input (the cached features) is passed
+    through. The parameters and buffers of the prefix are shared under the
+    same names, so checkpoints remain loadable by the original network.
+    """
+
+    def __init__(self, prefix):
+        super(SkippedPrefix, self).__init__()
+        self._modules = prefix._modules
+        self._parameters = prefix._parameters
+        self._buffers = prefix._buffers
+        # not registered as a child, to keep the names of the state dict
+        self.__dict__['prefix'] = prefix
+
+    def forward(self, x):
+        return x
+
+
+def skip_prefix(model, prefix_name='features'):
+    """
+    Freezes the prefix of a model and replaces it by a SkippedPrefix,
+    returning the original prefix to compute the cached features with.
+    """
+    model = _unwrap(model)
+    prefix = getattr(model, prefix_name)
+    for p in prefix.parameters():
+        p.requires_grad = False
+    setattr(model, prefix_name, SkippedPrefix(prefix))
+    return prefix
+
+
+def _batch_to_host(data):
+    if torch.is_tensor(data):
+        return data.cpu()
+    elif isinstance(data, dict):
+        return {key: _batch_to_host(val) for key, val in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return [_batch_to_host(val) for val in data]
+    return data
+
+
+def _merge_batches(batches):
+    """Merges the collated batches of one output of the data loader."""
+    if torch.is_tensor(batches[0]):
+        return torch.cat(batches, dim=0)
+    elif isinstance(batches[0], dict):
+        return {key: _merge_batches([batch[key] for batch in batches])
+                for key in batches[0].keys()}
+    merged = []
+    for batch in batches:
+        merged.extend(batch)
+    return merged
+
+
+def _select(data, index):
+    if isinstance(data, dict):
+        return {key: _select(val, index) for key, val in data.items()}
+    return data[index]
+
+
+def cache_prefix(prefix, dataset, cache_file, batch_size=64, num_workers=4,
+                 num_samples=None, pooling=None, device=None, seed=0):
+    """
+    Runs prefix over the first input of every sample and stores the output
+    as a float16 memory-mapped array of shape (N, *). The other outputs of
+    the dataset (e.g. targets) are stored alongside. If num_samples is
+    smaller than the dataset, a random subset is cached. pooling, if given,
+    adaptively average pools the features to that spatial size.
+
+    Samples are drawn once, i.e. the random augmentations of the dataset
+    are frozen in the cache.
+    """
+    if os.path.exists(cache_file):
+        return
+    if device is None:
+        device = next(prefix.parameters()).device
+    indices = np.arange(len(dataset))
+    if num_samples is not None and num_samples < len(dataset):
+        indices = np.random.RandomState(seed).permutation(indices)
+        indices = np.sort(indices[:num_samples])
+    db_loader = torch.utils.data.DataLoader(
+        torch.utils.data.Subset(dataset, indices), batch_size=batch_size,
+        shuffle=False, num_workers=num_workers, pin_memory=True
+    )
+
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir != '':
+        os.makedirs(cache_dir, exist_ok=True)
+    prefix.eval()
+    features = None
+    extras = []
+    start = 0
+    with torch.no_grad():
+        for data in db_loader:
+            out = prefix(data[0].to(device))
+            if pooling is not None:
+                out = F.adaptive_avg_pool2d(out, pooling)
+            if features is None:
+                features = np.lib.format.open_memmap(
+                    cache_file + '.tmp', mode='w+', dtype=np.float16,
+                    shape=(len(indices), *out.shape[1:])
+                )
+            features[start:start + out.shape[0]] = out.cpu().numpy()
+            start += out.shape[0]
+            extras.append(_batch_to_host(data[1:]))
+    features.flush()
+    del features
+    extras = [_merge_batches(list(batches)) for batches in zip(*extras)]
+    torch.save(
+        {'indices': torch.from_numpy(indices), 'extras': extras},
+        cache_file + '.pth'
+    )
+    os.replace(cache_file + '.tmp', cache_file)
+
+
+class PrefixFeatures(torch.utils.data.Dataset):
+    """The cached features and other outputs of a dataset."""
+
+    def __init__(self, cache_file):
+        self.features = np.load(cache_file, mmap_mode='r')
+        meta = torch.load(cache_file + '.pth')
+        self.indices = meta['indices']
+        self.extras = meta['extras']
+
+    def __getitem__(self, index):
+        feature = torch.from_numpy(
+            np.array(self.features[index], dtype=np.float32)
+        )
+        return (feature, *[_select(extra, index) for extra in self.extras])
+
+    def __len__(self):
+        return len(self.features)
+
+
+def prefix_loader(prefix, db_loader, cache_file, num_samples=None,
+                  pooling=None, shuffle=False):
+    """
+    Caches the prefix features of the dataset of db_loader and returns a
+    loader over them with the same batch size.
+    """
+    cache_prefix(
+        prefix, db_loader.dataset, cache_file, db_loader.batch_size,
+        db_loader.num_workers, num_samples, pooling
+    )
+    return torch.utils.data.DataLoader(
+        PrefixFeatures(cache_file), batch_size=db_loader.batch_size,
+        shuffle=shuffle, num_workers=db_loader.num_workers, pin_memory=True
+    )
@@ -25,6 +25,8 @@ from kernelphysiology.dl.utils import prepapre_testing
 
 def main(argv):
     args = argument_handler.test_arg_parser(argv)
+    if args.lesion_sweep is not None and args.backend != 'torch':
+        sys.exit('Lesion sweeps are only supported by the torch backend.')
     (args.network_files,
      args.network_names,
      args.network_chromaticities) = prepapre_testing.prepare_networks_testting(
@@ -47,6 +49,9 @@ def main(argv):
         if args.activation_map is not None:
             fn = compute_activation
             save_fn = prepapre_testing.save_activation
+        elif args.lesion_sweep is not None:
+            fn = predict_lesion_sweep
+            save_fn = prepapre_testing.save_lesion_sweep
         else:
             fn = predict
             save_fn = prepapre_testing.save_predictions
@@ -181,6 +186,69 @@ def predict(val_loader, model, criterion, device, print_freq=100):
     return top1.avg, top5.avg, prediction_output
 
 
+def predict_lesion_sweep(val_loader, model, device, print_freq=100):
+    """
+    Evaluates all variants of a LesionSweep, returning their loss and top-1
+    and top-5 accuracies as a table of shape (V, 3).
+    """
+    batch_time = AverageMeter()
+
+    # switch to evaluate mode
+    model.eval()
+
+    num_samples = 0
+    variant_losses = 0
+    variant_top1 = 0
+    variant_top5 = 0
+    with torch.no_grad():
+        end = time.time()
+        for i, (input_imgs, target) in enumerate(val_loader):
+            input_imgs = input_imgs.to(device)
+            target = target.to(device)
+
+            # compute output of all variants, of shape (V, B, C)
+            output = model(input_imgs)
+            num_variants = output.shape[0]
+            loss = nn.functional.cross_entropy(
+                output.flatten(0, 1), target.repeat(num_variants),
+                reduction='none'
+            ).view(num_variants, -1)
+
+            # accumulating on the device, synced only when printing
+            _, pred = output.topk(5, -1, True, True)
+            correct = pred.eq(target.view(1, -1, 1))
+            variant_losses = variant_losses + loss.sum(dim=1)
+            variant_top1 = variant_top1 + correct[..., :1].sum(dim=(1, 2))
+            variant_top5 = variant_top5 + correct.sum(dim=(1, 2))
+            num_samples += input_imgs.size(0)
+
+            # measure elapsed time
+            batch_time.update(time.time() - end)
+            end = time.time()
+
+            if i % print_freq == 0:
+                top1 = variant_top1.float() * 100.0 / num_samples
+                print(
+                    'Test: [{0}/{1}]\t'
+                    'Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t'
+                    'Acc@1 min {2:.3f} max {3:.3f}'.format(
+                        i, len(val_loader), top1.min().item(),
+                        top1.max().item(), batch_time=batch_time
+                    )
+                )
+
+    table = torch.stack([
+        variant_losses / num_samples,
+        variant_top1.float() * 100.0 / num_samples,
+        variant_top5.float() * 100.0 / num_samples
+    ], dim=1).cpu().numpy()
+    for label, row in zip(model.labels, table):
+        print(
+            ' * {0} Acc@1 {1:.3f} Acc@5 {2:.3f}'.format(label, row[1], row[2])
+        )
+    return table[:, 1], table[:, 2], (model.labels, table)
+
+
 def visualise_input(val_loader, out_folder, normalize_inverse,
                     manipulation_value, print_freq=100):
     with torch.no_grad():
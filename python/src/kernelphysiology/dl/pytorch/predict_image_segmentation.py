@@ -14,6 +14,8 @@ from kernelphysiology.dl.utils.prepapre_testing import save_segmentation_results
 
 
 def main(args):
+    if args.lesion_sweep is not None:
+        sys.exit('Lesion sweeps are only supported for classification.')
     args.device = torch.device(args.gpus)
 
     torch.cuda.set_device(args.device)
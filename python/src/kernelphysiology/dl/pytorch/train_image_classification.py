@@ -24,6 +24,7 @@ import torchvision.models as models
 from kernelphysiology.dl.pytorch import models as custom_models
 from kernelphysiology.dl.pytorch.utils import preprocessing
 from kernelphysiology.dl.pytorch.utils import argument_handler
+from kernelphysiology.dl.pytorch.utils import batch_transforms
 from kernelphysiology.dl.pytorch.utils import misc as misc_utils
 from kernelphysiology.dl.pytorch.models import model_utils
 from kernelphysiology.dl.pytorch.datasets import utils_db
@@ -213,8 +214,9 @@ def main_worker(ngpus_per_node, args):
             best_acc1 = checkpoint['best_acc1']
             model.load_state_dict(checkpoint['state_dict'])
             if args.gpus is not None:
-                # best_acc1 may be from a checkpoint from a different GPU
-                best_acc1 = best_acc1.to(args.gpus)
+                # best_acc1 is a float, or in older checkpoints a tensor
+                # possibly from a different GPU
+                best_acc1 = torch.as_tensor(best_acc1).to(args.gpus)
                 model = model.cuda(args.gpus)
             optimizer.load_state_dict(checkpoint['optimizer'])
             print(
@@ -253,7 +255,8 @@ def main_worker(ngpus_per_node, args):
     train_trans = [*both_trans, *train_trans]
     train_dataset = utils_db.get_train_dataset(
         args.dataset, args.train_dir, args.vision_type,
-        args.colour_space, train_trans, normalize, target_size
+        args.colour_space, train_trans, normalize, target_size,
+        batch_augmentation=args.batch_augmentation
     )
 
     if args.distributed:
@@ -267,8 +270,26 @@ def main_worker(ngpus_per_node, args):
         train_dataset,
         batch_size=args.batch_size, shuffle=(train_sampler is None),
         num_workers=args.workers, pin_memory=True,
-        sampler=train_sampler
+        sampler=train_sampler,
+        collate_fn=(
+            batch_transforms.pad_collate if args.batch_augmentation else None
+        )
     )
+    if args.batch_augmentation:
+        batch_augmentation = batch_transforms.BatchAugmentation(
+            target_size, scale=utils_db.get_train_crop_scale(args.dataset),
+            mean=mean, std=std
+        )
+        if not torch.cuda.is_available():
+            device = torch.device('cpu')
+        elif args.gpus is None:
+            # the current device of the distributed process
+            device = torch.device('cuda')
+        else:
+            device = torch.device('cuda', args.gpus)
+        train_loader = batch_transforms.AugmentedLoader(
+            train_loader, batch_augmentation, device
+        )
 
     # loading validation set
     valid_trans = [*both_trans, *valid_trans]
@@ -0,0 +1,405 @@
+"""
+Augmenting a collated batch on its own device. The random resized crop (or
+the resize and centre crop), the horizontal flip and the normalisation of
+every sample are expressed as one sampling grid and applied with
+grid_sample on the device of the batch, instead of calling cv2 once per
+image in workers. Only the crop of every sample is moved and converted to
+float, not the whole (padded) image.
+
+All tensors of a (nested) list, tuple or dict receive the same parameters,
+like the cv2_transforms, so that paired images (e.g. imgin/imgout) and their
+segmentation masks stay aligned:
+    4D tensors are images, uint8 ones channels last (N, H, W, C) as collated
+    from cv2 images, float ones channels first (N, C, H, W). They are
+    interpolated bilinearly and returned normalised as float (N, C, H, W).
+    3D tensors (N, H, W) are label maps, interpolated with the nearest
+    neighbour and returned in their own dtype.
+"""
+
+import numbers
+
+import numpy as np
+import torch
+from torch.nn import functional as F
+from torch.utils.data.dataloader import default_collate
+
+
+def _find_first_tensor_recursive(inputs):
+    if isinstance(inputs, (list, tuple)):
+        return _find_first_tensor_recursive(inputs[0])
+    elif isinstance(inputs, dict):
+        return _find_first_tensor_recursive(next(iter(inputs.values())))
+    return inputs
+
+
+def _flatten_recursive(inputs, tensors):
+    if isinstance(inputs, (list, tuple)):
+        for item in inputs:
+            _flatten_recursive(item, tensors)
+    elif isinstance(inputs, dict):
+        for item in inputs.values():
+            _flatten_recursive(item, tensors)
+    else:
+        tensors.append(inputs)
+    return tensors
+
+
+def _unflatten_recursive(inputs, tensors):
+    if isinstance(inputs, (list, tuple)):
+        return type(inputs)(_unflatten_recursive(item, tensors)
+                            for item in inputs)
+    elif isinstance(inputs, dict):
+        return {key: _unflatten_recursive(item, tensors)
+                for key, item in inputs.items()}
+    return tensors.pop(0)
+
+
+def _uniform(low, high, shape, generator):
+    return torch.rand(shape, generator=generator, dtype=torch.float64) * (
+            high - low) + low
+
+
+def random_resized_crop_params(sizes, scale=(0.08, 1.0),
+                               ratio=(3. / 4., 4. / 3.), generator=None):
+    """
+    Vectorised cv2_transforms.RandomResizedCrop.get_params, with the same
+    distribution: ten attempts per sample and the centre square as fallback.
+
+    Args:
+        sizes: (N, 2) tensor of the rows and columns of every image.
+
+    Returns:
+        (N, 4) int64 tensor of the top, left, height and width of the crops.
+    """
+    sizes = sizes.to(dtype=torch.float64, device='cpu')
+    num_imgs = sizes.shape[0]
+    attempts = 10
+    rows = sizes[:, 0:1]
+    cols = sizes[:, 1:2]
+
+    target_area = _uniform(*scale, (num_imgs, attempts), generator) * rows * cols
+    aspect_ratio = _uniform(*ratio, (num_imgs, attempts), generator)
+    w = torch.round(torch.sqrt(target_area * aspect_ratio))
+    h = torch.round(torch.sqrt(target_area / aspect_ratio))
+    hw_ratio = h / w
+    swap = (torch.rand((num_imgs, attempts), generator=generator) < 0.5) & (
+            hw_ratio >= min(ratio)) & (hw_ratio <= max(ratio))
+    w, h = torch.where(swap, h, w), torch.where(swap, w, h)
+
+    valid = (w >= 1) & (h >= 1) & (w <= cols) & (h <= rows)
+    first = valid.to(torch.uint8).argmax(dim=1, keepdim=True)
+    found = valid.any(dim=1)
+    h = h.gather(1, first).squeeze(1)
+    w = w.gather(1, first).squeeze(1)
+    rows = rows.squeeze(1)
+    cols = cols.squeeze(1)
+    top = torch.floor(torch.rand(num_imgs, generator=generator,
+                                 dtype=torch.float64) * (rows - h + 1))
+    left = torch.floor(torch.rand(num_imgs, generator=generator,
+                                  dtype=torch.float64) * (cols - w + 1))
+
+    side = torch.min(rows, cols)
+    h = torch.where(found, h, side)
+    w = torch.where(found, w, side)
+    top = torch.where(found, top, torch.floor((rows - side) / 2))
+    left = torch.where(found, left, torch.floor((cols - side) / 2))
+    return torch.stack([top, left, h, w], dim=1).long()
+
+
+def centre_crop_params(sizes, size, resize=None):
+    """
+    The boxes of cv2_transforms.Resize(resize) followed by CenterCrop(size),
+    in the coordinates of the original images (without the double
+    resampling). If resize is None, the crop covers the whole shorter edge.
+    """
+    sizes = sizes.to(dtype=torch.float64, device='cpu')
+    rows = sizes[:, 0]
+    cols = sizes[:, 1]
+    if resize is None:
+        resize = min(size)
+    factor = torch.min(rows, cols) / resize
+    h = torch.clamp(torch.round(size[0] * factor), 1).min(rows)
+    w = torch.clamp(torch.round(size[1] * factor), 1).min(cols)
+    top = torch.round((rows - h) / 2)
+    left = torch.round((cols - w) / 2)
+    return torch.stack([top, left, h, w], dim=1).long()
+
+
+def _axis_coordinates(start, length, out_length, full_length, flip,
+                      nearest, device):
+    """Normalised (align_corners=False) input coordinates of one axis."""
+    start = start.to(device=device, dtype=torch.float32)[:, None]
+    length = length.to(device=device, dtype=torch.float32)[:, None]
+    out = torch.arange(out_length, device=device, dtype=torch.float32)
+    out = out[None, :].expand(start.shape[0], -1)
+    if flip is not None:
+        out = torch.where(flip.to(device)[:, None], out_length - 1 - out, out)
+    step = length / out_length
+    if nearest:
+        # the source pixel of cv2's INTER_NEAREST
+        pixel = torch.floor(out * step)
+    else:
+        # the half pixel centres of cv2's INTER_LINEAR, replicating the border
+        pixel = (out + 0.5) * step - 0.5
+    pixel = torch.max(torch.min(pixel, length - 1), torch.zeros_like(pixel))
+    return (2 * (start + pixel) + 1) / full_length - 1
+
+
+def boxes_grid(boxes, size, full_size, flips=None, nearest=False,
+               device='cpu'):
+    """
+    The (N, size[0], size[1], 2) grid that crops every box and resizes it to
+    size, mirroring the flipped ones.
+    """
+    boxes = torch.as_tensor(boxes)
+    ys = _axis_coordinates(
+        boxes[:, 0], boxes[:, 2], size[0], full_size[0], None, nearest, device
+    )
+    xs = _axis_coordinates(
+        boxes[:, 1], boxes[:, 3], size[1], full_size[1], flips, nearest, device
+    )
+    num_imgs = boxes.shape[0]
+    return torch.stack([
+        xs[:, None, :].expand(num_imgs, size[0], size[1]),
+        ys[:, :, None].expand(num_imgs, size[0], size[1])
+    ], dim=3)
+
+
+def _rows_dim(tensor):
+    """The rows axis of an image (see the module) or label map batch."""
+    if tensor.dim() == 4 and tensor.dtype != torch.uint8:
+        return 2
+    return 1
+
+
+def crop_boxes(tensor, boxes, crop_size):
+    """
+    Copies the box of every sample into the top left corner of a zero
+    (N, ..., crop_size[0], crop_size[1], ...) batch, so only the crops are
+    converted to float and moved to the device.
+    """
+    rows_dim = _rows_dim(tensor)
+    shape = list(tensor.shape)
+    shape[rows_dim:rows_dim + 2] = crop_size
+    crops = tensor.new_zeros(shape)
+    # the rows axis of a single sample
+    dim = rows_dim - 1
+    for crop, sample, (top, left, h, w) in zip(crops, tensor, boxes.tolist()):
+        crop.narrow(dim, 0, h).narrow(dim + 1, 0, w).copy_(
+            sample.narrow(dim, top, h).narrow(dim + 1, left, w)
+        )
+    return crops
+
+
+class BatchAugmentation(object):
+    """
+    Random resized crop, random horizontal flip and normalisation of a whole
+    batch (train), or resize, centre crop and normalisation (not train).
+
+    Args:
+        size: expected output size of each edge
+        scale: range of size of the origin size cropped
+        ratio: range of aspect ratio of the origin aspect ratio cropped
+        flip_prob: the probability of a horizontal flip
+        mean: the mean of every channel after dividing uint8 by 255
+        std: the standard deviation of every channel
+        train: if False, the deterministic resize and centre crop
+        resize: the size of the shorter edge before the centre crop
+    """
+
+    def __init__(self, size, scale=(0.08, 1.0), ratio=(3. / 4., 4. / 3.),
+                 flip_prob=0.5, mean=None, std=None, train=True, resize=None):
+        if isinstance(size, numbers.Number):
+            size = (int(size), int(size))
+        self.size = tuple(size)
+        self.scale = scale
+        self.ratio = ratio
+        self.flip_prob = flip_prob
+        self.mean = mean
+        self.std = std
+        self.train = train
+        self.resize = resize
+
+    def get_params(self, sizes, generator=None):
+        if self.train:
+            boxes = random_resized_crop_params(
+                sizes, self.scale, self.ratio, generator=generator
+            )
+            flips = torch.rand(sizes.shape[0], generator=generator) < (
+                self.flip_prob)
+        else:
+            boxes = centre_crop_params(sizes, self.size, self.resize)
+            flips = None
+        return boxes, flips
+
+    def normalise(self, imgs, uint8):
+        """Dividing by 255 and normalising in one multiply-add."""
+        num_chns = imgs.shape[1]
+        mean = torch.zeros(num_chns) if self.mean is None else torch.tensor(
+            self.mean, dtype=torch.float32)
+        std = torch.ones(num_chns) if self.std is None else torch.tensor(
+            self.std, dtype=torch.float32)
+        scale = 1.0 / std
+        if uint8:
+            scale = scale / 255
+        shift = -mean / std
+        scale = scale.to(imgs.device).view(1, -1, 1, 1)
+        shift = shift.to(imgs.device).view(1, -1, 1, 1)
+        return torch.addcmul(shift, imgs, scale)
+
+    def _sample_crops(self, views, boxes, flips, nearest):
+        """
+        Resamples the crops at the top left of the (N, C, H, W) views,
+        concatenated along the channels. Only the crop of every sample is
+        converted to float, not the whole (padded) batch.
+        """
+        outputs = []
+        for n, (h, w) in enumerate(boxes[:, 2:].tolist()):
+            crop = torch.cat(
+                [view[n:n + 1, :, :h, :w].float() for view in views], dim=1
+            )
+            grid = boxes_grid(
+                boxes[n:n + 1], self.size, (h, w),
+                None if flips is None else flips[n:n + 1],
+                nearest=nearest, device=crop.device
+            )
+            outputs.append(F.grid_sample(
+                crop, grid, mode='nearest' if nearest else 'bilinear',
+                padding_mode='border', align_corners=False
+            ))
+        return torch.cat(outputs)
+
+    def __call__(self, inputs, sizes=None, generator=None, device=None):
+        """
+        Args:
+            inputs: a batch or a (nested) list/dict of paired batches.
+            sizes: (N, 2) rows and columns of every image, if the batch is
+             padded (see pad_collate), otherwise the size of the batch.
+            generator: torch.Generator of the random parameters.
+            device: where the crops are augmented, by default the device of
+             inputs.
+
+        Returns:
+            The augmented batches in the same structure.
+        """
+        tensors = _flatten_recursive(inputs, [])
+        first = tensors[0]
+        rows_dim = _rows_dim(first)
+        full_size = first.shape[rows_dim:rows_dim + 2]
+        num_imgs = first.shape[0]
+        if sizes is None:
+            sizes = torch.tensor([full_size] * num_imgs)
+        boxes, flips = self.get_params(torch.as_tensor(sizes), generator)
+
+        # the crops rather than the (padded) full images are moved
+        crop_size = tuple(boxes[:, 2:].max(dim=0)[0].tolist())
+        tensors = [crop_boxes(tensor, boxes, crop_size) for tensor in tensors]
+        if device is not None:
+            tensors = [
+                tensor.to(device, non_blocking=True) for tensor in tensors
+            ]
+        boxes = boxes.clone()
+        boxes[:, :2] = 0
+
+        imgs = []
+        labels = []
+        for i, tensor in enumerate(tensors):
+            (imgs if tensor.dim() == 4 else labels).append(i)
+        outputs = [None] * len(tensors)
+
+        if len(imgs) > 0:
+            views = []
+            uint8 = []
+            for i in imgs:
+                tensor = tensors[i]
+                uint8.append(tensor.dtype == torch.uint8)
+                if uint8[-1]:
+                    tensor = tensor.permute(0, 3, 1, 2)
+                views.append(tensor)
+            # paired images share one call of grid_sample
+            batch = self._sample_crops(views, boxes, flips, nearest=False)
+            start = 0
+            for i, is_uint8 in zip(imgs, uint8):
+                num_chns = tensors[i].shape[3 if is_uint8 else 1]
+                outputs[i] = self.normalise(
+                    batch[:, start:start + num_chns], is_uint8
+                )
+                start += num_chns
+
+        if len(labels) > 0:
+            batch = self._sample_crops(
+                [tensors[i][:, None] for i in labels], boxes, flips,
+                nearest=True
+            )
+            for j, i in enumerate(labels):
+                outputs[i] = batch[:, j].to(tensors[i].dtype)
+
+        return _unflatten_recursive(inputs, outputs)
+
+    def __repr__(self):
+        format_string = self.__class__.__name__ + '(size={0}'.format(self.size)
+        if self.train:
+            format_string += ', scale={0}'.format(
+                tuple(round(s, 4) for s in self.scale))
+            format_string += ', ratio={0}'.format(
+                tuple(round(r, 4) for r in self.ratio))
+            format_string += ', flip_prob={0}'.format(self.flip_prob)
+        else:
+            format_string += ', resize={0}'.format(self.resize)
+        format_string += ', mean={0}, std={1})'.format(self.mean, self.std)
+        return format_string
+
+
+def _pad_recursive(inputs, rows, cols):
+    if isinstance(inputs, (list, tuple)):
+        return type(inputs)(_pad_recursive(item, rows, cols)
+                            for item in inputs)
+    elif isinstance(inputs, dict):
+        return {key: _pad_recursive(item, rows, cols)
+                for key, item in inputs.items()}
+    elif isinstance(inputs, np.ndarray) and inputs.ndim >= 2:
+        padding = [(0, rows - inputs.shape[0]), (0, cols - inputs.shape[1])]
+        padding += [(0, 0)] * (inputs.ndim - 2)
+        return np.pad(inputs, padding, mode='constant')
+    return inputs
+
+
+def pad_collate(batch):
+    """
+    Collating cv2 images of different sizes (e.g. without a per sample
+    crop) by padding them to the largest one. Returns the collated batch and
+    the (N, 2) sizes of the images, as expected by BatchAugmentation.
+    """
+    sizes = [_find_first_tensor_recursive(sample).shape[:2] for sample in batch]
+    rows = max(size[0] for size in sizes)
+    cols = max(size[1] for size in sizes)
+    batch = [_pad_recursive(sample, rows, cols) for sample in batch]
+    return default_collate(batch), torch.tensor(sizes)
+
+
+class AugmentedLoader(object):
+    """
+    Wraps a data loader collating with pad_collate and augments the images
+    of every batch on device with a BatchAugmentation. The other outputs of
+    the batch (e.g. the targets) are only moved.
+    """
+
+    def __init__(self, loader, augmentation, device):
+        self.loader = loader
+        self.augmentation = augmentation
+        self.device = device
+        self.dataset = loader.dataset
+        self.batch_size = loader.batch_size
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for (imgs, *others), sizes in self.loader:
+            # the crops are cut on the host, only they are moved
+            imgs = self.augmentation(imgs, sizes, device=self.device)
+            others = [
+                other.to(self.device, non_blocking=True)
+                if torch.is_tensor(other) else other for other in others
+            ]
+            yield (imgs, *others)
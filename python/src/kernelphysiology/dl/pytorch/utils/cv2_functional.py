@@ -6,7 +6,7 @@ from __future__ import division
 
 import numpy as np
 import numbers
-import collections
+import collections.abc
 import warnings
 
 import torch
@@ -46,12 +46,12 @@ def to_tensor(pic):
     if _is_numpy_image(pic):
         if len(pic.shape) == 2:
             pic = np.expand_dims(pic, axis=2)
-        img = torch.from_numpy(pic.transpose((2, 0, 1))).type(torch.FloatTensor)
+        # one copy, which is writable even if pic is a shared read-only view
+        img = torch.from_numpy(pic.transpose((2, 0, 1)).astype(np.float32))
         # backward compatibility
-        if isinstance(img, torch.ByteTensor) or img.max() > 1:
-            return img.float().div(255)
-        else:
-            return img
+        if img.max() > 1:
+            img.div_(255)
+        return img
     elif _is_tensor_image(pic):
         return pic
     else:
@@ -119,7 +119,7 @@ def resize(img, size, interpolation='BILINEAR'):
     if not _is_numpy_image(img):
         raise TypeError('img should be CV Image. Got {}'.format(type(img)))
     if not (isinstance(size, int) or (
-            isinstance(size, collections.Iterable) and len(size) == 2)):
+            isinstance(size, collections.abc.Iterable) and len(size) == 2)):
         raise TypeError('Got inappropriate size arg: {}'.format(size))
 
     if isinstance(size, int):
@@ -227,7 +227,7 @@ def pad(img, padding, fill=(0, 0, 0), padding_mode='constant'):
     if not isinstance(padding_mode, str):
         raise TypeError('Got inappropriate padding_mode arg')
 
-    if isinstance(padding, collections.Sequence) and len(padding) not in [2, 4]:
+    if isinstance(padding, collections.abc.Sequence) and len(padding) not in [2, 4]:
         raise ValueError(
             "Padding must be an int or a 2, or 4 element tuple, not a " +
             "{} element tuple".format(len(padding)))
@@ -239,10 +239,10 @@ def pad(img, padding, fill=(0, 0, 0), padding_mode='constant'):
     pad_left = pad_right = pad_top = pad_bottom = 0
     if isinstance(padding, int):
         pad_left = pad_right = pad_top = pad_bottom = padding
-    if isinstance(padding, collections.Sequence) and len(padding) == 2:
+    if isinstance(padding, collections.abc.Sequence) and len(padding) == 2:
         pad_left = pad_right = padding[0]
         pad_top = pad_bottom = padding[1]
-    if isinstance(padding, collections.Sequence) and len(padding) == 4:
+    if isinstance(padding, collections.abc.Sequence) and len(padding) == 4:
         pad_left, pad_top, pad_right, pad_bottom = padding
 
     if isinstance(fill, numbers.Number):
@@ -69,6 +69,10 @@ class ColourSpaceTransformation(object):
     def __init__(self, colour_space='rgb'):
         self.colour_space = colour_space
 
+    @property
+    def identity(self):
+        return self.colour_space == 'rgb'
+
     def __call__(self, img):
         # TODO: move the if statmenets to a separate function to speed up.
         if self.colour_space != 'rgb':
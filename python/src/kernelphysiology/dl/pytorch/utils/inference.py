@@ -0,0 +1,108 @@
+"""
+Running networks for evaluation on any device, including CPU-only machines.
+"""
+
+import contextlib
+import warnings
+
+import torch
+import torch.nn as nn
+
+from kernelphysiology.dl.utils import default_configs
+
+
+def select_device(device=None):
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return torch.device(device)
+
+
+def _float_inputs(module, inputs):
+    return tuple(
+        x.float() if torch.is_tensor(x) and x.is_floating_point() else x
+        for x in inputs
+    )
+
+
+def quantise_heads(model):
+    """
+    Dynamic int8 quantisation of the fully connected layers (CPU only).
+    Their inputs are cast to float32, the only type the quantised kernels
+    take, e.g. the bfloat16 outputs of autocast.
+    """
+    model = torch.quantization.quantize_dynamic(
+        model, {nn.Linear}, dtype=torch.qint8
+    )
+    for module in model.modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            module.register_forward_pre_hook(_float_inputs)
+    return model
+
+
+def _to_float(data):
+    if torch.is_tensor(data):
+        return data.float() if data.dtype == torch.bfloat16 else data
+    elif isinstance(data, dict):
+        return {key: _to_float(val) for key, val in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return type(data)(_to_float(val) for val in data)
+    return data
+
+
+class InferenceRunner(object):
+    """
+    Puts the model in eval mode on the device and calls it without
+    gradients. On the CPU, the model and its image inputs use the
+    channels_last memory format, bfloat16 autocast is optional (outputs are
+    returned as float32) and the fully connected layers can be dynamically
+    quantised to int8.
+    """
+
+    def __init__(self, model, device=None, num_threads=None,
+                 cpu_dtype='float32', quantise=False):
+        self.device = select_device(device)
+        self.on_cpu = self.device.type == 'cpu'
+        model = model.eval().to(self.device)
+        if self.on_cpu:
+            num_threads = default_configs.get_num_threads(num_threads)
+            if num_threads is not None:
+                torch.set_num_threads(num_threads)
+            model = model.to(memory_format=torch.channels_last)
+            if quantise:
+                model = quantise_heads(model)
+        elif quantise:
+            warnings.warn(
+                'Dynamic int8 quantisation only runs on the CPU, the model '
+                'on %s is not quantised.' % self.device
+            )
+        self.model = model
+        self.autocast = self.on_cpu and cpu_dtype == 'bfloat16'
+
+    @classmethod
+    def from_args(cls, model, args):
+        return cls(
+            model, device=args.device, num_threads=args.num_threads,
+            cpu_dtype=args.cpu_dtype, quantise=args.quantise_heads
+        )
+
+    def to_device(self, x):
+        x = x.to(self.device, non_blocking=True)
+        if self.on_cpu and x.dim() == 4 and x.is_floating_point():
+            x = x.contiguous(memory_format=torch.channels_last)
+        return x
+
+    def context(self):
+        """No gradients, and autocast if selected."""
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.no_grad())
+        if self.autocast:
+            stack.enter_context(
+                torch.autocast('cpu', dtype=torch.bfloat16)
+            )
+        return stack
+
+    def __call__(self, *inputs):
+        inputs = [self.to_device(x) for x in inputs]
+        with self.context():
+            out = self.model(*inputs)
+        return _to_float(out)
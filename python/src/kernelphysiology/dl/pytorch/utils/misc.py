@@ -9,12 +9,18 @@ import shutil
 import torch
 import torchvision.transforms as transforms
 
-from kernelphysiology.dl.pytorch.datasets.utils_db import get_validation_dataset
+from kernelphysiology.dl.pytorch.datasets import image_loaders
 from kernelphysiology.dl.pytorch.models import model_utils
+from kernelphysiology.dl.pytorch.models import lesion_sweep
+from kernelphysiology.dl.pytorch.models import model_export
 from kernelphysiology.dl.pytorch.utils import preprocessing
 from kernelphysiology.dl.pytorch.utils.cv2_transforms import NormalizeInverse
 from kernelphysiology.dl.utils import prepapre_testing
 from kernelphysiology.dl.utils.default_configs import get_default_target_size
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+# the datasets pull in the segmentation and COCO utilities
+utils_db = lazy_import('kernelphysiology.dl.pytorch.datasets.utils_db')
 
 
 class AverageMeter(object):
@@ -40,6 +46,136 @@ class AverageMeter(object):
         self.avg = self.sum / self.count
 
 
+class DeviceAverageMeter(object):
+    """
+    Same interface as AverageMeter, but tensors are accumulated on their
+    device and only copied to the host when val, sum or avg are read.
+    """
+
+    def __init__(self):
+        self._val = 0
+        self._sum = 0
+        self.count = 0
+        self.reset()
+
+    def reset(self):
+        self._val = 0
+        self._sum = 0
+        self.count = 0
+
+    def update(self, val, n=1):
+        if torch.is_tensor(val):
+            val = val.detach()
+        self._val = val
+        self._sum = self._sum + val * n
+        self.count += n
+
+    @property
+    def val(self):
+        return float(self._val)
+
+    @property
+    def sum(self):
+        return float(self._sum)
+
+    @property
+    def avg(self):
+        if self.count == 0:
+            return 0
+        return self.sum / self.count
+
+
+class LossAccumulator(object):
+    """
+    Running sums of a dictionary of losses (e.g. model.latest_losses()) kept
+    on the device, all values are copied to the host at once when read.
+    """
+
+    def __init__(self, keys, suffix=''):
+        self.keys = list(keys)
+        self.suffix = suffix
+        self.sums = dict()
+        self.reset()
+
+    def reset(self):
+        self.sums = {key: 0 for key in self.keys}
+
+    def update(self, losses):
+        for key, val in losses.items():
+            if torch.is_tensor(val):
+                val = val.detach()
+            self.sums[key] = self.sums[key] + val
+
+    def values(self, divisor=1):
+        tensors = [val for val in self.sums.values() if torch.is_tensor(val)]
+        if len(tensors) > 0:
+            device = tensors[0].device
+            host_vals = iter(torch.stack(
+                [val.to(device).float().reshape(()) for val in tensors]
+            ).tolist())
+        sums = {
+            key: next(host_vals) if torch.is_tensor(val) else float(val)
+            for key, val in self.sums.items()
+        }
+        return {key + self.suffix: val / divisor for key, val in sums.items()}
+
+
+def _to_device(data, device):
+    if torch.is_tensor(data):
+        return data.to(device, non_blocking=True)
+    elif isinstance(data, dict):
+        return {key: _to_device(val, device) for key, val in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return type(data)(_to_device(val, device) for val in data)
+    return data
+
+
+class DataPrefetcher(object):
+    """
+    Wraps a data loader and copies the next batch to the GPU on a side
+    stream while the current one is processed. Without CUDA the batches of
+    the loader are returned unchanged.
+    """
+
+    def __init__(self, loader, device=None):
+        self.loader = loader
+        self.device = device
+        self.dataset = loader.dataset
+        self.batch_size = loader.batch_size
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if not torch.cuda.is_available():
+            yield from self.loader
+            return
+        device = torch.device('cuda' if self.device is None else self.device)
+        stream = torch.cuda.Stream(device=device)
+        next_data = None
+        for data in self.loader:
+            with torch.cuda.stream(stream):
+                data = _to_device(data, device)
+            if next_data is not None:
+                yield next_data
+            torch.cuda.current_stream(device).wait_stream(stream)
+            next_data = data
+            _record_stream(next_data, torch.cuda.current_stream(device))
+        if next_data is not None:
+            yield next_data
+
+
+def _record_stream(data, stream):
+    if torch.is_tensor(data):
+        data.record_stream(stream)
+    elif isinstance(data, dict):
+        for val in data.values():
+            _record_stream(val, stream)
+    elif isinstance(data, (list, tuple)):
+        for val in data:
+            _record_stream(val, stream)
+
+
 def save_checkpoint(state, is_best, filename='checkpoint.pth.tar',
                     out_folder=''):
     filename = os.path.join(out_folder, filename)
@@ -70,7 +206,7 @@ def accuracy_preds(output, target, topk=(1,)):
         corrects = []
         for k in topk:
             corrects.append(correct[:k])
-            correct_k = correct[:k].view(-1).float().sum(0, keepdim=True)
+            correct_k = correct[:k].reshape(-1).float().sum(0, keepdim=True)
             res.append(correct_k.mul_(100.0 / batch_size))
         return res, corrects
 
@@ -83,15 +219,18 @@ def accuracy(output, target, topk=(1,)):
 def train_on_data(train_loader, model, criterion, optimizer, epoch, args):
     batch_time = AverageMeter()
     data_time = AverageMeter()
-    losses = AverageMeter()
-    top1 = AverageMeter()
-    top5 = AverageMeter()
+    losses = DeviceAverageMeter()
+    top1 = DeviceAverageMeter()
+    top5 = DeviceAverageMeter()
 
     if args.top_k is None:
         topks = (1,)
     else:
         topks = (1, args.top_k)
 
+    if args.prefetch:
+        train_loader = DataPrefetcher(train_loader, args.gpus)
+
     # switch to train mode
     model.train()
 
@@ -110,7 +249,7 @@ def train_on_data(train_loader, model, criterion, optimizer, epoch, args):
 
         # measure accuracy and record loss
         acc1, acc5 = accuracy(output, target, topk=topks)
-        losses.update(loss.item(), input_image.size(0))
+        losses.update(loss, input_image.size(0))
         top1.update(acc1[0], input_image.size(0))
         top5.update(acc5[0], input_image.size(0))
 
@@ -141,15 +280,18 @@ def train_on_data(train_loader, model, criterion, optimizer, epoch, args):
 
 def validate_on_data(val_loader, model, criterion, args):
     batch_time = AverageMeter()
-    losses = AverageMeter()
-    top1 = AverageMeter()
-    top5 = AverageMeter()
+    losses = DeviceAverageMeter()
+    top1 = DeviceAverageMeter()
+    top5 = DeviceAverageMeter()
 
     if args.top_k is None:
         topks = (1,)
     else:
         topks = (1, args.top_k)
 
+    if args.prefetch:
+        val_loader = DataPrefetcher(val_loader, args.gpus)
+
     # switch to evaluate mode
     model.eval()
 
@@ -166,7 +308,7 @@ def validate_on_data(val_loader, model, criterion, args):
 
             # measure accuracy and record loss
             acc1, acc5 = accuracy(output, target, topk=topks)
-            losses.update(loss.item(), input_image.size(0))
+            losses.update(loss, input_image.size(0))
             top1.update(acc1[0], input_image.size(0))
             top5.update(acc5[0], input_image.size(0))
 
@@ -233,11 +375,19 @@ def generic_evaluation(args, fn, save_fn=None, **kwargs):
     manipulation_name = args.parameters['f_name']
     for j, current_network in enumerate(args.network_files):
         # which architecture
-        (model, target_size) = model_utils.which_network(
-            current_network, args.task_type, num_classes=args.num_classes,
-            kill_kernels=args.kill_kernels, kill_planes=args.kill_planes,
-            kill_lines=args.kill_lines
+        (model, target_size) = model_export.which_network(
+            current_network, args.task_type, backend=args.backend,
+            num_classes=args.num_classes, kill_kernels=args.kill_kernels,
+            kill_planes=args.kill_planes, kill_lines=args.kill_lines
         )
+        if args.lesion_sweep is not None:
+            specs = lesion_sweep.lesion_sweep_specs(
+                model, args.lesion_sweep, kill_planes=args.kill_planes,
+                kill_lines=args.kill_lines
+            )
+            model = lesion_sweep.LesionSweep(
+                model, specs, args.lesion_variants
+            )
         model.to(args.device)
         mean, std = model_utils.get_preprocessing_function(
             args.colour_space, args.network_chromaticities[j]
@@ -276,10 +426,15 @@ def generic_evaluation(args, fn, save_fn=None, **kwargs):
                 args.dataset, args.target_size
             )
 
-            validation_dataset = get_validation_dataset(
+            loader = None
+            if ('reduced_decoding' in args and args.reduced_decoding and
+                    args.dataset in utils_db.folder_dbs):
+                # only these test images are resized to target_size anyway
+                loader = image_loaders.JpegLoader(target_size)
+            validation_dataset = utils_db.get_validation_dataset(
                 args.dataset, args.validation_dir, colour_vision,
                 args.colour_space, other_transformations, normalize,
-                target_size, task=args.task_type
+                target_size, task=args.task_type, loader=loader
             )
 
             # TODO: nicer solution:
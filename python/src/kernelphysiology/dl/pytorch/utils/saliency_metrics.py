@@ -0,0 +1,177 @@
+"""
+Saliency metrics of batches of maps on their device, the torch counterparts
+of the *_batch functions in kernelphysiology.analysis.metrics.visual_attention.
+Every function takes (B, ...) tensors and returns a (B) tensor, maps without
+fixations are NaN.
+"""
+
+import torch
+
+
+def _batch_maps(saliency_maps, fixation_maps):
+    """(B, ...) saliency and fixation maps as (B, P) tensors."""
+    if saliency_maps.shape != fixation_maps.shape:
+        raise ValueError('saliency_maps.shape != fixation_maps.shape')
+    num_maps = saliency_maps.shape[0]
+    return (saliency_maps.reshape(num_maps, -1).double(),
+            fixation_maps.reshape(num_maps, -1))
+
+
+def _normalise(maps, method):
+    """Normalising every row of maps, with method 'standard' or 'range'."""
+    if method == 'standard':
+        return (maps - maps.mean(dim=1, keepdim=True)) / maps.std(
+            dim=1, unbiased=False, keepdim=True)
+    mins = maps.min(dim=1, keepdim=True)[0]
+    return (maps - mins) / (maps.max(dim=1, keepdim=True)[0] - mins)
+
+
+def argmax_fixations(maps):
+    """One fixation at the maximum of every map, e.g. a target heat map."""
+    num_maps = maps.shape[0]
+    fixation_maps = torch.zeros(
+        num_maps, maps[0].numel(), dtype=torch.bool, device=maps.device
+    )
+    fixation_maps[
+        torch.arange(num_maps, device=maps.device),
+        maps.reshape(num_maps, -1).argmax(dim=1)
+    ] = True
+    return fixation_maps.reshape(maps.shape)
+
+
+def auc_judd(saliency_maps, fixation_maps, jitter=True):
+    s_maps, f_maps = _batch_maps(saliency_maps, fixation_maps)
+    f_maps = f_maps > 0.5
+    if jitter:
+        s_maps = s_maps + torch.rand_like(s_maps) * 1e-7
+    s_maps = _normalise(s_maps, 'range')
+    num_pixels = s_maps.shape[1]
+    n_fix = f_maps.sum(dim=1)
+
+    # the sorted fixation values of every map, padded with inf
+    inf = torch.tensor(float('inf'), dtype=s_maps.dtype, device=s_maps.device)
+    s_fix = torch.where(f_maps, s_maps, inf).sort(dim=1)[0]
+    s_fix = s_fix[:, :max(int(n_fix.max()), 1)].contiguous()
+    # see AUC_Judd_batch, every pixel adds the number of fixations <= it
+    passed = torch.searchsorted(s_fix, s_maps, right=True)
+    sum_above = passed.sum(dim=1).double()
+    last_above = (s_maps >= s_fix[:, :1]).sum(dim=1).double()
+
+    n_fix = n_fix.double()
+    n_other = num_pixels - n_fix
+    sum_fp = (sum_above - n_fix * (n_fix + 1) / 2) / n_other
+    last_fp = (last_above - n_fix) / n_other
+    auc = 1 - sum_fp / n_fix + last_fp / (2 * n_fix)
+    auc[n_fix == 0] = float('nan')
+    return auc
+
+
+def _auc_borji(s_maps, f_maps, s_rand, rand_ids, step_size):
+    """
+    AUC_Borji of normalised (B, P) saliency maps, with n_rep random values
+    s_rand (R, n_rep) sampled from the maps rand_ids (R).
+    """
+    num_maps = s_maps.shape[0]
+    n_rep = s_rand.shape[1]
+    device = s_maps.device
+    thresholds = torch.arange(
+        0, 1, step_size, dtype=s_maps.dtype, device=device
+    )
+    num_thresholds = len(thresholds)
+
+    def num_above(values, keys, num_keys):
+        passed = torch.searchsorted(thresholds, values.contiguous(), right=True)
+        hist = torch.bincount(
+            (keys * (num_thresholds + 1) + passed).reshape(-1),
+            minlength=num_keys * (num_thresholds + 1)
+        ).reshape(num_keys, num_thresholds + 1)
+        return hist.flip(1).cumsum(dim=1).flip(1)[:, 1:]
+
+    fix_ids, fix_pixels = f_maps.nonzero(as_tuple=True)
+    s_fix = s_maps[fix_ids, fix_pixels]
+    n_fix = torch.bincount(fix_ids, minlength=num_maps)
+    tp = num_above(s_fix, fix_ids, num_maps)[:, None]
+    rand_keys = rand_ids[:, None] * n_rep + torch.arange(n_rep, device=device)
+    fp = num_above(s_rand, rand_keys, num_maps * n_rep).reshape(
+        num_maps, n_rep, num_thresholds
+    )
+
+    # the thresholds of every split run up to its maximum saliency
+    max_fix = torch.zeros(num_maps, dtype=s_maps.dtype, device=device)
+    max_fix = max_fix.scatter_reduce(0, fix_ids, s_fix, 'amax')
+    max_rand = torch.zeros(num_maps, n_rep, dtype=s_maps.dtype, device=device)
+    max_rand = max_rand.scatter_reduce(
+        0, rand_ids[:, None].expand_as(s_rand), s_rand, 'amax'
+    )
+    num_valid = torch.ceil(torch.max(max_fix[:, None], max_rand) / step_size)
+    valid = torch.arange(num_thresholds, device=device) < num_valid[:, :, None]
+
+    n_fix = n_fix.double()[:, None, None]
+    tp = torch.where(valid, tp.double(), 0.) / n_fix
+    fp = torch.where(valid, fp.double(), 0.) / n_fix
+    zeros = tp.new_zeros(num_maps, n_rep, 1)
+    ones = tp.new_ones(num_maps, n_rep, 1)
+    tp = torch.cat([zeros, tp.flip(2), ones], dim=2)
+    fp = torch.cat([zeros, fp.flip(2), ones], dim=2)
+    auc = torch.trapezoid(tp, fp, dim=2).mean(dim=1)
+    auc[n_fix.reshape(-1) == 0] = float('nan')
+    return auc
+
+
+def auc_borji(saliency_maps, fixation_maps, n_rep=100, step_size=0.1):
+    s_maps, f_maps = _batch_maps(saliency_maps, fixation_maps)
+    f_maps = f_maps > 0.5
+    s_maps = _normalise(s_maps, 'range')
+    fix_ids = f_maps.nonzero(as_tuple=True)[0]
+    r = torch.randint(
+        0, s_maps.shape[1], (len(fix_ids), n_rep), device=s_maps.device
+    )
+    s_rand = s_maps[fix_ids[:, None], r]
+    return _auc_borji(s_maps, f_maps, s_rand, fix_ids, step_size)
+
+
+def auc_shuffled(saliency_maps, fixation_maps, other_maps, n_rep=100,
+                 step_size=0.1):
+    s_maps, f_maps = _batch_maps(saliency_maps, fixation_maps)
+    _, other_maps = _batch_maps(saliency_maps, other_maps)
+    f_maps = f_maps > 0.5
+    other_maps = other_maps > 0.5
+    s_maps = _normalise(s_maps, 'range')
+    n_fix = f_maps.sum(dim=1)
+    s_rand = []
+    rand_ids = []
+    for i in n_fix.nonzero(as_tuple=True)[0].tolist():
+        # n_rep random subsets of the fixated locations of the other map
+        fixated = other_maps[i].nonzero(as_tuple=True)[0]
+        keys = torch.rand(n_rep, len(fixated), device=s_maps.device)
+        r = fixated[keys.argsort(dim=1)[:, :n_fix[i]]].t()
+        s_rand.append(s_maps[i, r])
+        rand_ids.append(torch.full_like(r[:, 0], i))
+    if len(s_rand) == 0:
+        return s_maps.new_full((s_maps.shape[0],), float('nan'))
+    return _auc_borji(
+        s_maps, f_maps, torch.cat(s_rand), torch.cat(rand_ids), step_size
+    )
+
+
+def nss(saliency_maps, fixation_maps):
+    s_maps, f_maps = _batch_maps(saliency_maps, fixation_maps)
+    f_maps = f_maps > 0.5
+    s_maps = _normalise(s_maps, 'standard')
+    return (s_maps * f_maps).sum(dim=1) / f_maps.sum(dim=1)
+
+
+def cc(saliency_maps1, saliency_maps2):
+    maps1, maps2 = _batch_maps(saliency_maps1, saliency_maps2)
+    maps1 = _normalise(maps1, 'standard')
+    maps2 = _normalise(maps2.double(), 'standard')
+    return (maps1 * maps2).mean(dim=1)
+
+
+def sim(saliency_maps1, saliency_maps2):
+    maps1, maps2 = _batch_maps(saliency_maps1, saliency_maps2)
+    maps1 = _normalise(maps1, 'range')
+    maps2 = _normalise(maps2.double(), 'range')
+    maps1 = maps1 / maps1.sum(dim=1, keepdim=True)
+    maps2 = maps2 / maps2.sum(dim=1, keepdim=True)
+    return torch.min(maps1, maps2).sum(dim=1)
@@ -11,16 +11,20 @@ import time
 import errno
 import os
 
-from skimage import io
-
 import torch
 import torch.distributed as dist
 import torchvision
 
-from kernelphysiology.dl.pytorch.datasets import segmentations_db
 from kernelphysiology.dl.pytorch.models.model_utils import get_preprocessing_function
 from kernelphysiology.dl.pytorch.utils import preprocessing
 from kernelphysiology.dl.pytorch.utils import transforms as T
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+io = lazy_import('skimage.io')
+# the datasets need pycocotools
+segmentations_db = lazy_import(
+    'kernelphysiology.dl.pytorch.datasets.segmentations_db'
+)
 
 
 class SmoothedValue(object):
@@ -5,7 +5,7 @@ Transformations on tensors without going to CPU.
 import warnings
 import sys
 import collections
-from scipy import linalg
+from numpy import linalg
 
 import torch
 
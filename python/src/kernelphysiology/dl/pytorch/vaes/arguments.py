@@ -114,6 +114,9 @@ def parse_arguments(args):
                                  help='visualise the output in RGB')
     training_parser.add_argument('--gpus', default='0',
                                  help='gpus used for training - e.g 0,1,3')
+    training_parser.add_argument('--prefetch', action='store_true',
+                                 default=False,
+                                 help='prefetch the next batch to GPU')
 
     logging_parser = parser.add_argument_group('Logging Parameters')
     logging_parser.add_argument(
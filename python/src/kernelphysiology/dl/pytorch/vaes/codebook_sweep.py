@@ -0,0 +1,164 @@
+"""
+Sweeping codebook exclusions of a VQ-VAE with one encoding per batch.
+"""
+
+import numpy as np
+import math
+
+import torch
+
+
+def exclusion_indices(k, exclude):
+    """
+    Returns the indices of the codebook vectors zeroed by an exclusion, using
+    the same convention as the --exclude argument: a positive value removes
+    that (1-based) vector, a negative value removes all but that vector and
+    zero removes nothing.
+    """
+    if exclude > 0:
+        return [exclude - 1]
+    elif exclude < 0:
+        which_vec = [*range(k)]
+        which_vec.remove(abs(exclude) - 1)
+        return which_vec
+    return []
+
+
+def exclude_vectors(model, exclude):
+    which_vec = exclusion_indices(model.k, exclude)
+    if len(which_vec) > 0:
+        print(which_vec)
+        model.state_dict()['emb.weight'][:, which_vec] = 0
+    return model
+
+
+def sweep_exclusions(k, excludes=None):
+    """
+    Returns the list of exclusions to sweep, by default all positive
+    exclusions (i.e. each codebook vector removed once).
+    """
+    if excludes is None or len(excludes) == 0:
+        return [*range(1, k + 1)]
+    for exclude in excludes:
+        if exclude == 0 or abs(exclude) > k:
+            raise ValueError(
+                'Exclusion %d is out of range for %d vectors.' % (exclude, k)
+            )
+    return list(excludes)
+
+
+def exclusion_masks(k, excludes, device=None):
+    """
+    Returns a boolean tensor of shape (V, K), True for the vectors zeroed in
+    each of the V exclusions.
+    """
+    masks = torch.zeros(len(excludes), k, dtype=torch.bool, device=device)
+    for i, exclude in enumerate(excludes):
+        masks[i, exclusion_indices(k, exclude)] = True
+    return masks
+
+
+def codebook_distances(model, z_e):
+    """
+    Distances of every latent to every codebook vector, computed as in
+    NearestEmbedFunc, of shape (B, *, K). The second output is the distance
+    of every latent to a zeroed vector, of shape (B, *, 1).
+    """
+    weight = model.emb.weight.detach()
+    num_arbitrary_dims = z_e.dim() - 2
+    x_expanded = z_e.unsqueeze(-1)
+    emb_expanded = weight.view(
+        weight.shape[0], *([1] * num_arbitrary_dims), weight.shape[1]
+    )
+    if model.emb.cos_distance:
+        cos_sim = torch.nn.functional.cosine_similarity(
+            x_expanded, emb_expanded.unsqueeze(0), dim=1
+        )
+        dist = torch.acos(cos_sim)
+        # cosine similarity to the zero vector is zero
+        zero_dist = torch.full_like(dist[..., :1], math.pi / 2)
+    else:
+        dist = torch.norm(x_expanded - emb_expanded, 2, 1)
+        zero_dist = torch.norm(z_e, 2, 1).unsqueeze(-1)
+    return dist, zero_dist
+
+
+def masked_argmin(dist, zero_dist, masks):
+    """
+    Nearest codebook vector of every latent for each exclusion, re-derived
+    from the stored distances. The output is of shape (V, B, *).
+    """
+    view_shape = [masks.shape[0], *([1] * (dist.dim() - 1)), masks.shape[1]]
+    masked_dist = torch.where(
+        masks.view(view_shape), zero_dist.unsqueeze(0), dist.unsqueeze(0)
+    )
+    _, argmin = masked_dist.min(-1)
+    return argmin
+
+
+def masked_quantise(model, argmin, masks):
+    """
+    Looks up the masked codebooks of all exclusions at once, returning a
+    tensor of shape (V, B, KL, *).
+    """
+    weight = model.emb.weight.detach()
+    # (V, K, KL) codebooks with the excluded vectors zeroed
+    weights = torch.where(
+        masks.unsqueeze(-1), weight.new_zeros(()), weight.t()
+    )
+    variant_inds = torch.arange(masks.shape[0], device=argmin.device).view(
+        -1, *([1] * (argmin.dim() - 1))
+    )
+    z_q = weights[variant_inds, argmin]
+    dims = list(range(z_q.dim()))
+    return z_q.permute(0, 1, dims[-1], *dims[2:-1]).contiguous()
+
+
+def encode_sweep(model, x, masks):
+    """
+    Encodes a batch once and returns the nearest vectors of every exclusion.
+    """
+    z_e = model.encode(x)
+    dist, zero_dist = codebook_distances(model, z_e)
+    return masked_argmin(dist, zero_dist, masks)
+
+
+def decode_sweep(model, argmin, masks, variants_per_decode=None):
+    """
+    Decodes all exclusions of a batch, in one batched decode unless
+    variants_per_decode limits the number of variants decoded together.
+    The output is of shape (V, B, C, H, W).
+    """
+    num_variants = masks.shape[0]
+    if variants_per_decode is None:
+        variants_per_decode = num_variants
+    outputs = []
+    for i in range(0, num_variants, variants_per_decode):
+        chunk = slice(i, i + variants_per_decode)
+        z_q = masked_quantise(model, argmin[chunk], masks[chunk])
+        chunk_variants, batch_size = z_q.shape[:2]
+        out = model.decode(z_q.view(-1, *z_q.shape[2:]))
+        outputs.append(out.view(chunk_variants, batch_size, *out.shape[1:]))
+    return torch.cat(outputs, dim=0)
+
+
+def index_histograms(argmin, k):
+    """
+    Normalised histograms of the codebook indices of every exclusion and
+    image, equivalent to np.histogram with unit bins and density=True. The
+    output is of shape (V, B, K).
+    """
+    num_variants, batch_size = argmin.shape[:2]
+    flat = argmin.reshape(num_variants * batch_size, -1)
+    offsets = torch.arange(flat.shape[0], device=flat.device).unsqueeze(1) * k
+    counts = torch.bincount(
+        (flat + offsets).view(-1), minlength=flat.shape[0] * k
+    ).view(num_variants, batch_size, k).float()
+    return counts / flat.shape[1]
+
+
+def save_sweep_table(file_path, excludes, rows, columns):
+    table = np.concatenate(
+        [np.array(excludes).reshape(-1, 1), np.array(rows)], axis=1
+    )
+    np.savetxt(file_path, table, header=' '.join(['exclude', *columns]))
@@ -9,9 +9,12 @@ from torchvision import transforms
 from kernelphysiology.dl.pytorch.datasets import data_loaders
 
 from kernelphysiology.dl.pytorch.vaes import model as vqmodel
+from kernelphysiology.dl.pytorch.vaes import codebook_sweep
 
 from kernelphysiology.dl.pytorch.utils import cv2_transforms
 from kernelphysiology.dl.pytorch.utils import cv2_preprocessing
+from kernelphysiology.dl.pytorch.utils import inference
+from kernelphysiology.dl.utils import argument_groups
 from kernelphysiology.utils import imutils
 
 
@@ -33,6 +36,8 @@ def parse_arguments(args):
                         default=False, help='cosine distance')
     parser.add_argument('--exclude', type=int, default=0, metavar='K',
                         help='number of atoms in dictionary')
+    parser.add_argument('--exclude_sweep', type=int, nargs='*', default=None,
+                        help='exclusions to sweep in one run (default: all)')
     parser.add_argument('--colour_space', type=str, default=None,
                         help='The type of output colour space.')
     parser.add_argument('--manipulation', type=str, nargs='+', default=None,
@@ -60,6 +65,7 @@ def parse_arguments(args):
         default=None,
         help='The path to the validation directory (default: None)'
     )
+    argument_groups.get_inference_group(parser)
 
     return parser.parse_args(args)
 
@@ -70,17 +76,9 @@ def main(args):
     network = vqmodel.VQ_CVAE(128, k=args.k, kl=args.kl, in_chns=3,
                               cos_distance=args.cos_dis)
     network.load_state_dict(weights_rgb)
-    if args.exclude > 0:
-        which_vec = [args.exclude - 1]
-        print(which_vec)
-        network.state_dict()['emb.weight'][:, which_vec] = 0
-    elif args.exclude < 0:
-        which_vec = [*range(8)]
-        which_vec.remove(abs(args.exclude) - 1)
-        print(which_vec)
-        network.state_dict()['emb.weight'][:, which_vec] = 0
-    network.cuda()
-    network.eval()
+    if args.exclude_sweep is None:
+        codebook_sweep.exclude_vectors(network, args.exclude)
+    runner = inference.InferenceRunner.from_args(network, args)
 
     if not os.path.exists(args.out_dir):
         os.mkdir(args.out_dir)
@@ -175,17 +173,20 @@ def main(args):
             ),
             batch_size=args.batch_size, shuffle=False
         )
-    export(test_loader, network, mean, std, args)
+    if args.exclude_sweep is None:
+        export(test_loader, runner, mean, std, args)
+    else:
+        export_sweep(test_loader, runner, args)
 
 
-def export(data_loader, model, mean, std, args):
+def export(data_loader, runner, mean, std, args):
     hists = []
-    bins = [*range(model.state_dict()['emb.weight'].shape[1] + 1)]
-    hist_rng = [0, model.state_dict()['emb.weight'].shape[1] - 1]
+    emb_weight = runner.model.state_dict()['emb.weight']
+    bins = [*range(emb_weight.shape[1] + 1)]
+    hist_rng = [0, emb_weight.shape[1] - 1]
     with torch.no_grad():
         for i, (img_readies, img_target, img_paths) in enumerate(data_loader):
-            img_readies = img_readies.cuda()
-            out_rgb = model(img_readies)
+            out_rgb = runner(img_readies)
             out_rgb = out_rgb[3].detach().cpu().numpy()
 
             for img_ind in range(out_rgb.shape[0]):
@@ -200,5 +201,29 @@ def export(data_loader, model, mean, std, args):
             )
 
 
+def export_sweep(data_loader, runner, args):
+    model = runner.model
+    excludes = codebook_sweep.sweep_exclusions(model.k, args.exclude_sweep)
+    masks = codebook_sweep.exclusion_masks(
+        model.k, excludes, device=runner.device
+    )
+    hists = []
+    with runner.context():
+        for i, (img_readies, img_target, img_paths) in enumerate(data_loader):
+            img_readies = runner.to_device(img_readies)
+            argmin = codebook_sweep.encode_sweep(model, img_readies, masks)
+            hists.append(
+                codebook_sweep.index_histograms(argmin, model.k).cpu().numpy()
+            )
+    # one row per exclusion and image
+    hists = np.concatenate(hists, axis=1)
+    codebook_sweep.save_sweep_table(
+        args.out_dir + '/' + args.colour_space + args.suffix + '_sweep.txt',
+        np.repeat(excludes, hists.shape[1]),
+        hists.reshape(-1, model.k),
+        ['bin%d' % i for i in range(model.k)]
+    )
+
+
 if __name__ == "__main__":
     main(sys.argv[1:])
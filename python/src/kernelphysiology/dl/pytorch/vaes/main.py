@@ -9,7 +9,6 @@ from torch import optim
 from torch import nn
 import torch.backends.cudnn as cudnn
 import torch.utils.data
-from torch.utils.tensorboard import SummaryWriter
 from torchvision.transforms import functional
 from torchvision import datasets, transforms
 
@@ -20,8 +19,12 @@ from kernelphysiology.dl.pytorch.datasets import data_loaders
 from kernelphysiology.dl.pytorch.vaes.arguments import parse_arguments
 from kernelphysiology.dl.pytorch.utils import cv2_preprocessing
 from kernelphysiology.dl.pytorch.utils import cv2_transforms
+from kernelphysiology.dl.pytorch.utils import misc as misc_utils
 from kernelphysiology.transformations import colour_spaces
 from kernelphysiology.utils import imutils
+from kernelphysiology.utils.lazy_imports import lazy_from
+
+SummaryWriter = lazy_from('torch.utils.tensorboard', 'SummaryWriter')
 
 import cv2
 
@@ -36,7 +39,7 @@ models = {
     'mnist': {'vae': vae_model.VAE, 'vqvae': vae_model.VQ_CVAE},
 }
 datasets_classes = {
-    'custom': datasets.ImageFolder,
+    'custom': data_loaders.IndexedImageFolder,
     'imagenet': data_loaders.ImageFolder,
     'bsds': data_loaders.BSDSEdges,
     'celeba': data_loaders.CelebA,
@@ -46,9 +49,9 @@ datasets_classes = {
 }
 dataset_train_args = {
     'custom': {},
-    'imagenet': {},
+    'imagenet': {'single_output': True},
     'bsds': {},
-    'celeba': {},
+    'celeba': {'single_output': True},
     'voc': {},
     'coco': {},
     'cifar10': {'train': True, 'download': True},
@@ -56,9 +59,9 @@ dataset_train_args = {
 }
 dataset_test_args = {
     'custom': {},
-    'imagenet': {},
+    'imagenet': {'single_output': True},
     'bsds': {},
-    'celeba': {},
+    'celeba': {'single_output': True},
     'voc': {},
     'coco': {},
     'cifar10': {'train': False, 'download': True},
@@ -460,8 +463,11 @@ def train(epoch, model, train_loader, optimizer, cuda, log_interval, save_path,
           args):
     model.train()
     loss_dict = model.latest_losses()
-    losses = {k + '_train': 0 for k, v in loss_dict.items()}
-    epoch_losses = {k + '_train': 0 for k, v in loss_dict.items()}
+    # losses are summed on the device and only synced when logged
+    losses = misc_utils.LossAccumulator(loss_dict.keys(), '_train')
+    epoch_losses = misc_utils.LossAccumulator(loss_dict.keys(), '_train')
+    if args.prefetch and args.dataset != 'coco':
+        train_loader = misc_utils.DataPrefetcher(train_loader)
     start_time = time.time()
     batch_idx, data = None, None
     for batch_idx, loader_data in enumerate(train_loader):
@@ -482,10 +488,9 @@ def train(epoch, model, train_loader, optimizer, cuda, log_interval, save_path,
             data = torch.cat(data, dim=0)
             max_len = len(train_loader.dataset)
         else:
-            data = loader_data[0]
-            target = loader_data[1]
+            data = loader_data[0].cuda()
+            target = data_loaders.unpack_output(data, loader_data[1]).cuda()
             max_len = len(train_loader)
-            target = target.cuda()
 
         data = data.cuda()
         optimizer.zero_grad()
@@ -495,15 +500,13 @@ def train(epoch, model, train_loader, optimizer, cuda, log_interval, save_path,
         loss.backward()
         optimizer.step()
         latest_losses = model.latest_losses()
-        for key in latest_losses:
-            losses[key + '_train'] += float(latest_losses[key])
-            epoch_losses[key + '_train'] += float(latest_losses[key])
+        losses.update(latest_losses)
+        epoch_losses.update(latest_losses)
 
         if batch_idx % log_interval == 0:
-            for key in latest_losses:
-                losses[key + '_train'] /= log_interval
             loss_string = ' '.join(
-                ['{}: {:.6f}'.format(k, v) for k, v in losses.items()])
+                ['{}: {:.6f}'.format(k, v) for k, v in
+                 losses.values(log_interval).items()])
             logging.info(
                 'Train Epoch: {epoch} [{batch:5d}/{total_batch} '
                 '({percent:2d}%)]   time: {time:3.2f}   {loss}'
@@ -512,8 +515,7 @@ def train(epoch, model, train_loader, optimizer, cuda, log_interval, save_path,
                             percent=int(100. * batch_idx / max_len),
                             time=time.time() - start_time, loss=loss_string))
             start_time = time.time()
-            for key in latest_losses:
-                losses[key + '_train'] = 0
+            losses.reset()
         if batch_idx in [18, 180, 1650, max_len - 1]:
             args.vis_func(
                 target, outputs, args.mean, args.std, epoch, save_path,
@@ -524,12 +526,11 @@ def train(epoch, model, train_loader, optimizer, cuda, log_interval, save_path,
                 data) > args.max_epoch_samples:
             break
 
-    for key in epoch_losses:
-        if args.dataset != 'imagenet':
-            epoch_losses[key] /= (max_len / data.shape[0])
-        else:
-            epoch_losses[key] /= (
-                    len(train_loader.dataset) / train_loader.batch_size)
+    if args.dataset != 'imagenet':
+        epoch_losses = epoch_losses.values(max_len / data.shape[0])
+    else:
+        epoch_losses = epoch_losses.values(
+            len(train_loader.dataset) / train_loader.batch_size)
     loss_string = '\t'.join(
         ['{}: {:.6f}'.format(k, v) for k, v in epoch_losses.items()])
     logging.info('====> Epoch: {} {}'.format(epoch, loss_string))
@@ -561,8 +562,8 @@ def test_net(epoch, model, test_loader, cuda, save_path, args):
                     data.append(current_image)
                 data = torch.cat(data, dim=0)
             else:
-                data = loader_data[0]
-                target = loader_data[1]
+                data = loader_data[0].cuda()
+                target = data_loaders.unpack_output(data, loader_data[1])
                 target = target.cuda()
             data = data.cuda()
             outputs = model(data)
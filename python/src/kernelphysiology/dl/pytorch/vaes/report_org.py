@@ -12,11 +12,14 @@ import cv2
 from kernelphysiology.dl.pytorch.datasets import data_loaders
 
 from kernelphysiology.dl.pytorch.vaes import model as vqmodel
+from kernelphysiology.dl.pytorch.vaes import codebook_sweep
 from kernelphysiology.dl.pytorch.utils.preprocessing import inv_normalise_tensor
 from kernelphysiology.transformations import colour_spaces
 
 from kernelphysiology.dl.pytorch.utils import cv2_transforms
 from kernelphysiology.dl.pytorch.utils import cv2_preprocessing
+from kernelphysiology.dl.pytorch.utils import inference
+from kernelphysiology.dl.utils import argument_groups
 from kernelphysiology.transformations import normalisations
 from kernelphysiology.dl.pytorch.vaes import vanilla_vae
 from kernelphysiology.utils import imutils
@@ -42,6 +45,10 @@ def parse_arguments(args):
                         default=False, help='cosine distance')
     parser.add_argument('--exclude', type=int, default=0, metavar='K',
                         help='number of atoms in dictionary')
+    parser.add_argument('--exclude_sweep', type=int, nargs='*', default=None,
+                        help='exclusions to sweep in one run (default: all)')
+    parser.add_argument('--variants_per_decode', type=int, default=None,
+                        help='number of sweep variants decoded together')
     parser.add_argument('--colour_space', type=str, default=None,
                         help='The type of output colour space.')
     parser.add_argument('--target_size', type=int, default=224,
@@ -77,6 +84,7 @@ def parse_arguments(args):
     )
     parser.add_argument('--random_seed', default=0, type=int)
     parser.add_argument('--noise', type=str, default=None)
+    argument_groups.get_inference_group(parser)
 
     return parser.parse_args(args)
 
@@ -101,17 +109,11 @@ def main(args):
         network = vqmodel.VQ_CVAE(128, k=args.k, kl=args.kl, in_chns=3,
                                   cos_distance=args.cos_dis)
     network.load_state_dict(weights_net)
-    if args.exclude > 0:
-        which_vec = [args.exclude - 1]
-        print(which_vec)
-        network.state_dict()['emb.weight'][:, which_vec] = 0
-    elif args.exclude < 0:
-        which_vec = [*range(8)]
-        which_vec.remove(abs(args.exclude) - 1)
-        print(which_vec)
-        network.state_dict()['emb.weight'][:, which_vec] = 0
-    network.cuda()
-    network.eval()
+    if args.exclude_sweep is not None and args.model == 'vae':
+        sys.exit('Exclusion sweep is only supported for vqvae.')
+    if args.exclude_sweep is None and args.model != 'vae':
+        codebook_sweep.exclude_vectors(network, args.exclude)
+    runner = inference.InferenceRunner.from_args(network, args)
 
     if not os.path.exists(args.out_dir):
         os.mkdir(args.out_dir)
@@ -183,17 +185,52 @@ def main(args):
             ),
             batch_size=args.batch_size, shuffle=False
         )
-    export(test_loader, network, mean, std, args)
+    if args.exclude_sweep is None:
+        export(test_loader, runner, mean, std, args)
+    else:
+        export_sweep(test_loader, runner, mean, std, args)
+
+
+def _tensor2rgb(img, mean, std, colour_space, target_shape=None):
+    img = inv_normalise_tensor(img.unsqueeze(0), mean, std)
+    img = img.numpy().squeeze().transpose(1, 2, 0)
+    if target_shape is not None:
+        img = cv2.resize(img, (target_shape[1], target_shape[0]))
+    if colour_space == 'lab':
+        img = np.uint8(img * 255)
+        img = cv2.cvtColor(img, cv2.COLOR_LAB2RGB)
+    elif colour_space == 'hsv':
+        img = colour_spaces.hsv012rgb(img)
+    elif colour_space == 'lms':
+        img = colour_spaces.lms012rgb(img)
+    elif colour_space == 'yog':
+        img = colour_spaces.yog012rgb(img)
+    elif colour_space == 'dkl':
+        img = colour_spaces.dkl012rgb(img)
+    else:
+        img = normalisations.uint8im(img)
+    return img
+
+
+def _compare_images(org_img, rec_img, de=False):
+    ssim = metrics.structural_similarity(org_img, rec_img, multichannel=True)
+    psnr = metrics.peak_signal_noise_ratio(org_img, rec_img)
+    result = [ssim, psnr]
+    if de:
+        img_org = color.rgb2lab(org_img)
+        img_res = color.rgb2lab(rec_img)
+        de = color.deltaE_ciede2000(img_org, img_res)
+        result.extend([np.mean(de), np.median(de), np.max(de)])
+    return result
 
 
-def export(data_loader, model, mean, std, args):
+def export(data_loader, runner, mean, std, args):
     all_des = []
     all_ssim = []
     all_psnr = []
     with torch.no_grad():
         for i, (img_readies, img_target, img_paths) in enumerate(data_loader):
-            img_readies = img_readies.cuda()
-            out_rgb = model(img_readies)
+            out_rgb = runner(img_readies)
             out_rgb = out_rgb[0].detach().cpu()
             img_readies = img_readies.detach().cpu()
 
@@ -201,62 +238,22 @@ def export(data_loader, model, mean, std, args):
                 img_path = img_paths[img_ind]
                 if np.mod(i, 1000) == 0:
                     print(i, img_path)
-                img_ready = img_readies[img_ind].unsqueeze(0)
-
-                org_img_tmp = inv_normalise_tensor(img_ready, mean, std)
-                org_img_tmp = org_img_tmp.numpy().squeeze().transpose(1, 2, 0)
-                # org_img.append(org_img_tmp)
-
-                if args.in_colour_space == 'lab':
-                    org_img_tmp = np.uint8(org_img_tmp * 255)
-                    org_img_tmp = cv2.cvtColor(org_img_tmp, cv2.COLOR_LAB2RGB)
-                elif args.in_colour_space == 'hsv':
-                    org_img_tmp = colour_spaces.hsv012rgb(org_img_tmp)
-                elif args.in_colour_space == 'lms':
-                    org_img_tmp = colour_spaces.lms012rgb(org_img_tmp)
-                elif args.in_colour_space == 'yog':
-                    org_img_tmp = colour_spaces.yog012rgb(org_img_tmp)
-                elif args.in_colour_space == 'dkl':
-                    org_img_tmp = colour_spaces.dkl012rgb(org_img_tmp)
-                else:
-                    org_img_tmp = normalisations.uint8im(org_img_tmp)
-
-                # if os.path.exists(img_path.replace(cat_in_dir, rgb_dir)):
-                #     rec_rgb_tmp = cv2.imread(
-                #         img_path.replace(cat_in_dir, rgb_dir))
-                #     rec_rgb_tmp = cv2.cvtColor(rec_rgb_tmp, cv2.COLOR_BGR2RGB)
-                # else:
-                rec_img_tmp = inv_normalise_tensor(
-                    out_rgb[img_ind].unsqueeze(0), mean, std)
-                rec_img_tmp = rec_img_tmp.numpy().squeeze().transpose(1, 2, 0)
-                rec_img_tmp = cv2.resize(
-                    rec_img_tmp, (org_img_tmp.shape[1], org_img_tmp.shape[0])
+
+                org_img_tmp = _tensor2rgb(
+                    img_readies[img_ind], mean, std, args.in_colour_space
+                )
+                rec_img_tmp = _tensor2rgb(
+                    out_rgb[img_ind], mean, std, args.out_colour_space,
+                    org_img_tmp.shape
                 )
-                if args.out_colour_space == 'lab':
-                    rec_img_tmp = np.uint8(rec_img_tmp * 255)
-                    rec_img_tmp = cv2.cvtColor(rec_img_tmp, cv2.COLOR_LAB2RGB)
-                elif args.out_colour_space == 'hsv':
-                    rec_img_tmp = colour_spaces.hsv012rgb(rec_img_tmp)
-                elif args.out_colour_space == 'lms':
-                    rec_img_tmp = colour_spaces.lms012rgb(rec_img_tmp)
-                elif args.out_colour_space == 'yog':
-                    rec_img_tmp = colour_spaces.yog012rgb(rec_img_tmp)
-                elif args.out_colour_space == 'dkl':
-                    rec_img_tmp = colour_spaces.dkl012rgb(rec_img_tmp)
-                else:
-                    rec_img_tmp = normalisations.uint8im(rec_img_tmp)
-
-                ssim = metrics.structural_similarity(org_img_tmp, rec_img_tmp,
-                                                     multichannel=True)
-                all_ssim.append(ssim)
-                psnr = metrics.peak_signal_noise_ratio(org_img_tmp, rec_img_tmp)
-                all_psnr.append(psnr)
 
+                current_metrics = _compare_images(
+                    org_img_tmp, rec_img_tmp, args.de
+                )
+                all_ssim.append(current_metrics[0])
+                all_psnr.append(current_metrics[1])
                 if args.de:
-                    img_org = color.rgb2lab(org_img_tmp)
-                    img_res = color.rgb2lab(rec_img_tmp)
-                    de = color.deltaE_ciede2000(img_org, img_res)
-                    all_des.append([np.mean(de), np.median(de), np.max(de)])
+                    all_des.append(current_metrics[2:])
 
             if np.mod(i, 10000) == 0:
                 np.savetxt(
@@ -288,5 +285,48 @@ def export(data_loader, model, mean, std, args):
         )
 
 
+def export_sweep(data_loader, runner, mean, std, args):
+    model = runner.model
+    excludes = codebook_sweep.sweep_exclusions(model.k, args.exclude_sweep)
+    masks = codebook_sweep.exclusion_masks(
+        model.k, excludes, device=runner.device
+    )
+    columns = ['ssim', 'psnr']
+    if args.de:
+        columns.extend(['de_mean', 'de_median', 'de_max'])
+    metric_sums = np.zeros((len(excludes), len(columns)))
+    num_imgs = 0
+    with runner.context():
+        for i, (img_readies, img_target, img_paths) in enumerate(data_loader):
+            img_readies = runner.to_device(img_readies)
+            # encoding once, decoding all the exclusions in one batch
+            argmin = codebook_sweep.encode_sweep(model, img_readies, masks)
+            out_rgb = codebook_sweep.decode_sweep(
+                model, argmin, masks, args.variants_per_decode
+            ).detach().cpu().float()
+            img_readies = img_readies.detach().cpu()
+
+            for img_ind in range(img_readies.shape[0]):
+                if np.mod(i, 1000) == 0:
+                    print(i, img_paths[img_ind])
+                org_img_tmp = _tensor2rgb(
+                    img_readies[img_ind], mean, std, args.in_colour_space
+                )
+                for v_ind in range(len(excludes)):
+                    rec_img_tmp = _tensor2rgb(
+                        out_rgb[v_ind, img_ind], mean, std,
+                        args.out_colour_space, org_img_tmp.shape
+                    )
+                    metric_sums[v_ind] += _compare_images(
+                        org_img_tmp, rec_img_tmp, args.de
+                    )
+            num_imgs += img_readies.shape[0]
+
+    codebook_sweep.save_sweep_table(
+        args.out_dir + '/sweep_' + args.colour_space + '.txt',
+        excludes, metric_sums / num_imgs, columns
+    )
+
+
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -235,6 +235,13 @@ def get_augmentation_group(parser):
         default=None,
         help='List of augmentations to be conducted (default: None)'
     )
+    augmentation_group.add_argument(
+        '--batch_augmentation',
+        action='store_true',
+        default=False,
+        help='Cropping, flipping and normalising the training batches on '
+             'the GPU instead of in the workers (default: False)'
+    )
 
 
 def get_network_manipulation_group(parser):
@@ -261,6 +268,20 @@ def get_network_manipulation_group(parser):
         default=None,
         help='Intersection of two planes, <P1>_<L1>_<P2>_<L2> (default: None)'
     )
+    network_manipulation_group.add_argument(
+        '--lesion_sweep',
+        nargs='+',
+        type=str,
+        default=None,
+        help='Layer name followed by kernel indices each lesioned in turn, '
+             'all kernels if no index is given (default: None)'
+    )
+    network_manipulation_group.add_argument(
+        '--lesion_variants',
+        type=int,
+        default=None,
+        help='Number of lesioned variants per forward pass (default: all)'
+    )
 
 
 def get_parallelisation_group(parser):
@@ -397,6 +418,51 @@ def get_routine_group(parser):
         help='Batch size (default: according to dataset)'
     )
 
+    routine_group.add_argument(
+        '--prefetch',
+        action='store_true',
+        default=False,
+        help='Copying the next batch to GPU during compute (default: False)'
+    )
+
+    routine_group.add_argument(
+        '--reduced_decoding',
+        action='store_true',
+        default=False,
+        help='Decoding JPEGs near the target size for testing the folder '
+             'datasets, e.g. imagenet (default: False)'
+    )
+
+
+def get_inference_group(parser):
+    inference_group = parser.add_argument_group('inference')
+
+    inference_group.add_argument(
+        '--device',
+        type=str,
+        default=None,
+        help='Device to run the network on (default: cuda if available)'
+    )
+    inference_group.add_argument(
+        '--num_threads',
+        type=int,
+        default=None,
+        help='Number of CPU threads (default: KP_NUM_THREADS or torch)'
+    )
+    inference_group.add_argument(
+        '--cpu_dtype',
+        type=str,
+        default='float32',
+        choices=['float32', 'bfloat16'],
+        help='Autocast type on the CPU (default: float32)'
+    )
+    inference_group.add_argument(
+        '--quantise_heads',
+        action='store_true',
+        default=False,
+        help='Dynamic int8 fully connected layers on the CPU (default: False)'
+    )
+
 
 def get_dataset_group(parser):
     dataset_group = parser.add_argument_group('dataset')
@@ -73,6 +73,15 @@ def common_test_arg_parser(description='Testing a network!'):
         help='Parameters passed to the evaluation function (default: None)'
     )
 
+    parser.add_argument(
+        '--backend',
+        type=str,
+        default='torch',
+        choices=['torch', 'torchscript', 'onnx'],
+        help='Running the checkpoints or their exported artifacts '
+             '(default: torch)'
+    )
+
     logging_group = parser.add_argument_group('logging')
     logging_group.add_argument(
         '--validation_steps',
@@ -139,6 +139,13 @@ def optimisation_params(task_type, args=None):
         return lr, weight_decay
 
 
+def get_num_threads(num_threads=None):
+    """The number of CPU threads, if not given from KP_NUM_THREADS."""
+    if num_threads is None and 'KP_NUM_THREADS' in os.environ:
+        num_threads = int(os.environ['KP_NUM_THREADS'])
+    return num_threads
+
+
 def _is_server_known():
     hostname = socket.gethostname()
     if hostname in ['awesome', 'nickel', 'nyanza']:
@@ -41,6 +41,21 @@ def save_predictions(predictions, experiment_name, network, dataset,
     np.savetxt(output_file, predictions, delimiter=',', fmt='%i')
 
 
+def save_lesion_sweep(results, experiment_name, network, dataset,
+                      manipulation_type, manipulation_value):
+    labels, table = results
+    output_file = _prepare_saving_file(
+        experiment_name, network, dataset, manipulation_type,
+        manipulation_value, extension='csv'
+    )
+    rows = [[label, *['%f' % val for val in row]]
+            for label, row in zip(labels, table)]
+    np.savetxt(
+        output_file, np.array(rows), delimiter=',', fmt='%s',
+        header='lesion,loss,top1,top5'
+    )
+
+
 def save_segmentation_results(predictions, experiment_name, network, dataset,
                               manipulation_type, manipulation_value):
     pred_log = predictions.get_log_dict()
@@ -4,39 +4,27 @@ Gaussian function, its derivatives, DoG, SoG, ...
 
 import numpy as np
 import math
+from functools import lru_cache
 
 
 def gaussian_width(sigma, max_width=100, threshold=1e-4):
-    filter_width = 1
-    for pw in range(np.int(np.floor(max_width / 2)), -1, -1):
-        if np.exp(-(pw ** 2) / (2 * sigma ** 2)) > threshold:
-            filter_width = pw
-            break
+    pws = np.arange(int(np.floor(max_width / 2)) + 1)
+    # the Gaussian decreases with the distance, the last one above threshold
+    above = np.nonzero(np.exp(-(pws ** 2) / (2 * sigma ** 2)) > threshold)[0]
+    filter_width = above[-1] if len(above) > 0 else 1
     return filter_width * 2 + 1
 
 
-def gaussian_kernel2(sigmax, sigmay=None, meanx=0, meany=0, theta=0, width=None,
-                     max_width=100, threshold=1e-4):
-    if sigmax == 0:
-        return 1
-    if sigmay is None:
-        sigmay = sigmax
-        max_sigma = sigmax
-    else:
-        max_sigma = np.maximum(sigmax, sigmay)
-    if width is None:
-        sizex = gaussian_width(
-            sigma=max_sigma, max_width=max_width, threshold=threshold
-        )
-    else:
-        sizex = width
-    sizey = sizex
-
-    centrex = (sizex + 1) / 2
-    centrey = (sizey + 1) / 2
-    centrex = centrex + (meanx * centrex)
-    centrey = centrey + (meany * centrey)
+def _kernel_size(sigmax, sigmay, width, max_width, threshold):
+    if width is not None:
+        return width
+    max_sigma = sigmax if sigmay is None else np.maximum(sigmax, sigmay)
+    return gaussian_width(
+        sigma=max_sigma, max_width=max_width, threshold=threshold
+    )
 
+
+def _quadratic_coefficients(sigmax, sigmay, theta):
     costh = math.cos(theta)
     sinth = math.sin(theta)
     sinth2 = math.sin(2 * theta)
@@ -44,17 +32,71 @@ def gaussian_kernel2(sigmax, sigmay=None, meanx=0, meany=0, theta=0, width=None,
     a = costh ** 2 / 2 / sigmax ** 2 + sinth ** 2 / 2 / sigmay ** 2
     b = -sinth2 / 4 / sigmax ** 2 + sinth2 / 4 / sigmay ** 2
     c = sinth ** 2 / 2 / sigmax ** 2 + costh ** 2 / 2 / sigmay ** 2
+    return a, b, c
+
+
+def _centred_coordinates(size, mean):
+    centre = (size + 1) / 2
+    centre = centre + (mean * centre)
+    return np.arange(1, size + 1) - centre
+
 
-    kernel = np.zeros((sizex, sizey))
-    for i in range(sizex):
-        for j in range(sizey):
-            x = (i + 1) * 1 - centrex
-            y = 1 * (j + 1) - centrey
-            kernel[i, j] = np.exp(-(a * x ** 2 + 2 * b * x * y + c * y ** 2))
+def _read_only(array):
+    array.flags.writeable = False
+    return array
 
+
+@lru_cache(maxsize=256)
+def _gaussian_kernel2(sigmax, sigmay, meanx, meany, theta, size):
+    a, b, c = _quadratic_coefficients(sigmax, sigmay, theta)
+    x = _centred_coordinates(size, meanx)[:, np.newaxis]
+    y = _centred_coordinates(size, meany)[np.newaxis, :]
+    kernel = np.exp(-(a * x ** 2 + 2 * b * x * y + c * y ** 2))
     kernel /= kernel.sum()
+    return _read_only(kernel)
 
-    return kernel
+
+@lru_cache(maxsize=256)
+def _separable_gaussian_kernel2(sigmax, sigmay, meanx, meany, theta, size):
+    a, b, c = _quadratic_coefficients(sigmax, sigmay, theta)
+    if b != 0:
+        return None
+    kernel_rows = np.exp(-a * _centred_coordinates(size, meanx) ** 2)
+    kernel_cols = np.exp(-c * _centred_coordinates(size, meany) ** 2)
+    kernel_rows /= kernel_rows.sum()
+    kernel_cols /= kernel_cols.sum()
+    return _read_only(kernel_rows), _read_only(kernel_cols)
+
+
+def gaussian_kernel2(sigmax, sigmay=None, meanx=0, meany=0, theta=0, width=None,
+                     max_width=100, threshold=1e-4):
+    """
+    A 2D Gaussian kernel, its rows along x and its columns along y. The
+    kernels are cached and therefore read-only.
+    """
+    if sigmax == 0:
+        return 1
+    size = _kernel_size(sigmax, sigmay, width, max_width, threshold)
+    if sigmay is None:
+        sigmay = sigmax
+    return _gaussian_kernel2(sigmax, sigmay, meanx, meany, theta, size)
+
+
+def separable_gaussian_kernel2(sigmax, sigmay=None, meanx=0, meany=0, theta=0,
+                               width=None, max_width=100, threshold=1e-4):
+    """
+    The 1D kernels along x (rows) and y (columns) whose outer product is
+    gaussian_kernel2, or None if it is not separable (theta not a multiple
+    of pi/2 with sigmax != sigmay). Cached and read-only.
+    """
+    if sigmax == 0:
+        return None
+    size = _kernel_size(sigmax, sigmay, width, max_width, threshold)
+    if sigmay is None:
+        sigmay = sigmax
+    return _separable_gaussian_kernel2(
+        sigmax, sigmay, meanx, meany, theta, size
+    )
 
 
 def gaussian2_gradient1(sigma, theta, seta=0.5, width=None, threshold=1e-4):
@@ -67,14 +109,13 @@ def gaussian2_gradient1(sigma, theta, seta=0.5, width=None, threshold=1e-4):
     seta2 = seta ** 2
     pi_sigma2 = math.pi * sigma2
 
-    kernel = np.zeros((width, width))
     half_width = width / 2
-    fw = np.int(np.floor(half_width))
-    cw = np.int(np.ceil(half_width))
-    for row, i in enumerate(range(-fw, cw)):
-        for col, j in enumerate(range(-fw, cw)):
-            x = i * costh + j * sinth
-            y = -j * sinth + j * costh
-            exp_term = np.exp(-((x ** 2) + (y ** 2) * seta2) / (2 * sigma2))
-            kernel[row, col] = -x * exp_term / pi_sigma2
+    fw = int(np.floor(half_width))
+    cw = int(np.ceil(half_width))
+    i = np.arange(-fw, cw)[:, np.newaxis]
+    j = np.arange(-fw, cw)[np.newaxis, :]
+    x = i * costh + j * sinth
+    y = -j * sinth + j * costh
+    exp_term = np.exp(-((x ** 2) + (y ** 2) * seta2) / (2 * sigma2))
+    kernel = -x * exp_term / pi_sigma2
     return kernel
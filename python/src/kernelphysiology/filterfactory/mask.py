@@ -5,53 +5,78 @@ Creating mask images or filters.
 import numpy as np
 import math
 import sys
+from functools import lru_cache
 
-from skimage import feature
-from skimage import morphology
-from skimage.transform import resize
 import cv2
 
 from kernelphysiology.transformations.normalisations import im2double
+from kernelphysiology.utils.lazy_imports import lazy_import, lazy_from
+
+feature = lazy_import('skimage.feature')
+morphology = lazy_import('skimage.morphology')
+resize = lazy_from('skimage.transform', 'resize')
+
+
+def _canny_edges(image, sigma, low_threshold, high_threshold,
+                 use_quantiles):
+    image = im2double(image)
+    if len(image.shape) > 2:
+        # convert the image to one channel
+        image = image.sum(axis=2)
+    return feature.canny(
+        image, np.abs(sigma), low_threshold, high_threshold,
+        use_quantiles=use_quantiles
+    )
+
+
+def _canny_masks(edges, chns, sigma, dialation):
+    """Dilating, repeating and inverting the edges of N images at once."""
+    if dialation is not None:
+        if type(dialation) is float:
+            dialation = int(dialation)
+        if type(dialation) is int:
+            dialation = morphology.square(dialation)
+        # the images are stacked along the first axis
+        edges = morphology.dilation(edges, dialation[np.newaxis])
+
+    # repeating this for number of channels in input image
+    if chns != 1:
+        edges = np.repeat(edges[..., np.newaxis], chns, axis=-1)
+
+    image_mask = np.uint8(edges)
+    if np.sign(sigma) == 1:
+        image_mask = 1 - image_mask
+    return image_mask
 
 
 def create_mask_image_canny(image, sigma=1.0, low_threshold=0.9,
                             high_threshold=0.9, use_quantiles=True,
                             dialation=None):
-    image_mask = np.zeros(image.shape, np.uint8)
-    if sigma is not None:
-        image = im2double(image)
-
-        if len(image.shape) > 2:
-            chns = image.shape[2]
-            # convert the image to one channel
-            image = image.sum(axis=2)
-        else:
-            chns = 1
-
-        sigma_sign = np.sign(sigma)
-        if sigma_sign == -1:
-            sigma = np.abs(sigma)
-
-        image_mask = feature.canny(
-            image, sigma, low_threshold, high_threshold,
-            use_quantiles=use_quantiles
-        )
-        if dialation is not None:
-            if type(dialation) is float:
-                dialation = int(dialation)
-            if type(dialation) is int:
-                dialation = morphology.square(dialation)
-            image_mask = morphology.dilation(image_mask, dialation)
-
-        # repeating this for number of channels in input image
-        if chns != 1:
-            image_mask = np.expand_dims(image_mask, axis=2)
-            image_mask = np.repeat(image_mask, chns, axis=2)
+    if sigma is None:
+        return np.zeros(image.shape, np.uint8)
+    chns = image.shape[2] if len(image.shape) > 2 else 1
+    edges = _canny_edges(
+        image, sigma, low_threshold, high_threshold, use_quantiles
+    )
+    return _canny_masks(edges[np.newaxis], chns, sigma, dialation)[0]
 
-        image_mask = np.uint8(image_mask)
-        if sigma_sign == 1:
-            image_mask = 1 - image_mask
-    return image_mask
+
+def create_mask_images_canny(images, sigma=1.0, low_threshold=0.9,
+                             high_threshold=0.9, use_quantiles=True,
+                             dialation=None):
+    """
+    create_mask_image_canny of N images (N, H, W[, C]). skimage's canny
+    works on single images, the rest is done on the whole batch.
+    """
+    if sigma is None:
+        return np.zeros(images.shape, np.uint8)
+    chns = images.shape[3] if len(images.shape) > 3 else 1
+    edges = np.stack([
+        _canny_edges(
+            image, sigma, low_threshold, high_threshold, use_quantiles
+        ) for image in images
+    ])
+    return _canny_masks(edges, chns, sigma, dialation)
 
 
 def create_mask_image_shape(image, is_circle=True, mask_length=None):
@@ -138,11 +163,10 @@ def random_filter_array(image):
     """
     if len(image.shape) < 3:
         return np.random.choice([True, False], size=image.shape)
-    image_mask = np.zeros(image.shape, np.uint8)
-    rand_inds = np.random.randint(image.shape[2], size=image.shape[:2])
-    for i in range(image.shape[2]):
-        image_mask[:, :, i] = rand_inds == i
-    return image_mask
+    # the last axis is the channels, all others are pixels (or images)
+    chns = image.shape[-1]
+    rand_inds = np.random.randint(chns, size=image.shape[:-1])
+    return np.uint8(rand_inds[..., np.newaxis] == np.arange(chns))
 
 
 def colour_filter_array(image, mosaic_type, **kwargs):
@@ -155,7 +179,7 @@ def colour_filter_array(image, mosaic_type, **kwargs):
     return image_mask
 
 
-def create_mask_image(image, mask_type, **kwargs):
+def _create_mask_image(image, mask_type, **kwargs):
     if mask_type is None:
         image_mask = np.zeros(image.shape, np.uint8)
     elif mask_type == 'circle':
@@ -171,3 +195,67 @@ def create_mask_image(image, mask_type, **kwargs):
     else:
         sys.exit('Unsupported mask type %s' % mask_type)
     return image_mask
+
+
+# these only depend on the shape of the image and their parameters
+CACHED_MASK_TYPES = [None, 'circle', 'square', 'texture', 'mosaic']
+
+
+@lru_cache(maxsize=64)
+def _cached_mask(shape, mask_type, params):
+    # the mask functions only look at the shape of the image
+    image = np.broadcast_to(np.uint8(0), shape)
+    image_mask = _create_mask_image(image, mask_type, **dict(params))
+    image_mask.flags.writeable = False
+    return image_mask
+
+
+def get_mask(shape, mask_type, **kwargs):
+    """
+    The mask of an image of the given shape. The masks are cached and shared
+    between the calls, therefore read-only.
+    """
+    if mask_type not in CACHED_MASK_TYPES:
+        sys.exit('Mask type %s depends on the image, it is not cached.' %
+                 mask_type)
+    return _cached_mask(tuple(shape), mask_type, tuple(sorted(kwargs.items())))
+
+
+@lru_cache(maxsize=64)
+def mosaic_masks(size, mosaic_type):
+    """
+    The (rows, cols, 3) masks of the red, green and blue channels of a
+    mosaic, cached and read-only.
+    """
+    masks = np.stack([
+        get_mask(size, 'mosaic', mosaic_type=mosaic_type, colour_channel=chn)
+        for chn in ['red', 'green', 'blue']
+    ], axis=2)
+    masks.flags.writeable = False
+    return masks
+
+
+def create_mask_image(image, mask_type, **kwargs):
+    """
+    The mask of an image. Except for canny, the masks are cached and shared
+    (read-only), copy them before modifying.
+    """
+    if mask_type in CACHED_MASK_TYPES:
+        try:
+            return get_mask(image.shape, mask_type, **kwargs)
+        except TypeError:
+            # unhashable parameters, e.g. a list
+            pass
+    return _create_mask_image(image, mask_type, **kwargs)
+
+
+def create_mask_images(images, mask_type, **kwargs):
+    """
+    The masks of N images (N, H, W[, C]). Except for canny, one read-only
+    mask is broadcast to all images.
+    """
+    if mask_type == 'canny':
+        return create_mask_images_canny(images, **kwargs)
+    # the other masks only depend on the shape of the images
+    image_mask = create_mask_image(images[0], mask_type, **kwargs)
+    return np.broadcast_to(image_mask, (len(images), *image_mask.shape))
@@ -5,10 +5,12 @@ A collection of frequency related transformations e.g. Fourier and Wavelengths.
 import numpy as np
 import sys
 
-import pywt
 import cv2
 
 from kernelphysiology.transformations import normalisations
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+pywt = lazy_import('pywt')
 
 SUPPORTED_WAVELETS = ['db1']  # pywt.wavelist(kind='discrete')
 
@@ -2,10 +2,6 @@
 Utility functions for image processing.
 """
 
-from skimage.util import random_noise
-from skimage.color import rgb2gray
-from skimage.draw import rectangle
-
 import numpy as np
 import random
 import math
@@ -13,15 +9,22 @@ import math
 import cv2
 
 from kernelphysiology.filterfactory.gaussian import gaussian_kernel2
+from kernelphysiology.filterfactory.gaussian import separable_gaussian_kernel2
 from kernelphysiology.filterfactory.mask import random_filter_array
 from kernelphysiology.filterfactory.mask import create_mask_image
-from kernelphysiology.filterfactory.mask import colour_filter_array
+from kernelphysiology.filterfactory.mask import mosaic_masks
 from kernelphysiology.transformations.colour_spaces import rgb2opponency
 from kernelphysiology.transformations.colour_spaces import opponency2rgb
 from kernelphysiology.transformations.colour_spaces import get_max_lightness
 from kernelphysiology.transformations.normalisations import im2double_max
 from kernelphysiology.transformations.normalisations import im2double
 from kernelphysiology.transformations.normalisations import img_midvals
+from kernelphysiology.utils.lazy_imports import lazy_from
+from kernelphysiology.utils.local_statistics import LocalStatistics
+
+random_noise = lazy_from('skimage.util', 'random_noise')
+rgb2gray = lazy_from('skimage.color', 'rgb2gray')
+rectangle = lazy_from('skimage.draw', 'rectangle')
 
 
 # TODO: merge it with Keras image manipulation class
@@ -327,10 +330,18 @@ def gaussian_blur(image, sigmax, sigmay=None, meanx=0, meany=0, theta=0,
     image_org = image.copy()
     image_mask = create_mask_image(image, mask_type, **kwargs)
 
-    g_kernel = gaussian_kernel2(
+    g_kernels = separable_gaussian_kernel2(
         sigmax=sigmax, sigmay=sigmay, meanx=meanx, meany=meany, theta=theta
     )
-    image_blur = cv2.filter2D(image, -1, g_kernel)
+    if g_kernels is not None:
+        # the kernel of rows is applied along the columns and vice versa
+        image_blur = cv2.sepFilter2D(image, -1, g_kernels[1], g_kernels[0])
+    else:
+        g_kernel = gaussian_kernel2(
+            sigmax=sigmax, sigmay=sigmay, meanx=meanx, meany=meany,
+            theta=theta
+        )
+        image_blur = cv2.filter2D(image, -1, g_kernel)
     output = image_org * image_mask + image_blur * (1 - image_mask)
 
     output *= max_pixel
@@ -411,30 +422,29 @@ def poisson_noise(image, seed=None, clip=True, mask_type=None, **kwargs):
 
 
 def im2mosaic(image, mosaic_type=None, masks=None):
+    """
+    Setting the pixels of every channel outside its mosaic to the mid value.
+    image is either an (H, W, 3) image or an (N, H, W, 3) batch of them.
+    """
     if mosaic_type is None or len(image.shape) == 2:
         return image
-    image = image.copy()
 
-    midvals = img_midvals(image)
     if masks is None:
         if mosaic_type == 'random':
             masks = random_filter_array(image)
         else:
-            masks_array = [
-                colour_filter_array(image, mosaic_type, colour_channel='red'),
-                colour_filter_array(image, mosaic_type, colour_channel='green'),
-                colour_filter_array(image, mosaic_type, colour_channel='blue')
-            ]
-            masks = np.zeros(
-                (*masks_array[0].shape, 3), dtype=np.uint8
-            )
-            for i in range(3):
-                masks[:, :, i] = masks_array[i].copy()
-    for i in range(3):
-        img_ch = image[:, :, i]
-        img_ch[masks[:, :, i] == 0] = midvals[i]
-        image[:, :, i] = img_ch
-    return image
+            masks = mosaic_masks(image.shape[-3:-1], mosaic_type)
+    if len(image.shape) == 4:
+        midvals = np.array([img_midvals(img) for img in image])
+        midvals = midvals[:, np.newaxis, np.newaxis, :]
+    else:
+        midvals = np.array(img_midvals(image))
+    midvals = midvals.astype(image.dtype)
+    if np.all(midvals == midvals.flat[0]):
+        # a scalar is much cheaper to broadcast
+        midvals = midvals.flat[0]
+    # the masks of the mosaic are broadcast to all images
+    return np.where(masks == 0, midvals, image)
 
 
 # TODO: add other shapes as well
@@ -470,6 +480,19 @@ def local_std(image, window_size=(5, 5)):
     return std_image, avg_image
 
 
+def local_contrast(images, window_sizes, axes=None):
+    """
+    The local RMS contrast (std / mean) of an image, a batch of images or a
+    tensor for every window size, stacked along a new first axis. All window
+    sizes share the row sums of tensors, see utils.local_statistics. Unlike
+    local_std, the windows are clipped at the borders and their std is
+    around their own mean.
+    """
+    return LocalStatistics(images, axes=axes).multi_window(
+        'contrast', window_sizes
+    )
+
+
 def get_colour_inds(vision_type):
     # FIXME: according to colour space
     colour_inds = None
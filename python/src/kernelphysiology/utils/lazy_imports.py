@@ -0,0 +1,59 @@
+"""
+Deferring the import of heavy (often optional) dependencies to their first
+use, so importing a module that might need them stays cheap.
+"""
+
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """A module that is imported on its first attribute access."""
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+class LazyAttribute(object):
+    """A function, class or object of a module, imported on first use."""
+
+    def __init__(self, module_name, attr):
+        self._module_name = module_name
+        self._attr = attr
+        self._value = None
+
+    def _load(self):
+        if self._value is None:
+            module = importlib.import_module(self._module_name)
+            self._value = getattr(module, self._attr)
+        return self._value
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    """Equivalent of "import name" (or "from package import name")."""
+    return LazyModule(name)
+
+
+def lazy_from(module_name, attr):
+    """Equivalent of "from module_name import attr"."""
+    return LazyAttribute(module_name, attr)
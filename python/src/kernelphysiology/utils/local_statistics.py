@@ -0,0 +1,205 @@
+"""
+Local mean, standard deviation and contrast of images over rectangular
+windows of any size, from the sums and the sums of squares of the windows.
+"""
+
+import sys
+
+import numpy as np
+
+import cv2
+
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+torch = lazy_import('torch')
+
+
+def _is_tensor(x):
+    # there can only be tensors if torch is already imported
+    return 'torch' in sys.modules and torch.is_tensor(x)
+
+
+def _pair(window_size):
+    if np.isscalar(window_size):
+        return int(window_size), int(window_size)
+    return tuple(int(size) for size in window_size)
+
+
+def _window_bounds(length, size):
+    """The start and end of the windows centred at every pixel, clipped."""
+    starts = np.arange(length) - size // 2
+    return np.clip(starts, 0, length), np.clip(starts + size, 0, length)
+
+
+def _cumulative_sums(x, pad, dim):
+    """
+    The cumulative sums of x along dim (-2 or -1), padded with pad zeros on
+    both sides and led by a zero.
+    """
+    padding = (pad + 1, pad, 0, 0) if dim == -1 else (0, 0, pad + 1, pad)
+    return torch.nn.functional.pad(x, padding).cumsum(dim)
+
+
+class LocalStatistics(object):
+    """
+    Local statistics of an image, or of a batch of images, over windows
+    centred at every pixel (as in cv2.filter2D). The windows are clipped at
+    the borders, the statistics are of the pixels inside the image. The
+    results have the shape of the images and are cached per window size,
+    the arrays are read-only and the tensors are copies.
+
+    Arrays are summed with cv2.boxFilter, whose running sums cost the same
+    for all window sizes. Tensors are summed on their device from cumulative
+    sums along the rows, built once for all window sizes, and then along the
+    columns of every window size. Separable sums keep the rounding errors
+    small, the std of windows of 1-3 pixels is within about 1e-7 of the
+    image range (1e-8 for arrays), larger windows are more accurate.
+
+    Args:
+        images: a numpy array or a torch tensor.
+        axes: the rows and columns axes of images, by default (0, 1) for
+         arrays (H, W[, C]) and (-2, -1) for tensors ([N, C,] H, W).
+    """
+
+    def __init__(self, images, axes=None):
+        self.is_tensor = _is_tensor(images)
+        if axes is None:
+            axes = (-2, -1) if self.is_tensor else (0, 1)
+        self.axes = tuple(axes)
+        if self.is_tensor:
+            images = images.double().movedim(self.axes, (-2, -1))
+            self.offset = images.mean(dim=(-2, -1), keepdim=True)
+        else:
+            images = np.moveaxis(
+                np.asarray(images, dtype=np.float64), self.axes, (-2, -1)
+            )
+            self.offset = images.mean(axis=(-2, -1), keepdims=True)
+        self.shape = images.shape[-2:]
+        # centred images keep E[x^2] - E[x]^2 accurate over large sums
+        if self.is_tensor:
+            self.images = (images - self.offset).contiguous()
+        else:
+            self.images = np.subtract(images, self.offset, order='C')
+        self.sq_images = self.images ** 2
+        self.pad = None
+        self._num_pixels = dict()
+        self._means = dict()
+        self._stds = dict()
+
+    def _pad_tables(self, window_sizes):
+        """Row sums padded for the widest of window_sizes."""
+        pad = max(size[1] // 2 for size in window_sizes)
+        if self.pad is not None and pad <= self.pad:
+            return
+        self.sum_table = _cumulative_sums(self.images, pad, -1)
+        self.sq_sum_table = _cumulative_sums(self.sq_images, pad, -1)
+        self.pad = pad
+
+    def _box_sums(self, squared, window_size):
+        rows, cols = self.shape
+        if not self.is_tensor:
+            images = self.sq_images if squared else self.images
+            sums = np.empty_like(images)
+            for image, image_sums in zip(
+                    images.reshape(-1, rows, cols),
+                    sums.reshape(-1, rows, cols)
+            ):
+                # zeros outside the image sum the clipped windows
+                cv2.boxFilter(
+                    image, -1, window_size[::-1], dst=image_sums,
+                    normalize=False, borderType=cv2.BORDER_CONSTANT
+                )
+            return sums
+
+        # zeros outside the image, the windows are differences of the sums
+        self._pad_tables([window_size])
+        table = self.sq_sum_table if squared else self.sum_table
+        c0 = self.pad - window_size[1] // 2
+        c1 = c0 + window_size[1]
+        sums = table[..., c1:c1 + cols] - table[..., c0:c0 + cols]
+        table = _cumulative_sums(sums, window_size[0] // 2, -2)
+        r1 = window_size[0]
+        return table[..., r1:r1 + rows, :] - table[..., :rows, :]
+
+    def _box_means(self, squared, window_size):
+        if window_size not in self._num_pixels:
+            r0, r1 = _window_bounds(self.shape[0], window_size[0])
+            c0, c1 = _window_bounds(self.shape[1], window_size[1])
+            num_pixels = np.outer(r1 - r0, c1 - c0).astype(np.float64)
+            if self.is_tensor:
+                num_pixels = torch.from_numpy(num_pixels).to(
+                    self.images.device
+                )
+            self._num_pixels[window_size] = num_pixels
+        means = self._box_sums(squared, window_size)
+        means /= self._num_pixels[window_size]
+        return means
+
+    def _output(self, x):
+        if self.is_tensor:
+            return x.movedim((-2, -1), self.axes)
+        return np.moveaxis(x, (-2, -1), self.axes)
+
+    def _mean(self, window_size):
+        if window_size not in self._means:
+            means = self._box_means(False, window_size)
+            means += self.offset
+            self._means[window_size] = self._cached(means)
+        return self._means[window_size]
+
+    def _std(self, window_size):
+        if window_size not in self._stds:
+            centred_mean = self._mean(window_size) - self.offset
+            variance = self._box_means(True, window_size)
+            variance -= centred_mean ** 2
+            # rounding errors can make uniform windows slightly negative
+            if self.is_tensor:
+                std = variance.clamp_(min=0).sqrt_()
+            else:
+                np.maximum(variance, 0, out=variance)
+                std = np.sqrt(variance, out=variance)
+            self._stds[window_size] = self._cached(std)
+        return self._stds[window_size]
+
+    def _cached(self, x):
+        if not self.is_tensor:
+            x.flags.writeable = False
+        return x
+
+    def _copy(self, x):
+        # cached arrays are read-only, tensors cannot be
+        return x.clone() if self.is_tensor else x
+
+    def mean(self, window_size):
+        return self._output(self._copy(self._mean(_pair(window_size))))
+
+    def std(self, window_size):
+        return self._output(self._copy(self._std(_pair(window_size))))
+
+    def contrast(self, window_size):
+        """The RMS contrast, std / mean, 0 where the mean is 0."""
+        window_size = _pair(window_size)
+        mean = self._mean(window_size)
+        std = self._std(window_size)
+        if self.is_tensor:
+            contrast = torch.where(
+                mean != 0, std / mean, torch.zeros_like(mean)
+            )
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                contrast = np.where(mean != 0, std / mean, 0)
+        return self._output(contrast)
+
+    def multi_window(self, statistic, window_sizes):
+        """
+        A statistic ('mean', 'std' or 'contrast') of all window sizes,
+        stacked along a new first axis.
+        """
+        window_sizes = [_pair(size) for size in window_sizes]
+        if self.is_tensor:
+            # one table for all window sizes
+            self._pad_tables(window_sizes)
+        outputs = [getattr(self, statistic)(size) for size in window_sizes]
+        if self.is_tensor:
+            return torch.stack(outputs)
+        return np.stack(outputs)
@@ -4,12 +4,17 @@ Utility functions for path, file and folder related.
 
 import os
 import pickle
-import glob
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 IMG_EXTENSIONS = [
     '.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', 'webp'
 ]
 
+MANIFEST_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'kernelphysiology', 'manifests'
+)
+
 
 def create_dir(dir_path):
     if not os.path.isdir(dir_path):
@@ -36,25 +41,163 @@ def write_pickle(out_file, data):
     pickle_out.close()
 
 
-def _read_extension(root, extension):
-    img_paths = []
-    img_paths.extend(
-        sorted(glob.glob(root + '/*' + extension))
-    )
-    # with upper case
-    img_paths.extend(
-        sorted(glob.glob(root + '/*' + extension.upper()))
-    )
-    return img_paths
+def _match_glob(names, extensions):
+    # same order as globbing each extension in lower and upper case
+    matched = []
+    for extension in extensions:
+        for case_extension in [extension, extension.upper()]:
+            matched.extend(sorted(
+                name for name in names if name.endswith(case_extension)
+            ))
+    return matched
+
+
+def _scan_dir(root, extensions, recursive=False, stats=False):
+    """
+    Lists the files of root with one os.scandir per directory. Without
+    recursion files are ordered as in image_in_folder, otherwise as in
+    torchvision's ImageFolder (case-insensitive, sorted by directory).
+    Returns the files and the modification time of every scanned directory.
+    """
+    files = []
+    dir_mtimes = dict()
+    to_scan = [root]
+    while len(to_scan) > 0:
+        current_dir = to_scan.pop()
+        dir_mtimes[current_dir] = os.stat(current_dir).st_mtime_ns
+        entries = dict()
+        with os.scandir(current_dir) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=True):
+                    if recursive:
+                        to_scan.append(entry.path)
+                elif not entry.name.startswith('.') or recursive:
+                    entries[entry.name] = entry
+        if recursive:
+            names = sorted(
+                name for name in entries.keys()
+                if name.lower().endswith(tuple(extensions))
+            )
+        else:
+            names = _match_glob(entries.keys(), extensions)
+        for name in names:
+            if stats:
+                stat = entries[name].stat()
+                files.append(
+                    (entries[name].path, stat.st_size, stat.st_mtime_ns)
+                )
+            else:
+                files.append((entries[name].path, None, None))
+    if recursive:
+        files = sorted(files, key=lambda x: os.path.dirname(x[0]))
+    return files, dir_mtimes
 
 
 def image_in_folder(root, extensions=None):
     if extensions is None:
         extensions = IMG_EXTENSIONS
 
-    img_paths = []
-    # reading all extensions
-    for extension in extensions:
-        img_paths.extend(_read_extension(root, extension))
+    img_paths, _ = _scan_dir(root, extensions)
+    return [path for path, _, _ in img_paths]
+
+
+class FolderIndex(object):
+    """
+    The image files of a folder (labelled=False) or of a folder with one
+    sub-folder per class (labelled=True), with their sizes and modification
+    times.
+    """
+
+    def __init__(self, classes, paths, labels, sizes, mtimes, dir_mtimes):
+        self.classes = classes
+        self.paths = paths
+        self.labels = labels
+        self.sizes = sizes
+        self.mtimes = mtimes
+        self.dir_mtimes = dir_mtimes
+
+    def is_valid(self):
+        # directory times change whenever entries are added or removed
+        for dir_path, mtime in self.dir_mtimes.items():
+            if not os.path.isdir(dir_path):
+                return False
+            if os.stat(dir_path).st_mtime_ns != mtime:
+                return False
+        return True
+
+    def __len__(self):
+        return len(self.paths)
+
+
+def _manifest_path(manifest_dir, root, extensions, labelled, recursive):
+    key = '%s_%s_%s_%s' % (
+        os.path.abspath(root), ','.join(extensions), labelled, recursive
+    )
+    return os.path.join(
+        manifest_dir, hashlib.md5(key.encode()).hexdigest() + '.pickle'
+    )
+
 
-    return img_paths
+def index_image_folder(root, extensions=None, labelled=True, recursive=False,
+                       num_workers=8, manifest_dir=MANIFEST_DIR):
+    """
+    Scans the image files of a folder, sub-folders in parallel threads. The
+    index is stored as a manifest in manifest_dir and reused as long as none
+    of the scanned directories has changed, None disables the manifest.
+    """
+    if extensions is None:
+        extensions = IMG_EXTENSIONS
+    extensions = list(extensions)
+
+    manifest_file = None
+    if manifest_dir is not None:
+        manifest_file = _manifest_path(
+            manifest_dir, root, extensions, labelled, recursive
+        )
+        if os.path.isfile(manifest_file):
+            try:
+                index = read_pickle(manifest_file)
+                if index.is_valid():
+                    return index
+            except (pickle.UnpicklingError, EOFError, AttributeError):
+                pass
+
+    dir_mtimes = dict()
+    if labelled:
+        dir_mtimes[root] = os.stat(root).st_mtime_ns
+        with os.scandir(root) as it:
+            classes = sorted(
+                entry.name for entry in it
+                if entry.is_dir() and (recursive or entry.name[0] != '.')
+            )
+        sub_folders = [os.path.join(root, c) for c in classes]
+    else:
+        classes = []
+        sub_folders = [root]
+
+    with ThreadPoolExecutor(max(1, num_workers)) as executor:
+        scans = list(executor.map(
+            lambda x: _scan_dir(x, extensions, recursive, stats=True),
+            sub_folders
+        ))
+
+    paths, labels, sizes, mtimes = [], [], [], []
+    for target_id, (files, sub_mtimes) in enumerate(scans):
+        dir_mtimes.update(sub_mtimes)
+        for path, size, mtime in files:
+            paths.append(path)
+            labels.append(target_id)
+            sizes.append(size)
+            mtimes.append(mtime)
+    index = FolderIndex(classes, paths, labels, sizes, mtimes, dir_mtimes)
+
+    if manifest_file is not None:
+        try:
+            os.makedirs(manifest_dir, exist_ok=True)
+            # writing atomically, other jobs might read the same manifest
+            tmp_file = '%s.%d.tmp' % (manifest_file, os.getpid())
+            write_pickle(tmp_file, index)
+            os.replace(tmp_file, manifest_file)
+        except OSError as e:
+            print('Could not write the manifest %s: %s' % (manifest_file, e))
+    return index
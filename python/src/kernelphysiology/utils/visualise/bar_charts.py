@@ -3,10 +3,12 @@ Wrappers around different libraries to plot beautiful bar charts!
 """
 
 import numpy as np
-from matplotlib import pyplot as plt
 
+from kernelphysiology.utils.lazy_imports import lazy_import
 from kernelphysiology.utils.visualise.colour_world import default_colours
 
+plt = lazy_import('matplotlib.pyplot')
+
 
 def plot_list_data(list_data, figsize=(12, 4), width=0.2,
                    colours=None, lines=None,
@@ -4,7 +4,10 @@ The world of colours!
 
 import sys
 import numpy as np
-from matplotlib import pyplot as plt
+
+from kernelphysiology.utils.lazy_imports import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
 
 
 def _get_cmap(n, name='gist_rainbow'):
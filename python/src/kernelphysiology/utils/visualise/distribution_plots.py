@@ -4,12 +4,12 @@ Wrapper to plot distribution in beautiful formats!
 
 import numpy as np
 
-from matplotlib import pyplot as plt
-from matplotlib import ticker
-from mpl_toolkits.mplot3d import axes3d
-
+from kernelphysiology.utils.lazy_imports import lazy_import
 from kernelphysiology.utils.matutils import find_nearest_ind
 
+plt = lazy_import('matplotlib.pyplot')
+ticker = lazy_import('matplotlib.ticker')
+
 
 def plot_violinplot(list_data, figsize=(6, 4), baseline=None,
                     face_colours=None, edge_colours=None,
@@ -200,6 +200,9 @@ def plot_wireframe3d(list_data, figsize=(8, 8), num_samples=10,
                      zlabel=None,
                      legend=None, loc='best',
                      save_name=None):
+    # registers the 3d projection
+    from mpl_toolkits.mplot3d import axes3d
+
     fig = plt.figure(figsize=figsize)
     ax = fig.add_subplot(1, 1, 1, projection='3d')
 